@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Benchmark comparing the regex action protocol with the tool-call action protocol.
+
+Runs the SWE-bench batch runner on the `_test` dataset with `swebench.yaml` (actions in ```bash blocks)
+and `swebench_tool_call.yaml` (native tool calling), then compares the format error rate
+(format errors per model call) and the total number of tokens.
+Needs docker and an API key for the model.
+
+Usage: python benchmarks/bench_action_protocol.py <model_name> [output_dir] [workers]
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MSWEA_SILENT_STARTUP", "1")
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.run.extra.swebench import main as run_swebench
+
+CONFIGS = {
+    "regex": builtin_config_dir / "extra" / "swebench.yaml",
+    "tool_call": builtin_config_dir / "extra" / "swebench_tool_call.yaml",
+}
+
+
+def summarize(output_dir: Path) -> dict:
+    stats = [json.loads(path.read_text())["info"]["model_stats"] for path in output_dir.glob("*/*.traj.json")]
+    n_calls = sum(s["api_calls"] for s in stats)
+    return {
+        "instances": len(stats),
+        "api_calls": n_calls,
+        "format_errors": sum(s.get("n_format_errors", 0) for s in stats),
+        "format_error_rate": sum(s.get("n_format_errors", 0) for s in stats) / max(n_calls, 1),
+        "total_tokens": sum(s.get("prompt_tokens", 0) + s.get("completion_tokens", 0) for s in stats),
+        "cost": sum(s["instance_cost"] for s in stats),
+    }
+
+
+def main(model_name: str, output_dir: str = "bench_action_protocol", workers: str = "4") -> None:
+    results = {}
+    for protocol, config in CONFIGS.items():
+        output = Path(output_dir) / protocol
+        run_swebench(
+            subset="_test",
+            split="test",
+            slice_spec="",
+            filter_spec="",
+            shuffle=False,
+            output=str(output),
+            workers=int(workers),
+            model=model_name,
+            model_class=None,
+            redo_existing=False,
+            config_spec=config,
+            environment_class=None,
+            async_mode=False,
+            resume=False,
+            stream_traj=False,
+            min_workers=0,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            retry_failed=False,
+            queue="",
+        )
+        results[protocol] = summarize(output)
+    print(f"{'':20}" + "".join(f"{protocol:>12}" for protocol in results))
+    for key in results["regex"]:
+        print(f"{key:20}" + "".join(f"{result[key]:12.4g}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
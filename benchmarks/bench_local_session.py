@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Latency benchmark for `LocalEnvironment.execute` with a new shell per command and with a shell session.
+
+Runs `n_commands` trivial commands in both modes (after one warm-up command, so that starting the session
+is not counted) and reports the mean and percentiles of the latency per command.
+
+Usage: python benchmarks/bench_local_session.py [n_commands]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MSWEA_SILENT_STARTUP", "1")
+
+from minisweagent.environments.local import LocalEnvironment
+
+
+def measure(env: LocalEnvironment, n_commands: int) -> list[float]:
+    assert env.execute("echo warmup") == {"output": "warmup\n", "returncode": 0}
+    latencies = []
+    for i in range(n_commands):
+        start = time.perf_counter()
+        result = env.execute(f"echo {i}")
+        latencies.append(time.perf_counter() - start)
+        assert result == {"output": f"{i}\n", "returncode": 0}, result
+    return latencies
+
+
+def main(n_commands: int = 1000) -> None:
+    results = {}
+    for name, session in [("subprocess", False), ("session", True)]:
+        env = LocalEnvironment(session=session)
+        try:
+            results[name] = measure(env, n_commands)
+        finally:
+            env.cleanup()
+    for name, latencies in results.items():
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"{name:10s}: {sum(latencies):6.2f}s total, mean {statistics.mean(latencies) * 1e3:6.2f} ms, "
+            f"p50 {percentiles[49] * 1e3:6.2f} ms, p99 {percentiles[98] * 1e3:6.2f} ms"
+        )
+    print(f"speedup:    {sum(results['subprocess']) / sum(results['session']):6.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
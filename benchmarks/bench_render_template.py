@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""Microbenchmark for the per-step template rendering overhead of `DefaultAgent`.
+
+Compares the uncached rendering (parse template + rebuild all template vars on every call)
+with `DefaultAgent.render_template` (compiled template registry + cached static vars).
+
+Usage: python benchmarks/bench_render_template.py [n_steps]
+"""
+
+import os
+import sys
+import timeit
+
+os.environ.setdefault("MSWEA_SILENT_STARTUP", "1")
+
+import yaml
+from jinja2 import StrictUndefined, Template
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+
+OUTPUT = {"output": "x" * 20_000, "returncode": 0}
+
+
+def render_uncached(agent: DefaultAgent, template: str, **kwargs) -> str:
+    template_vars = agent.config.model_dump() | agent.env.get_template_vars() | agent.model.get_template_vars()
+    return Template(template, undefined=StrictUndefined).render(**kwargs, **template_vars, **agent.extra_template_vars)
+
+
+def main(n_steps: int = 1000) -> None:
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())["agent"]
+    agent = DefaultAgent(DeterministicModel(outputs=[]), LocalEnvironment(), **config)
+    agent.extra_template_vars |= {"task": "Fix the bug"}
+    template = agent.config.action_observation_template
+    assert render_uncached(agent, template, output=OUTPUT) == agent.render_template(template, output=OUTPUT)
+    before = timeit.timeit(lambda: render_uncached(agent, template, output=OUTPUT), number=n_steps) / n_steps
+    after = timeit.timeit(lambda: agent.render_template(template, output=OUTPUT), number=n_steps) / n_steps
+    print(f"uncached: {before * 1e6:8.1f} us/step")
+    print(f"cached:   {after * 1e6:8.1f} us/step")
+    print(f"speedup:  {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -60,6 +60,18 @@ class Environment(Protocol):
     def get_template_vars(self) -> dict[str, Any]: ...
 
 
+class AsyncModel(Model, Protocol):
+    """Protocol for language models that can be queried from an event loop."""
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict: ...
+
+
+class AsyncEnvironment(Environment, Protocol):
+    """Protocol for execution environments that can execute commands from an event loop."""
+
+    async def aexecute(self, command: str, cwd: str = "") -> dict[str, str]: ...
+
+
 class Agent(Protocol):
     """Protocol for agents."""
 
@@ -75,6 +87,8 @@ __all__ = [
     "Agent",
     "Model",
     "Environment",
+    "AsyncModel",
+    "AsyncEnvironment",
     "package_dir",
     "__version__",
     "global_config_file",
@@ -0,0 +1,56 @@
+"""Async version of the default agent, so that many agents can share one event loop.
+
+The control flow is the same as for `DefaultAgent` (and shares all of its non-I/O logic), but `run`, `continue_run`,
+`step`, `query`, `get_observation` and `execute_action` are coroutines.
+Models and environments are queried with `aquery`/`aexecute` if they implement them
+(see `AsyncModel` and `AsyncEnvironment`), otherwise `query`/`execute` are run in a worker thread.
+"""
+
+import asyncio
+
+from minisweagent.agents.default import DefaultAgent, NonTerminatingException, TerminatingException
+
+
+class AsyncDefaultAgent(DefaultAgent):
+    async def run(self, task: str, **kwargs) -> tuple[str, str]:  # type: ignore[override]
+        """Run step() until agent is finished. Return exit status & message"""
+        self.start_run(task, **kwargs)
+        return await self.continue_run()
+
+    async def continue_run(self) -> tuple[str, str]:  # type: ignore[override]
+        """Run step() until agent is finished, starting from the current messages (e.g., restored from a checkpoint)."""
+        while True:
+            try:
+                await self.step()
+            except (NonTerminatingException, TerminatingException) as e:
+                if (outcome := self.handle_exception(e)) is not None:
+                    return outcome
+
+    async def step(self) -> dict:  # type: ignore[override]
+        """Query the LM, execute the action, return the observation."""
+        with self.timer.step():
+            return await self.get_observation(await self.query())
+
+    async def query(self) -> dict:  # type: ignore[override]
+        """Query the model and return the response."""
+        messages = self.prepare_query()
+        with self.query_context():
+            if hasattr(self.model, "aquery"):
+                response = await self.model.aquery(messages, **self.get_query_kwargs())
+            else:
+                response = await asyncio.to_thread(self.model.query, messages, **self.get_query_kwargs())
+        return self.add_response(response)
+
+    async def get_observation(self, response: dict) -> dict:  # type: ignore[override]
+        """Execute the action and return the observation."""
+        output = await self.execute_action(self.parse_action(response))
+        self.add_action_observation(output)
+        return output
+
+    async def execute_action(self, action: dict) -> dict:  # type: ignore[override]
+        with self.execution_context(action):
+            if hasattr(self.env, "aexecute"):
+                output = await self.env.aexecute(action["action"])
+            else:
+                output = await asyncio.to_thread(self.env.execute, action["action"])
+        return self.check_output(output, action)
@@ -1,13 +1,21 @@
 """Basic agent class. See https://mini-swe-agent.com/latest/advanced/control_flow/ for visual explanation."""
 
+import contextlib
+import copy
+import functools
 import re
 import subprocess
 import time
+from collections.abc import Iterator
+from typing import Any, Literal
 
 from jinja2 import StrictUndefined, Template
 from pydantic import BaseModel
 
 from minisweagent import Environment, Model
+from minisweagent.agents.utils.compaction import CompactionConfig, Compactor
+from minisweagent.agents.utils.timings import StepTimer
+from minisweagent.agents.utils.tool_calls import BASH_TOOL, get_bash_commands
 
 
 class AgentConfig(BaseModel):
@@ -18,8 +26,14 @@ class AgentConfig(BaseModel):
     format_error_template: str
     action_observation_template: str
     action_regex: str = r"```bash\s*\n(.*?)\n```"
+    action_protocol: Literal["regex", "tool_call"] = "regex"
+    """How the action is passed: `regex` parses it from the text with `action_regex`,
+    `tool_call` uses the native tool calling of the model (with a single `bash` tool).
+    """
     step_limit: int = 0
     cost_limit: float = 3.0
+    compaction: CompactionConfig = CompactionConfig()
+    """Policies to compact the history that is sent to the model. The full history is kept in `messages`."""
 
 
 class NonTerminatingException(Exception):
@@ -46,6 +60,12 @@ class LimitsExceeded(TerminatingException):
     """Raised when the agent has reached its cost or step limit."""
 
 
+@functools.lru_cache(maxsize=256)
+def get_template(source: str) -> Template:
+    """Compile a jinja template once per process. Shared by all agents (and threads)."""
+    return Template(source, undefined=StrictUndefined)
+
+
 class DefaultAgent:
     def __init__(self, model: Model, env: Environment, *, config_class: type = AgentConfig, **kwargs):
         self.config = config_class(**kwargs)
@@ -53,65 +73,149 @@ class DefaultAgent:
         self.model = model
         self.env = env
         self.extra_template_vars = {}
+        self._static_template_vars: tuple[Any, dict] | None = None
+        self.compactor = Compactor(self.config.compaction)
+        self.timer = StepTimer()
+        self.trajectory_writer: Any = None
+        """If set, every message is also passed to `trajectory_writer.add_message` (e.g., to stream it to disk)."""
+
+    def get_static_template_vars(self) -> dict[str, Any]:
+        """Template vars from the agent and environment config. Only rebuilt when either config changes."""
+        key = (self.config, getattr(self.env, "config", None))
+        if self._static_template_vars is None or self._static_template_vars[0] != key:
+            self._static_template_vars = (
+                copy.deepcopy(key),
+                self.config.model_dump() | self.env.get_template_vars(),
+            )
+        return self._static_template_vars[1]
 
     def render_template(self, template: str, **kwargs) -> str:
-        template_vars = self.config.model_dump() | self.env.get_template_vars() | self.model.get_template_vars()
-        return Template(template, undefined=StrictUndefined).render(
-            **kwargs, **template_vars, **self.extra_template_vars
-        )
+        with self.timer.phase("render"):
+            template_vars = self.get_static_template_vars() | self.model.get_template_vars()
+            return get_template(template).render(**kwargs, **template_vars, **self.extra_template_vars)
 
     def add_message(self, role: str, content: str, **kwargs):
-        self.messages.append({"role": role, "content": content, "timestamp": time.time(), **kwargs})
+        message = {"role": role, "content": content, "timestamp": time.time(), **kwargs}
+        self.messages.append(message)
+        if self.trajectory_writer is not None:
+            self.trajectory_writer.add_message(message)
+
+    def add_observation(self, content: str):
+        """Add a response to the last assistant message. Tool calls need a `tool` message per call."""
+        if self.messages and self.messages[-1]["role"] == "assistant" and self.messages[-1].get("tool_calls"):
+            for tool_call in self.messages[-1]["tool_calls"]:
+                self.add_message("tool", content, tool_call_id=tool_call["id"])
+        else:
+            self.add_message("user", content)
+
+    def get_query_kwargs(self) -> dict[str, Any]:
+        """Extra arguments for `model.query`."""
+        return {"tools": [BASH_TOOL]} if self.config.action_protocol == "tool_call" else {}
 
     def run(self, task: str, **kwargs) -> tuple[str, str]:
         """Run step() until agent is finished. Return exit status & message"""
+        self.start_run(task, **kwargs)
+        return self.continue_run()
+
+    def start_run(self, task: str, **kwargs):
+        """Reset the agent and add the system and instance messages."""
         self.extra_template_vars |= {"task": task, **kwargs}
         self.messages = []
+        self.compactor = Compactor(self.config.compaction)
+        self.timer = StepTimer()
         self.add_message("system", self.render_template(self.config.system_template))
         self.add_message("user", self.render_template(self.config.instance_template))
+
+    def continue_run(self) -> tuple[str, str]:
+        """Run step() until agent is finished, starting from the current messages (e.g., restored from a checkpoint)."""
         while True:
             try:
                 self.step()
-            except NonTerminatingException as e:
-                self.add_message("user", str(e))
-            except TerminatingException as e:
-                self.add_message("user", str(e))
-                return type(e).__name__, str(e)
+            except (NonTerminatingException, TerminatingException) as e:
+                if (outcome := self.handle_exception(e)) is not None:
+                    return outcome
+
+    def handle_exception(self, e: NonTerminatingException | TerminatingException) -> tuple[str, str] | None:
+        """Pass the exception on to the LM. Returns exit status & message if it terminates the agent."""
+        self.add_observation(str(e))
+        if isinstance(e, TerminatingException):
+            return type(e).__name__, str(e)
+        return None
 
     def step(self) -> dict:
         """Query the LM, execute the action, return the observation."""
-        return self.get_observation(self.query())
+        with self.timer.step():
+            return self.get_observation(self.query())
 
     def query(self) -> dict:
         """Query the model and return the response."""
+        messages = self.prepare_query()
+        with self.query_context():
+            response = self.model.query(messages, **self.get_query_kwargs())
+        return self.add_response(response)
+
+    def prepare_query(self) -> list[dict]:
+        """Check the limits and return the (compacted) messages to query the model with.
+        The cost of compacting them (e.g., of a summary model) is added to the cost of the model.
+        """
         if 0 < self.config.step_limit <= self.model.n_calls or 0 < self.config.cost_limit <= self.model.cost:
             raise LimitsExceeded()
-        response = self.model.query(self.messages)
+        cost = self.compactor.cost
+        messages = self.compactor.compact(self.messages)
+        self.model.cost += self.compactor.cost - cost  # the summary model counts towards the cost of the agent
+        return messages
+
+    @contextlib.contextmanager
+    def query_context(self) -> Iterator[None]:
+        """Time the query of the model (and how long it waited for retries)."""
+        retry_wait_time = getattr(self.model, "retry_wait_time", 0.0)
+        with self.timer.phase("query"):
+            yield
+        self.timer.add("retry_wait", getattr(self.model, "retry_wait_time", 0.0) - retry_wait_time)
+
+    def add_response(self, response: dict) -> dict:
+        self.timer.add_usage(response)
         self.add_message("assistant", **response)
         return response
 
     def get_observation(self, response: dict) -> dict:
         """Execute the action and return the observation."""
         output = self.execute_action(self.parse_action(response))
-        observation = self.render_template(self.config.action_observation_template, output=output)
-        self.add_message("user", observation)
+        self.add_action_observation(output)
         return output
 
+    def add_action_observation(self, output: dict):
+        self.add_observation(self.render_template(self.config.action_observation_template, output=output))
+
     def parse_action(self, response: dict) -> dict:
         """Parse the action from the message. Returns the action."""
-        actions = re.findall(self.config.action_regex, response["content"], re.DOTALL)
+        if self.config.action_protocol == "tool_call":
+            actions = get_bash_commands(response.get("tool_calls") or [])
+        else:
+            actions = re.findall(self.config.action_regex, response["content"], re.DOTALL)
         if len(actions) == 1:
             return {"action": actions[0].strip(), **response}
         raise FormatError(self.render_template(self.config.format_error_template, actions=actions))
 
     def execute_action(self, action: dict) -> dict:
-        try:
+        with self.execution_context(action):
             output = self.env.execute(action["action"])
+        return self.check_output(output, action)
+
+    @contextlib.contextmanager
+    def execution_context(self, action: dict) -> Iterator[None]:
+        """Time the execution of the action and raise timeouts as `ExecutionTimeoutError`."""
+        try:
+            with self.timer.phase("execute"):
+                yield
         except (TimeoutError, subprocess.TimeoutExpired) as e:
             output = e.output.decode("utf-8", errors="replace") if getattr(e, "output", None) else ""  # type: ignore[union-attr]
             raise ExecutionTimeoutError(
                 self.render_template(self.config.timeout_template, action=action, output=output)
             )
+
+    def check_output(self, output: dict, action: dict) -> dict:
+        """Raise `Submitted` if the agent has finished, else return the output with the action."""
         self.has_finished(output)
         return output | {"action": action["action"]}
 
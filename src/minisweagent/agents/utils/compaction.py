@@ -0,0 +1,195 @@
+"""History compaction: shrink the messages that are sent to the model for long trajectories.
+
+Compaction only ever changes the messages that are sent to the model, the full history
+(`agent.messages`) is left untouched and saved with the trajectory.
+
+To keep the prompt cache-friendly, the compacted part of the history is frozen: once a span of messages
+has been compacted, it is never changed again, and new messages are appended verbatim until the
+next compaction is triggered.
+"""
+
+import importlib
+import logging
+import re
+from typing import Any, Literal
+
+from jinja2 import StrictUndefined, Template
+from pydantic import BaseModel
+
+from minisweagent.agents.utils.tool_calls import get_bash_commands
+from minisweagent.models import get_model
+
+logger = logging.getLogger("compaction")
+
+
+class CompactionPolicyConfig(BaseModel):
+    policy: Literal["elide_observations", "summarize", "drop_superseded_views"] | str
+    """Name of the policy or import path of a policy class."""
+    trigger_tokens: int = 50_000
+    """Only apply this policy once the (estimated) prompt exceeds this many tokens."""
+    min_chars: int = 500
+    """elide_observations: Only elide observations that are longer than this."""
+    stub_template: str = "[Output of this step elided to save context ({{n_chars}} characters).]"
+    """elide_observations/drop_superseded_views: Replacement for the compacted observations."""
+    view_regex: str = (
+        r"^\s*(?:cat|nl\s+-ba|head(?:\s+-n\s*\d+)?|tail(?:\s+-n\s*\d+)?|sed\s+-n\s+\S+)\s+([^\s|;&>]+)\s*$"
+    )
+    """drop_superseded_views: Regex matching a command that views a file. The first group is the file name."""
+    action_regex: str = r"```bash\s*\n(.*?)\n```"
+    """drop_superseded_views: Regex to extract the action from assistant messages (without tool calls)."""
+    summary_model: dict[str, Any] = {}
+    """summarize: Config of the (cheap) model used for summarizing (passed to `get_model`)."""
+    summary_template: str = (
+        "Summarize the following steps of a software engineering agent. "
+        "Keep all file names, findings, edits and open questions, but be concise.\n\n"
+        "{% for message in messages %}<{{message.role}}>\n{{message.content or ''}}\n"
+        "{% for call in message.get('tool_calls') or [] %}{{call.function.arguments}}\n{% endfor %}"
+        "</{{message.role}}>\n{% endfor %}"
+    )
+    """summarize: Prompt for the summary model."""
+    summary_message_template: str = "<summary_of_previous_steps>\n{{summary}}\n</summary_of_previous_steps>"
+    """summarize: Message that replaces the summarized span."""
+
+
+class CompactionConfig(BaseModel):
+    policies: list[CompactionPolicyConfig] = []
+    """Policies are applied in order to each span of messages that is compacted."""
+    keep_first: int = 2
+    """Never compact the first messages (system prompt and task)."""
+    keep_last: int = 10
+    """Never compact the most recent messages (the boundaries of the compacted spans are moved so that an assistant
+    message with tool calls is never separated from its tool messages)."""
+    min_span: int = 10
+    """Only compact once at least this many new messages can be compacted (keeps the prefix stable in between)."""
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough token estimate (4 characters per token) that doesn't depend on the model's tokenizer."""
+    return sum(len(str(message["content"])) for message in messages) // 4
+
+
+def _render(template: str, **kwargs) -> str:
+    return Template(template, undefined=StrictUndefined).render(**kwargs)
+
+
+class ElideObservationsPolicy:
+    """Replace long observations by a short stub."""
+
+    def __init__(self, config: CompactionPolicyConfig):
+        self.config = config
+
+    def compact(self, span: list[dict], rest: list[dict]) -> list[dict]:
+        return [
+            message | {"content": _render(self.config.stub_template, n_chars=len(message["content"]))}
+            if message["role"] in ("user", "tool") and len(message["content"]) > self.config.min_chars
+            else message
+            for message in span
+        ]
+
+
+class DropSupersededViewsPolicy:
+    """Replace the output of commands that view a file by a stub if the same file is viewed again later."""
+
+    def __init__(self, config: CompactionPolicyConfig):
+        self.config = config
+
+    def _viewed_file(self, message: dict) -> str | None:
+        if message["role"] != "assistant":
+            return None
+        if message.get("tool_calls"):
+            actions = get_bash_commands(message["tool_calls"])
+        else:
+            actions = re.findall(self.config.action_regex, message["content"] or "", re.DOTALL)
+        if len(actions) == 1 and (match := re.match(self.config.view_regex, actions[0].strip())):
+            return match.group(1)
+        return None
+
+    def compact(self, span: list[dict], rest: list[dict]) -> list[dict]:
+        viewed = [self._viewed_file(message) for message in span + rest]
+        result = list(span)
+        for i in range(len(span) - 1):
+            if not viewed[i] or viewed[i] not in viewed[i + 1 :]:
+                continue
+            # The observation is the next user message, or the tool messages that answer the tool calls
+            j = i + 1
+            while j < len(span) and (span[j]["role"] == "tool" or (j == i + 1 and span[j]["role"] == "user")):
+                stub = _render(self.config.stub_template, n_chars=len(span[j]["content"]))
+                result[j] = span[j] | {"content": stub}
+                j += 1
+        return result
+
+
+class SummarizePolicy:
+    """Replace the span by a summary written by a (cheap) model."""
+
+    def __init__(self, config: CompactionPolicyConfig):
+        self.config = config
+        self.model = get_model(config=config.summary_model)
+
+    def compact(self, span: list[dict], rest: list[dict]) -> list[dict]:
+        prompt = _render(self.config.summary_template, messages=span)
+        summary = self.model.query([{"role": "user", "content": prompt}])["content"]
+        return [{"role": "user", "content": _render(self.config.summary_message_template, summary=summary)}]
+
+    @property
+    def cost(self) -> float:
+        return self.model.cost
+
+
+_POLICY_MAPPING = {
+    "elide_observations": ElideObservationsPolicy,
+    "drop_superseded_views": DropSupersededViewsPolicy,
+    "summarize": SummarizePolicy,
+}
+
+
+def get_policy(config: CompactionPolicyConfig):
+    if (policy_class := _POLICY_MAPPING.get(config.policy)) is None:
+        module_name, class_name = config.policy.rsplit(".", 1)
+        policy_class = getattr(importlib.import_module(module_name), class_name)
+    return policy_class(config)
+
+
+class Compactor:
+    def __init__(self, config: CompactionConfig):
+        self.config = config
+        self.policies = [get_policy(policy_config) for policy_config in config.policies]
+        self._prefix: list[dict] = []
+        """Compacted version of the first `_watermark` messages."""
+        self._watermark = 0
+        self.stats = {"n_compactions": 0, "n_queries": 0, "tokens_sent": 0, "tokens_saved": 0}
+
+    @property
+    def cost(self) -> float:
+        """Total cost of the policies so far (of policies with a `cost`, e.g., the summary model of `summarize`)."""
+        return sum(getattr(policy, "cost", 0.0) for policy in self.policies)
+
+    def compact(self, messages: list[dict]) -> list[dict]:
+        """Return the messages to send to the model."""
+        if not self.policies:
+            return messages
+        if not self._prefix:
+            self._watermark = self.config.keep_first
+            while self._watermark < len(messages) and messages[self._watermark]["role"] == "tool":
+                self._watermark += 1
+            self._prefix = messages[: self._watermark]
+        compacted = self._prefix + messages[self._watermark :]
+        n_tokens = estimate_tokens(compacted)
+        end = len(messages) - self.config.keep_last
+        while self._watermark < end < len(messages) and messages[end]["role"] == "tool":
+            end -= 1  # keep the tool calls together with their tool messages
+        triggered = [policy for policy in self.policies if n_tokens > policy.config.trigger_tokens]
+        if triggered and end - self._watermark >= self.config.min_span:
+            span = messages[self._watermark : end]
+            for policy in triggered:
+                span = policy.compact(span, messages[end:])
+            self._prefix += span
+            self._watermark = end
+            compacted = self._prefix + messages[end:]
+            self.stats["n_compactions"] += 1
+            logger.info(f"Compacted history from ~{n_tokens} to ~{estimate_tokens(compacted)} tokens")
+        n_sent = estimate_tokens(compacted)
+        self.stats["n_queries"] += 1
+        self.stats["tokens_sent"] += n_sent
+        self.stats["tokens_saved"] += estimate_tokens(messages) - n_sent
+        return compacted
@@ -0,0 +1,76 @@
+"""Per-step latency breakdown and token usage, to see where the time of a run goes."""
+
+import contextlib
+import time
+from collections.abc import Iterator
+
+PHASES = ("query", "retry_wait", "execute", "render")
+"""Seconds spent per step in `model.query` (including retries), waiting between retries and for rate limit capacity
+(only known for models that report `retry_wait_time`), in `env.execute`, and rendering templates."""
+TOKENS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+
+def get_token_usage(response: dict) -> dict[str, int]:
+    """Token usage as reported by the provider in `extra.response.usage` (zero if not reported)."""
+    usage = (response.get("extra") or {}).get("response", {}).get("usage") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+    }
+
+
+class StepTimer:
+    def __init__(self):
+        self.timings: list[dict] = []
+        """One entry per step with the time per phase, the token usage and the exception that ended the step."""
+        self._current: dict | None = None
+
+    @contextlib.contextmanager
+    def step(self) -> Iterator[dict]:
+        entry = {
+            "step": len(self.timings) + 1,
+            "start": time.time(),
+            **dict.fromkeys(PHASES, 0.0),
+            **dict.fromkeys(TOKENS, 0),
+            "exception": None,
+        }
+        self.timings.append(entry)
+        self._current = entry
+        start = time.perf_counter()
+        try:
+            yield entry
+        except Exception as e:
+            entry["exception"] = type(e).__name__
+            raise
+        finally:
+            entry["total"] = time.perf_counter() - start
+            self._current = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, key: str, value: float) -> None:
+        """Add to the current step. Ignored outside of a step."""
+        if self._current is not None:
+            self._current[key] += value
+
+    def add_usage(self, response: dict) -> None:
+        for key, value in get_token_usage(response).items():
+            self.add(key, value)
+
+    def summary(self) -> dict:
+        """Totals over all steps."""
+        return {
+            "step_time": sum(entry["total"] for entry in self.timings),
+            **{f"{phase}_time": sum(entry[phase] for entry in self.timings) for phase in PHASES},
+            "format_error_time": sum(entry["total"] for entry in self.timings if entry["exception"] == "FormatError"),
+            "n_format_errors": sum(entry["exception"] == "FormatError" for entry in self.timings),
+            "n_execution_timeouts": sum(entry["exception"] == "ExecutionTimeoutError" for entry in self.timings),
+            **{token: sum(entry[token] for entry in self.timings) for token in TOKENS},
+        }
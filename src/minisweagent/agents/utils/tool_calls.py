@@ -0,0 +1,35 @@
+"""Action protocol based on the native tool calling of the model (instead of parsing actions from the text).
+
+The model is given a single `bash` tool. Observations are returned as `tool` messages.
+"""
+
+import json
+
+BASH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "bash",
+        "description": "Execute a bash command. Every command runs in a new subshell.",
+        "parameters": {
+            "type": "object",
+            "properties": {"command": {"type": "string", "description": "The bash command to execute."}},
+            "required": ["command"],
+        },
+    },
+}
+
+
+def get_bash_commands(tool_calls: list[dict]) -> list[str]:
+    """Commands of all valid calls of the bash tool. Calls to unknown tools or with malformed arguments are skipped."""
+    commands = []
+    for call in tool_calls:
+        function = call.get("function") or {}
+        if function.get("name") != BASH_TOOL["function"]["name"]:
+            continue
+        try:
+            command = json.loads(function.get("arguments") or "{}")["command"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+        if isinstance(command, str):
+            commands.append(command)
+    return commands
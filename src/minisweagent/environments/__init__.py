@@ -7,6 +7,7 @@ from minisweagent import Environment
 
 _ENVIRONMENT_MAPPING = {
     "docker": "minisweagent.environments.docker.DockerEnvironment",
+    "docker_api": "minisweagent.environments.docker_api.DockerAPIEnvironment",
     "podman": "minisweagent.environments.podman.PodmanEnvironment",
     "singularity": "minisweagent.environments.singularity.SingularityEnvironment",
     "local": "minisweagent.environments.local.LocalEnvironment",
@@ -1,3 +1,5 @@
+import asyncio
+import copy
 import logging
 import os
 import shlex
@@ -7,6 +9,9 @@ from typing import Any
 
 from pydantic import BaseModel
 
+from minisweagent.environments.utils.output_capture import arun_with_output_limit, run_with_output_limit
+from minisweagent.environments.utils.shell_session import ShellSession
+
 
 class DockerEnvironmentConfig(BaseModel):
     image: str
@@ -21,6 +26,10 @@ class DockerEnvironmentConfig(BaseModel):
     """
     timeout: int = 30
     """Timeout for executing commands in the container."""
+    output_limit: int = 0
+    """If > 0, stream the output and only keep its first and last `output_limit // 2` characters,
+    reporting the rest as `elided_chars`. Bounds memory per command by `output_limit` instead of the output size.
+    """
     executable: str = os.getenv("MSWEA_DOCKER_EXECUTABLE", "docker")
     """Path to the docker/container executable."""
     run_args: list[str] = ["--rm"]
@@ -31,6 +40,10 @@ class DockerEnvironmentConfig(BaseModel):
     """Max duration to keep container running. Uses the same format as the sleep command."""
     pull_timeout: int = 600
     """Timeout in seconds for pulling images."""
+    session: bool = False
+    """Run all commands in one long-lived `docker exec -i ... bash -l` per container instead of a new `docker exec`
+    per command (see `ShellSession`). Every command still runs in a new subshell.
+    """
 
 
 class DockerEnvironment:
@@ -47,6 +60,9 @@ class DockerEnvironment:
         self.logger = logger or logging.getLogger("minisweagent.environment")
         self.container_id: str | None = None
         self.config = config_class(**kwargs)
+        self._session: ShellSession | None = None
+        self._snapshots: list[str] = []
+        self._fork_ids: list[str] = []
         self._start_container()
 
     def get_template_vars(self) -> dict[str, Any]:
@@ -79,19 +95,50 @@ class DockerEnvironment:
         self.logger.info(f"Started container {container_name} with ID {result.stdout.strip()}")
         self.container_id = result.stdout.strip()
 
-    def execute(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
-        """Execute a command in the Docker container and return the result as a dict."""
-        cwd = cwd or self.config.cwd
-        assert self.container_id, "Container not started"
-
-        cmd = [self.config.executable, "exec", "-w", cwd]
+    def _get_exec_args(self, cwd: str = "") -> list[str]:
+        """Arguments of `docker exec` up to the container ID (working directory and environment variables)."""
+        args = ["-w", cwd or self.config.cwd]
         for key in self.config.forward_env:
             if (value := os.getenv(key)) is not None:
-                cmd.extend(["-e", f"{key}={value}"])
+                args.extend(["-e", f"{key}={value}"])
         for key, value in self.config.env.items():
-            cmd.extend(["-e", f"{key}={value}"])
-        cmd.extend([self.container_id, "bash", "-lc", command])
+            args.extend(["-e", f"{key}={value}"])
+        return args
+
+    def _get_exec_command(self, command: str, cwd: str = "") -> list[str]:
+        assert self.container_id, "Container not started"
+        return [self.config.executable, "exec", *self._get_exec_args(cwd), self.container_id, "bash", "-lc", command]
+
+    def _get_session(self) -> ShellSession:
+        assert self.container_id, "Container not started"
+        if self._session is None:
+            self._session = ShellSession(
+                [self.config.executable, "exec", "-i", *self._get_exec_args(), self.container_id, "bash", "-l"],
+                kill_prefix=[self.config.executable, "exec", self.container_id],
+                logger=self.logger,
+            )
+        return self._session
+
+    def _execute_in_session(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
+        result = self._get_session().run(
+            command,
+            cwd=cwd or self.config.cwd,
+            timeout=timeout or self.config.timeout,
+            output_limit=self.config.output_limit,
+        )
+        if not self.config.output_limit:
+            return {"output": result["output"], "returncode": result["returncode"]}
+        return result
 
+    def execute(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
+        """Execute a command in the Docker container and return the result as a dict."""
+        if self.config.session:
+            return self._execute_in_session(command, cwd, timeout=timeout)
+        cmd = self._get_exec_command(command, cwd)
+        if self.config.output_limit:
+            return run_with_output_limit(
+                cmd, output_limit=self.config.output_limit, timeout=timeout or self.config.timeout
+            )
         result = subprocess.run(
             cmd,
             text=True,
@@ -103,11 +150,60 @@ class DockerEnvironment:
         )
         return {"output": result.stdout, "returncode": result.returncode}
 
+    async def aexecute(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
+        """Async version of `execute` (using `asyncio.create_subprocess_exec`)."""
+        if self.config.session:
+            return await asyncio.to_thread(self._execute_in_session, command, cwd, timeout=timeout)
+        result = await arun_with_output_limit(
+            self._get_exec_command(command, cwd),
+            output_limit=self.config.output_limit,
+            timeout=timeout or self.config.timeout,
+        )
+        if not self.config.output_limit:
+            return {"output": result["output"], "returncode": result["returncode"]}
+        return result
+
+    def snapshot(self) -> str:
+        """Commit the file system of the container (e.g., after a startup command) to a new image and return its name.
+        Running processes are not part of the snapshot. The image is removed by `cleanup`.
+        """
+        assert self.container_id, "Container not started"
+        image = f"minisweagent-snapshot-{uuid.uuid4().hex[:8]}"
+        cmd = [self.config.executable, "commit", self.container_id, image]
+        self.logger.debug(f"Taking snapshot with command: {shlex.join(cmd)}")
+        subprocess.run(cmd, capture_output=True, text=True, timeout=self.config.pull_timeout, check=True)
+        self._snapshots.append(image)
+        return image
+
+    def fork(self) -> "DockerEnvironment":
+        """Start a new environment of the same class and config in a container of the latest snapshot of this one
+        (taken now if there is none). The fork is isolated from this environment and from other forks.
+        `cleanup` of this environment also removes all of its forks (the snapshot can only be removed after them).
+        """
+        image = self._snapshots[-1] if self._snapshots else self.snapshot()
+        fork = copy.copy(self)
+        fork.config = self.config.model_copy(update={"image": image})
+        fork.container_id = None
+        fork._session = None
+        fork._snapshots = []
+        fork._fork_ids = []
+        fork._start_container()
+        self._fork_ids.append(fork.container_id)  # type: ignore[arg-type]
+        return fork
+
     def cleanup(self):
-        """Stop and remove the Docker container."""
+        """Stop and remove the Docker container (and its forks and snapshots)."""
+        if getattr(self, "_session", None) is not None:
+            self._session.close()  # type: ignore[union-attr]
+            self._session = None
         if getattr(self, "container_id", None) is not None:  # if init fails early, container_id might not be set
-            cmd = f"(timeout 60 {self.config.executable} stop {self.container_id} || {self.config.executable} rm -f {self.container_id}) >/dev/null 2>&1 &"
-            subprocess.Popen(cmd, shell=True)
+            cmd = f"(timeout 60 {self.config.executable} stop {self.container_id} || {self.config.executable} rm -f {self.container_id}"
+            if self._fork_ids:
+                cmd += f"; {self.config.executable} rm -f {' '.join(self._fork_ids)}"
+            if self._snapshots:
+                cmd += f"; {self.config.executable} rmi {' '.join(self._snapshots)}"
+            subprocess.Popen(cmd + ") >/dev/null 2>&1 &", shell=True)
+            self._fork_ids, self._snapshots = [], []
 
     def __del__(self):
         """Cleanup container when object is destroyed."""
@@ -0,0 +1,201 @@
+"""Docker environment that talks to the Docker Engine REST API over its unix socket instead of forking the
+`docker` CLI for every container and command (see `DockerAPIClient`).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import uuid
+from typing import Any
+
+from minisweagent.environments.docker import DockerEnvironmentConfig
+from minisweagent.environments.utils.docker_api import (
+    STDERR,
+    STDOUT,
+    DockerAPIClient,
+    DockerAPIError,
+    MultiplexedStreamDecoder,
+    get_client,
+)
+from minisweagent.environments.utils.output_capture import HeadTailBuffer
+
+
+class DockerAPIEnvironmentConfig(DockerEnvironmentConfig):
+    socket_path: str = os.getenv("MSWEA_DOCKER_SOCKET", "/var/run/docker.sock")
+    """Unix socket of the API (for Podman, e.g., `/run/user/1000/podman/podman.sock`).
+    `executable` and `session` are not used; only some `run_args` are supported (see `parse_run_args`).
+    """
+    api_version: str = "1.41"
+
+
+_FLAGS = {"--rm": "AutoRemove", "--privileged": "Privileged", "--init": "Init", "--read-only": "ReadonlyRootfs"}
+"""`docker run` flags and their `HostConfig` fields."""
+
+
+def parse_run_args(run_args: list[str]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Translate the supported `docker run` arguments to the fields of the container (incl. `HostConfig`) and
+    the query parameters of the create request.
+    """
+    container: dict[str, Any] = {"HostConfig": {}, "Env": []}
+    params: dict[str, Any] = {}
+    host_config = container["HostConfig"]
+    args = list(run_args)
+    while args:
+        arg = args.pop(0)
+        name, _, value = arg.partition("=")
+        if name in _FLAGS:
+            host_config[_FLAGS[name]] = value.lower() != "false" if value else True
+            continue
+        if not value:
+            if not args:
+                raise ValueError(f"Missing value of {name} in run_args")
+            value = args.pop(0)
+        if name == "--network":
+            host_config["NetworkMode"] = value
+        elif name in ("-v", "--volume"):
+            host_config.setdefault("Binds", []).append(value)
+        elif name in ("-e", "--env"):
+            container["Env"].append(value if "=" in value else f"{value}={os.getenv(value, '')}")
+        elif name in ("-u", "--user"):
+            container["User"] = value
+        elif name == "--platform":
+            params["platform"] = value
+        elif name == "--cpus":
+            host_config["NanoCpus"] = int(float(value) * 1e9)
+        elif name in ("-m", "--memory"):
+            host_config["Memory"] = _parse_bytes(value)
+        elif name == "--shm-size":
+            host_config["ShmSize"] = _parse_bytes(value)
+        elif name == "--add-host":
+            host_config.setdefault("ExtraHosts", []).append(value.replace("=", ":", 1))
+        else:
+            raise ValueError(f"Unsupported run argument for the docker API environment: {arg}")
+    return container, params
+
+
+def _parse_bytes(value: str) -> int:
+    units = {"b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+    if value[-1].lower() in units:
+        return int(float(value[:-1]) * units[value[-1].lower()])
+    return int(value)
+
+
+class DockerAPIEnvironment:
+    def __init__(
+        self,
+        *,
+        config_class: type = DockerAPIEnvironmentConfig,
+        logger: logging.Logger | None = None,
+        **kwargs,
+    ):
+        """Executes bash commands in a Docker container like `DockerEnvironment`, but with requests to the API
+        (exec create/start) over a pooled connection to the socket of the daemon.
+        See `DockerAPIEnvironmentConfig` for keyword arguments.
+        """
+        self.logger = logger or logging.getLogger("minisweagent.environment")
+        self.container_id: str | None = None
+        self.config = config_class(**kwargs)
+        self.client: DockerAPIClient = get_client(self.config.socket_path, self.config.api_version)
+        self._start_container()
+
+    def get_template_vars(self) -> dict[str, Any]:
+        return self.config.model_dump()
+
+    def _pull_image(self) -> None:
+        image, _, tag = self.config.image.rpartition(":")
+        if not image or "/" in tag:  # no tag (the colon was part of a registry host with port)
+            image, tag = self.config.image, "latest"
+        self.logger.info(f"Pulling image {self.config.image}")
+        for line in b"".join(
+            self.client.stream(
+                "POST", "/images/create", params={"fromImage": image, "tag": tag}, timeout=self.config.pull_timeout
+            )
+        ).splitlines():
+            if line.strip() and "error" in (status := json.loads(line)):
+                raise DockerAPIError(500, f"Failed to pull {self.config.image}: {status['error']}")
+
+    def _start_container(self):
+        container_name = f"minisweagent-{uuid.uuid4().hex[:8]}"
+        container, params = parse_run_args(self.config.run_args)
+        container |= {
+            "Image": self.config.image,
+            "Cmd": ["sleep", self.config.container_timeout],
+            "WorkingDir": self.config.cwd,
+        }
+        params["name"] = container_name
+        try:
+            response = self.client.request("POST", "/containers/create", params=params, body=container)
+        except DockerAPIError as e:
+            if e.status != 404:
+                raise
+            self._pull_image()
+            response = self.client.request("POST", "/containers/create", params=params, body=container)
+        self.container_id = response["Id"]
+        self.client.request("POST", f"/containers/{self.container_id}/start")
+        self.logger.info(f"Started container {container_name} with ID {self.container_id}")
+
+    def _get_env(self) -> list[str]:
+        env = {key: value for key in self.config.forward_env if (value := os.getenv(key)) is not None}
+        return [f"{key}={value}" for key, value in (env | self.config.env).items()]
+
+    def execute(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
+        """Execute a command in the Docker container and return the result as a dict."""
+        assert self.container_id, "Container not started"
+        timeout = timeout or self.config.timeout
+        exec_id = self.client.request(
+            "POST",
+            f"/containers/{self.container_id}/exec",
+            body={
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "Cmd": ["bash", "-lc", command],
+                "WorkingDir": cwd or self.config.cwd,
+                "Env": self._get_env(),
+            },
+        )["Id"]
+        buffer = HeadTailBuffer(self.config.output_limit or sys.maxsize)
+        decoder = MultiplexedStreamDecoder()
+        try:
+            for chunk in self.client.stream(
+                "POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False}, timeout=timeout
+            ):
+                for stream, payload in decoder.feed(chunk):
+                    if stream in (STDOUT, STDERR):
+                        buffer.write(payload)
+        except TimeoutError:
+            buffer.write(b"", final=True)
+            raise subprocess.TimeoutExpired(command, timeout, output=buffer.output.encode("utf-8"))
+        buffer.write(b"", final=True)
+        returncode = self.client.request("GET", f"/exec/{exec_id}/json")["ExitCode"]
+        if not self.config.output_limit:
+            return {"output": buffer.output, "returncode": returncode}
+        return {
+            "output": buffer.output,
+            "returncode": returncode,
+            "elided_chars": buffer.elided_chars,
+            "output_bytes": buffer.n_bytes,
+        }
+
+    async def aexecute(self, command: str, cwd: str = "", *, timeout: int | None = None) -> dict[str, Any]:
+        """Async version of `execute` (the requests are sent from a worker thread)."""
+        return await asyncio.to_thread(self.execute, command, cwd, timeout=timeout)
+
+    def cleanup(self):
+        """Stop and remove the Docker container."""
+        if getattr(self, "container_id", None) is None:  # if init fails early, container_id might not be set
+            return
+        try:
+            if "--rm" in self.config.run_args:
+                self.client.request("DELETE", f"/containers/{self.container_id}", params={"force": "true"})
+            else:
+                self.client.request("POST", f"/containers/{self.container_id}/stop", params={"t": 1})
+        except (DockerAPIError, OSError) as e:
+            self.logger.warning(f"Failed to remove container {self.container_id}: {e}")
+        self.container_id = None
+
+    def __del__(self):
+        """Cleanup container when object is destroyed."""
+        self.cleanup()
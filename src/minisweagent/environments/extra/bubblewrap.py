@@ -22,6 +22,8 @@ from typing import Any
 
 from pydantic import BaseModel
 
+from minisweagent.environments.utils.output_capture import run_with_output_limit
+
 
 class BubblewrapEnvironmentConfig(BaseModel):
     cwd: str = ""
@@ -30,6 +32,8 @@ class BubblewrapEnvironmentConfig(BaseModel):
     """Dictionary of environment variables to set in the sandbox."""
     timeout: int = 30
     """Timeout for the command in seconds."""
+    output_limit: int = 0
+    """Only keep the head and tail of the output (`output_limit` characters in total). 0 disables the limit."""
     executable: str = os.getenv("MSWEA_BUBBLEWRAP_EXECUTABLE", "bwrap")
     """Path to the bubblewrap executable."""
     wrapper_args: list[str] = [
@@ -87,6 +91,10 @@ class BubblewrapEnvironment:
 
         cmd.extend(["bash", "-c", command])
 
+        if self.config.output_limit:
+            return run_with_output_limit(
+                cmd, output_limit=self.config.output_limit, timeout=timeout or self.config.timeout
+            )
         result = subprocess.run(
             cmd,
             text=True,
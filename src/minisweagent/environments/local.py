@@ -5,21 +5,51 @@ from typing import Any
 
 from pydantic import BaseModel
 
+from minisweagent.environments.utils.output_capture import run_with_output_limit
+from minisweagent.environments.utils.shell_session import ShellSession
+
 
 class LocalEnvironmentConfig(BaseModel):
     cwd: str = ""
     env: dict[str, str] = {}
     timeout: int = 30
+    output_limit: int = 0
+    session: bool = False
+    """Run all commands in one long-lived bash process instead of a new shell per command (see `ShellSession`,
+    POSIX only). Every command still runs in a new subshell. The environment variables are taken when bash starts.
+    """
 
 
 class LocalEnvironment:
     def __init__(self, *, config_class: type = LocalEnvironmentConfig, **kwargs):
         """This class executes bash commands directly on the local machine."""
         self.config = config_class(**kwargs)
+        self._session: ShellSession | None = None
+
+    def _execute_in_session(self, command: str, cwd: str, *, timeout: int | None = None) -> dict[str, Any]:
+        if self._session is None:
+            self._session = ShellSession(["bash"], env=os.environ | self.config.env)
+        result = self._session.run(
+            command, cwd=cwd, timeout=timeout or self.config.timeout, output_limit=self.config.output_limit
+        )
+        if not self.config.output_limit:
+            return {"output": result["output"], "returncode": result["returncode"]}
+        return result
 
     def execute(self, command: str, cwd: str = "", *, timeout: int | None = None):
         """Execute a command in the local environment and return the result as a dict."""
         cwd = cwd or self.config.cwd or os.getcwd()
+        if self.config.session:
+            return self._execute_in_session(command, cwd, timeout=timeout)
+        if self.config.output_limit:
+            return run_with_output_limit(
+                command,
+                output_limit=self.config.output_limit,
+                timeout=timeout or self.config.timeout,
+                shell=True,
+                cwd=cwd,
+                env=os.environ | self.config.env,
+            )
         result = subprocess.run(
             command,
             shell=True,
@@ -36,3 +66,12 @@ class LocalEnvironment:
 
     def get_template_vars(self) -> dict[str, Any]:
         return self.config.model_dump() | platform.uname()._asdict() | os.environ
+
+    def cleanup(self):
+        """Stop the shell session (if any)."""
+        if getattr(self, "_session", None) is not None:
+            self._session.close()  # type: ignore[union-attr]
+            self._session = None
+
+    def __del__(self):
+        self.cleanup()
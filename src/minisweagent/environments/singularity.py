@@ -11,6 +11,9 @@ from typing import Any
 
 from pydantic import BaseModel
 
+from minisweagent.environments.utils.output_capture import run_with_output_limit
+from minisweagent.environments.utils.sif_cache import SIFCache
+
 
 class SingularityEnvironmentConfig(BaseModel):
     image: str
@@ -21,10 +24,19 @@ class SingularityEnvironmentConfig(BaseModel):
     """Environment variables to forward to the container."""
     timeout: int = 30
     """Timeout for executing commands in the container."""
+    output_limit: int = 0
+    """Only keep the head and tail of the output (`output_limit` characters in total). 0 disables the limit."""
     executable: str = os.getenv("MSWEA_SINGULARITY_EXECUTABLE", "singularity")
     """Path to the singularity executable."""
     sandbox_build_retries: int = 3
-    """Number of retries for building the sandbox if an error occurs."""
+    """Number of retries for building the sandbox (or the SIF) if an error occurs."""
+    sif_cache_dir: str = os.getenv("MSWEA_SIF_CACHE_DIR", "")
+    """If set, the image is built into a read-only SIF in this directory once (shared by all environments and
+    processes on the host, see `SIFCache`) and every environment only gets a writable overlay directory,
+    instead of building a sandbox (a copy of the whole root file system) per environment.
+    """
+    sif_cache_max_gb: float = 0.0
+    """Remove least recently used images that are not in use when the SIF cache is larger (0: never)."""
 
 
 class SingularityEnvironment:
@@ -34,7 +46,21 @@ class SingularityEnvironment:
         """Singularity environment. See `SingularityEnvironmentConfig` for kwargs."""
         self.logger = logger or logging.getLogger("minisweagent.environment")
         self.config = config_class(**kwargs)
-        self.sandbox_dir = self._build_sandbox()
+        self.sandbox_dir: Path | None = None
+        self.overlay_dir: Path | None = None
+        self._sif_lock: int | None = None
+        if self.config.sif_cache_dir:
+            self.sif_cache = SIFCache(
+                self.config.sif_cache_dir,
+                max_size_gb=self.config.sif_cache_max_gb,
+                executable=self.config.executable,
+                build_retries=self.config.sandbox_build_retries,
+                logger=self.logger,
+            )
+            self.sif_path, self._sif_lock = self.sif_cache.acquire(self.config.image)
+            self.overlay_dir = Path(tempfile.mkdtemp(prefix="minisweagent-overlay-"))
+        else:
+            self.sandbox_dir = self._build_sandbox()
 
     def _build_sandbox(self) -> Path:
         # Building the sandbox can fail (very rarely), so we retry it
@@ -77,7 +103,14 @@ class SingularityEnvironment:
         for key, value in self.config.env.items():
             cmd.extend(["--env", f"{key}={value}"])
 
-        cmd.extend(["--writable", str(self.sandbox_dir), "bash", "-c", command])
+        if self.overlay_dir is not None:
+            cmd.extend(["--overlay", str(self.overlay_dir), str(self.sif_path), "bash", "-c", command])
+        else:
+            cmd.extend(["--writable", str(self.sandbox_dir), "bash", "-c", command])
+        if self.config.output_limit:
+            return run_with_output_limit(
+                cmd, output_limit=self.config.output_limit, timeout=timeout or self.config.timeout
+            )
         result = subprocess.run(
             cmd,
             text=True,
@@ -90,8 +123,13 @@ class SingularityEnvironment:
         return {"output": result.stdout, "returncode": result.returncode}
 
     def cleanup(self):
-        shutil.rmtree(self.sandbox_dir, ignore_errors=True)
+        for path in (getattr(self, "sandbox_dir", None), getattr(self, "overlay_dir", None)):
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+        if getattr(self, "_sif_lock", None) is not None:
+            self.sif_cache.release(self._sif_lock)  # type: ignore[arg-type]
+            self._sif_lock = None
 
     def __del__(self):
-        """Cleanup sandbox when object is destroyed."""
+        """Cleanup sandbox (or overlay) when object is destroyed."""
         self.cleanup()
@@ -0,0 +1,204 @@
+"""Minimal client for the Docker Engine REST API over its unix socket (also works with the Docker-compatible
+API of Podman).
+
+Requests are sent over a pool of keep-alive connections, so that a batch run doesn't fork a `docker` CLI process
+(which makes its own API calls) for every container and command. Only the endpoints used by
+`DockerAPIEnvironment` are wrapped.
+"""
+
+import http.client
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterator
+from typing import Any
+
+STDIN, STDOUT, STDERR = 0, 1, 2
+
+
+class DockerAPIError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+    @classmethod
+    def from_response(cls, status: int, data: bytes) -> "DockerAPIError":
+        try:
+            message = json.loads(data)["message"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode(errors="replace")
+        return cls(status, message)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, *, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class MultiplexedStreamDecoder:
+    """Incremental decoder of the multiplexed stdout/stderr stream of an attached exec (or container) without TTY.
+
+    Every frame has an 8 byte header: the stream (1: stdout, 2: stderr), three zero bytes and the size of the
+    payload (big endian). Frames may be split over several reads.
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> list[tuple[int, bytes]]:
+        """Returns the `(stream, payload)` of every frame completed by `data`."""
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= 8:
+            stream, size = struct.unpack(">BxxxL", self._buffer[:8])
+            if len(self._buffer) < 8 + size:
+                break
+            frames.append((stream, self._buffer[8 : 8 + size]))
+            self._buffer = self._buffer[8 + size :]
+        return frames
+
+    @property
+    def pending(self) -> int:
+        """Bytes of an incomplete frame."""
+        return len(self._buffer)
+
+
+class DockerAPIClient:
+    def __init__(self, socket_path: str, *, api_version: str = "1.41", max_idle: int = 32):
+        """Client for the API at `socket_path`. Up to `max_idle` idle connections are kept open for reuse."""
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self._idle: queue.LifoQueue[UnixHTTPConnection] = queue.LifoQueue(maxsize=max_idle)
+
+    def _url(self, path: str, params: dict[str, Any] | None = None) -> str:
+        url = f"/v{self.api_version}{path}"
+        if params := {k: v for k, v in (params or {}).items() if v is not None}:
+            url += "?" + urllib.parse.urlencode(params)
+        return url
+
+    def _get_connection(self) -> tuple[UnixHTTPConnection, bool]:
+        """An idle connection (and True) or a new one (and False)."""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path), False
+
+    def _release(self, connection: UnixHTTPConnection, response: http.client.HTTPResponse) -> None:
+        if response.will_close:
+            connection.close()
+            return
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _send(
+        self, method: str, url: str, body: Any, timeout: float | None
+    ) -> tuple[UnixHTTPConnection, socket.socket, http.client.HTTPResponse]:
+        """Returns the connection, its socket (the connection forgets it if the response closes it) and the response."""
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        while True:
+            connection, reused = self._get_connection()
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, url, body=data, headers=headers)
+                sock = connection.sock
+                return connection, sock, connection.getresponse()  # type: ignore[return-value]
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if not reused:
+                    raise
+                # The daemon closed the idle connection, try the next one (or a new one)
+            except BaseException:
+                connection.close()
+                raise
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict[str, Any] | None = None,
+        body: Any = None,
+        timeout: float | None = 60,
+    ) -> Any:
+        """Send a request and return the decoded JSON response (None for empty responses).
+        Raises `DockerAPIError` for error responses.
+        """
+        connection, _, response = self._send(method, self._url(path, params), body, timeout)
+        try:
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection, response)
+        if response.status >= 400:
+            raise DockerAPIError.from_response(response.status, data)
+        return json.loads(data) if data.strip() else None
+
+    def stream(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: dict[str, Any] | None = None,
+        body: Any = None,
+        timeout: float | None = None,
+    ) -> Iterator[bytes]:
+        """Send a request and yield the raw chunks of the response body (e.g., of an attached exec, after which
+        the daemon closes the connection). Raises `TimeoutError` if the response doesn't end within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        connection, sock, response = self._send(method, self._url(path, params), body, timeout)
+        try:
+            if response.status >= 400:
+                raise DockerAPIError.from_response(response.status, response.read())
+            while True:
+                if deadline is not None:
+                    if (remaining := deadline - time.monotonic()) <= 0:
+                        raise TimeoutError(f"No end of the response within {timeout}s")
+                    sock.settimeout(remaining)
+                if not (chunk := response.read1(65536)):
+                    return
+                yield chunk
+        finally:
+            response.close()
+            connection.close()  # streams are not reused
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_CLIENTS: dict[tuple[str, str], DockerAPIClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(socket_path: str, api_version: str = "1.41") -> DockerAPIClient:
+    """Client shared by all environments of the process that use the same socket (and thus its connection pool)."""
+    with _CLIENTS_LOCK:
+        if (socket_path, api_version) not in _CLIENTS:
+            _CLIENTS[(socket_path, api_version)] = DockerAPIClient(socket_path, api_version=api_version)
+        return _CLIENTS[(socket_path, api_version)]
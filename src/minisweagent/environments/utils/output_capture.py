@@ -0,0 +1,112 @@
+"""Memory-bounded capture of command output.
+
+Instead of buffering the full output of a command (as `subprocess.run(stdout=PIPE)` does),
+the output is streamed into a buffer that only keeps its head and its tail.
+"""
+
+import asyncio
+import codecs
+import io
+import subprocess
+import sys
+import threading
+import time
+from typing import Any
+
+
+class HeadTailBuffer:
+    """Keeps the first `limit // 2` and the last `limit - limit // 2` characters of a byte stream."""
+
+    def __init__(self, limit: int):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = ""
+        self.tail = ""
+        self.n_bytes = 0
+        self.n_chars = 0
+        self._decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True
+        )
+
+    def write(self, data: bytes, *, final: bool = False) -> None:
+        self.n_bytes += len(data)
+        text = self._decoder.decode(data, final=final)
+        self.n_chars += len(text)
+        if (room := self.head_limit - len(self.head)) > 0:
+            self.head += text[:room]
+            text = text[room:]
+        if text:
+            self.tail = (self.tail + text)[-self.tail_limit :]
+
+    @property
+    def output(self) -> str:
+        return self.head + self.tail
+
+    @property
+    def elided_chars(self) -> int:
+        return self.n_chars - len(self.head) - len(self.tail)
+
+
+def run_with_output_limit(cmd: str | list[str], *, output_limit: int, timeout: int, **kwargs) -> dict[str, Any]:
+    """Run a command with stdout and stderr combined, keeping only the head and tail of the output.
+
+    Memory use is O(output_limit) rather than O(output size). Returns the usual `output`/`returncode` dict,
+    plus `elided_chars` (number of characters dropped from the middle) and `output_bytes` (total bytes read).
+    Raises `subprocess.TimeoutExpired` (with the captured output as bytes) if the command times out.
+    """
+    buffer = HeadTailBuffer(output_limit)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+
+    def read_output():
+        while chunk := process.stdout.read1(65536):  # type: ignore[union-attr]
+            buffer.write(chunk)
+        buffer.write(b"", final=True)
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    deadline = time.monotonic() + timeout
+    reader.start()
+    try:
+        reader.join(timeout)
+        if reader.is_alive():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        returncode = process.wait(max(deadline - time.monotonic(), 0))
+    except subprocess.TimeoutExpired:
+        process.kill()
+        # Background processes might keep the pipe open, so we don't wait for the reader indefinitely
+        reader.join(1)
+        raise subprocess.TimeoutExpired(cmd, timeout, output=buffer.output.encode("utf-8"))
+    process.stdout.close()  # type: ignore[union-attr]
+    return {
+        "output": buffer.output,
+        "returncode": returncode,
+        "elided_chars": buffer.elided_chars,
+        "output_bytes": buffer.n_bytes,
+    }
+
+
+async def arun_with_output_limit(cmd: list[str], *, output_limit: int, timeout: int) -> dict[str, Any]:
+    """Async version of `run_with_output_limit` (using `asyncio.create_subprocess_exec`).
+
+    With `output_limit=0`, the full output is kept.
+    """
+    buffer = HeadTailBuffer(output_limit or sys.maxsize)
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    async def read_output() -> int:
+        while chunk := await process.stdout.read(65536):  # type: ignore[union-attr]
+            buffer.write(chunk)
+        buffer.write(b"", final=True)
+        return await process.wait()
+
+    try:
+        returncode = await asyncio.wait_for(read_output(), timeout)
+    except TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout, output=buffer.output.encode("utf-8"))
+    return {
+        "output": buffer.output,
+        "returncode": returncode,
+        "elided_chars": buffer.elided_chars,
+        "output_bytes": buffer.n_bytes,
+    }
@@ -0,0 +1,192 @@
+"""A long-lived bash process that runs one command after the other.
+
+Starting a process per command (e.g., `docker exec ... bash -lc <command>`) costs a process start, a round trip to
+the docker daemon and a login shell init for every action. A `ShellSession` starts the shell once and writes the
+commands to its stdin. Every command still runs in its own subshell (in its own process group), so directory or
+environment variable changes are not persistent, just like with a new process per command.
+
+The output of a command is framed by sentinels with a random token, which also carry the process group of the
+subshell (to interrupt the command on timeouts) and its return code:
+
+    <token>-start <pid>
+    <output of the command>
+    <token>-end <returncode>
+
+If the shell dies, it is restarted for the next command.
+"""
+
+import logging
+import os
+import re
+import select
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any
+
+from minisweagent.environments.utils.output_capture import HeadTailBuffer
+
+_SETUP = "set -m; exec 2>/dev/null\n"
+"""Job control puts every command in its own process group; messages of the shell itself are discarded
+(the stderr of the commands is redirected to their stdout)."""
+
+_KILL_GRACE_PERIOD = 10.0
+"""Seconds to wait for the end sentinel after a command was killed, before the shell is restarted."""
+
+
+class ShellSessionDied(RuntimeError):
+    pass
+
+
+class ShellSession:
+    def __init__(
+        self,
+        cmd: list[str],
+        *,
+        kill_prefix: list[str] | None = None,
+        logger: logging.Logger | None = None,
+        **popen_kwargs,
+    ):
+        """Run commands in the bash process started with `cmd` (e.g., `docker exec -i <container> bash -l`).
+
+        Args:
+            cmd: Command that starts bash reading commands from stdin.
+            kill_prefix: Prefix of the `kill` command that interrupts a command on timeout
+                (e.g., `docker exec <container>`, empty if the shell runs on this host).
+            **popen_kwargs: Passed on to `subprocess.Popen` (e.g., `cwd` or `env`).
+        """
+        self.cmd = cmd
+        self.kill_prefix = kill_prefix or []
+        self.logger = logger or logging.getLogger("minisweagent.environment")
+        self.popen_kwargs = popen_kwargs
+        self._process: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+        self.n_restarts = 0
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self) -> subprocess.Popen:
+        if self._process is not None:
+            self.n_restarts += 1
+            self.logger.warning(f"Shell session died (exit code {self._process.poll()}), restarting it")
+            self._stop()
+        self.logger.debug(f"Starting shell session: {shlex.join(self.cmd)}")
+        self._process = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **self.popen_kwargs
+        )
+        self._process.stdin.write(_SETUP.encode())  # type: ignore[union-attr]
+        self._process.stdin.flush()  # type: ignore[union-attr]
+        return self._process
+
+    def _stop(self) -> None:
+        if self._process is None:
+            return
+        for pipe in (self._process.stdin, self._process.stdout):
+            try:
+                pipe.close()  # type: ignore[union-attr]
+            except OSError:
+                pass
+        try:
+            self._process.wait(5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def _kill(self, pid: int) -> None:
+        """Kill the process group of a command (the shell itself keeps running)."""
+        try:
+            subprocess.run(
+                [*self.kill_prefix, "kill", "-KILL", "--", f"-{pid}"],
+                capture_output=True,
+                timeout=_KILL_GRACE_PERIOD,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            self.logger.warning(f"Failed to kill command {pid} of the shell session: {e}")
+
+    def run(self, command: str, *, cwd: str, timeout: float, output_limit: int = 0) -> dict[str, Any]:
+        """Run `command` in a subshell in `cwd`. Returns the usual `output`/`returncode` dict, plus `elided_chars`
+        and `output_bytes` (see `run_with_output_limit`). Raises `subprocess.TimeoutExpired` (with the captured
+        output as bytes) if the command times out, after killing it.
+        """
+        with self._lock:
+            process = self._process if self.is_alive else self._start()
+            token = f"__MSWEA_{uuid.uuid4().hex}"
+            script = (
+                f"( printf '%s %d\\n' {token}-start \"$BASHPID\"; "
+                f"cd -- {shlex.quote(cwd)} && eval {shlex.quote(command)} ) </dev/null 2>&1 & "
+                f"wait $!; printf '\\n%s %d\\n' {token}-end \"$?\"\n"
+            )
+            try:
+                process.stdin.write(script.encode())  # type: ignore[union-attr]
+                process.stdin.flush()  # type: ignore[union-attr]
+            except BrokenPipeError:
+                process = self._start()
+                process.stdin.write(script.encode())  # type: ignore[union-attr]
+                process.stdin.flush()  # type: ignore[union-attr]
+            try:
+                return self._read_result(process, token, timeout=timeout, output_limit=output_limit, command=command)
+            except ShellSessionDied as e:
+                process.kill()  # it closed its stdout, make sure that it is restarted for the next command
+                process.wait()
+                self.logger.warning(f"Shell session died while running a command: {e}")
+                return {"output": str(e), "returncode": -1, "elided_chars": 0, "output_bytes": 0}
+
+    def _read_result(
+        self, process: subprocess.Popen, token: str, *, timeout: float, output_limit: int, command: str
+    ) -> dict[str, Any]:
+        start_re = re.compile(rf"{token}-start (\d+)\n".encode())
+        end_re = re.compile(rf"\n{token}-end (\d+)\n".encode())
+        keep = len(token) + 16  # bytes that might be the beginning of the end sentinel
+        buffer = HeadTailBuffer(output_limit or sys.maxsize)
+        fd = process.stdout.fileno()  # type: ignore[union-attr]
+        pending = b""
+        pid: int | None = None
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if timed_out:
+                    process.kill()  # the shell doesn't respond, it is restarted for the next command
+                    process.wait()
+                    raise subprocess.TimeoutExpired(command, timeout, output=buffer.output.encode("utf-8"))
+                timed_out = True
+                if pid is not None:
+                    self._kill(pid)
+                deadline = time.monotonic() + _KILL_GRACE_PERIOD
+                continue
+            if not select.select([fd], [], [], remaining)[0]:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                buffer.write(pending, final=True)
+                raise ShellSessionDied(buffer.output)
+            pending += chunk
+            if pid is None:
+                if not (match := start_re.search(pending)):
+                    continue
+                pid = int(match.group(1))
+                pending = pending[match.end() :]  # anything before is left over from earlier commands
+            if match := end_re.search(pending):
+                buffer.write(pending[: match.start()], final=True)
+                if timed_out:
+                    raise subprocess.TimeoutExpired(command, timeout, output=buffer.output.encode("utf-8"))
+                return {
+                    "output": buffer.output,
+                    "returncode": int(match.group(1)),
+                    "elided_chars": buffer.elided_chars,
+                    "output_bytes": buffer.n_bytes,
+                }
+            if len(pending) > keep:
+                buffer.write(pending[:-keep])
+                pending = pending[-keep:]
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop()
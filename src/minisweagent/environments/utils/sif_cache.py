@@ -0,0 +1,129 @@
+"""Cache of read-only SIF images for `SingularityEnvironment`, shared by all workers (and processes) on a host.
+
+Building a sandbox per instance unpacks the full root file system of the image every time. Instead, every image
+reference is built into a SIF file once and all environments of the image run it with their own small writable
+overlay. The cache is safe for concurrent use through `flock` locks on a lock file per image:
+
+* Environments hold a shared lock while they use an image, so it is never evicted under them.
+* The image is built under an exclusive lock (to a temporary file that is then renamed), so parallel workers
+  don't build the same image twice; the others wait for the build and then use its result.
+* Eviction only removes images whose exclusive lock it gets without waiting (least recently used first).
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import uuid
+from pathlib import Path
+
+
+class SIFCache:
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        *,
+        max_size_gb: float = 0.0,
+        executable: str = "singularity",
+        build_retries: int = 3,
+        logger: logging.Logger | None = None,
+    ):
+        """Cache in `cache_dir`. After every build, least recently used images that are not in use are removed
+        until the cache is at most `max_size_gb` large (0 disables eviction).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_gb = max_size_gb
+        self.executable = executable
+        self.build_retries = build_retries
+        self.logger = logger or logging.getLogger("minisweagent.environment")
+
+    def path(self, image: str) -> Path:
+        """Path of the SIF of `image` (a readable prefix and the hash of the image reference)."""
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", image.removeprefix("docker://"))[-64:]
+        return self.cache_dir / f"{name}-{hashlib.sha256(image.encode()).hexdigest()[:16]}.sif"
+
+    def acquire(self, image: str) -> tuple[Path, int]:
+        """Return the SIF of `image` (built if it is not cached yet) and the file descriptor of its shared lock,
+        which has to be passed to `release` once the image isn't used anymore.
+        """
+        sif_path = self.path(image)
+        lock_fd = os.open(sif_path.with_suffix(".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_SH)
+            built = False
+            while not sif_path.exists():
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)  # wait for a build by another worker or build it ourselves
+                if not sif_path.exists():
+                    self._build(image, sif_path)
+                built = True
+                # Downgrading the lock isn't atomic: the image can be evicted in between, then it is built again
+                fcntl.flock(lock_fd, fcntl.LOCK_SH)
+            os.utime(sif_path)  # the modification time orders the images for eviction
+            if built:
+                self.evict()
+        except BaseException:
+            os.close(lock_fd)
+            raise
+        return sif_path, lock_fd
+
+    def release(self, lock_fd: int) -> None:
+        os.close(lock_fd)
+
+    def _build(self, image: str, sif_path: Path) -> None:
+        # Building the image can fail (very rarely), so we retry it
+        for attempt in range(self.build_retries):
+            tmp_path = sif_path.with_name(f"{sif_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+            self.logger.info(f"Building {sif_path.name} from {image}")
+            try:
+                subprocess.run([self.executable, "build", tmp_path, image], check=True, capture_output=True)
+                os.replace(tmp_path, sif_path)
+                return
+            except subprocess.CalledProcessError as e:
+                self.logger.error(
+                    f"Error building image {image}, stdout: {e.stdout}, stderr: {e.stderr} "
+                    f"(attempt {attempt + 1}/{self.build_retries})"
+                )
+                if attempt == self.build_retries - 1:
+                    raise
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+    def size(self) -> int:
+        """Total size of the cached images in bytes."""
+        return sum(path.stat().st_size for path in self.cache_dir.glob("*.sif") if path.exists())
+
+    def evict(self) -> list[Path]:
+        """Remove least recently used images that are not in use while the cache is larger than `max_size_gb`.
+        Returns the removed images.
+        """
+        if not self.max_size_gb:
+            return []
+        sifs = []
+        for path in self.cache_dir.glob("*.sif"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # removed by another worker
+                continue
+            sifs.append((stat.st_mtime, stat.st_size, path))
+        excess = sum(size for _, size, _ in sifs) - self.max_size_gb * 1024**3
+        removed = []
+        for _, size, path in sorted(sifs):
+            if excess <= 0:
+                break
+            lock_fd = os.open(path.with_suffix(".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:  # in use
+                os.close(lock_fd)
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            finally:
+                os.close(lock_fd)
+            self.logger.info(f"Evicted {path.name} from the SIF cache ({size / 1024**3:.1f} GB)")
+            removed.append(path)
+            excess -= size
+        return removed
@@ -8,6 +8,8 @@ import os
 import threading
 
 from minisweagent import Model
+from minisweagent.models.utils.rate_limit import RateLimiter
+from minisweagent.utils.histogram import Histogram
 
 
 class GlobalModelStats:
@@ -16,6 +18,14 @@ class GlobalModelStats:
     def __init__(self):
         self._cost = 0.0
         self._n_calls = 0
+        self._n_rate_limited = 0
+        self._query_time = 0.0
+        self._n_timed_queries = 0
+        self._queue_wait_time = 0.0
+        self.latency_histogram = Histogram()
+        """Latencies of single attempts of model calls."""
+        self.retry_wait_histogram = Histogram((1, 2, 4, 8, 16, 32, 64, 128))
+        """Backoffs before retries of failed model calls."""
         self._lock = threading.Lock()
         self.cost_limit = float(os.getenv("MSWEA_GLOBAL_COST_LIMIT", "0"))
         self.call_limit = int(os.getenv("MSWEA_GLOBAL_CALL_LIMIT", "0"))
@@ -30,6 +40,27 @@ class GlobalModelStats:
         if 0 < self.cost_limit < self._cost or 0 < self.call_limit < self._n_calls + 1:
             raise RuntimeError(f"Global cost/call limit exceeded: ${self._cost:.4f} / {self._n_calls + 1}")
 
+    def record_rate_limit(self) -> None:
+        """Record a call that was rejected because of rate limits or overload (and will be retried)."""
+        with self._lock:
+            self._n_rate_limited += 1
+
+    def record_latency(self, seconds: float) -> None:
+        """Record the latency of a single attempt of a model call."""
+        with self._lock:
+            self._query_time += seconds
+            self._n_timed_queries += 1
+        self.latency_histogram.observe(seconds)
+
+    def record_retry(self, seconds: float) -> None:
+        """Record the backoff before a failed model call is retried."""
+        self.retry_wait_histogram.observe(seconds)
+
+    def record_queue_wait(self, seconds: float) -> None:
+        """Record the time a model call waited for rate limit capacity (see `GLOBAL_RATE_LIMITER`)."""
+        with self._lock:
+            self._queue_wait_time += seconds
+
     @property
     def cost(self) -> float:
         return self._cost
@@ -38,9 +69,38 @@ class GlobalModelStats:
     def n_calls(self) -> int:
         return self._n_calls
 
+    @property
+    def n_rate_limited(self) -> int:
+        return self._n_rate_limited
+
+    @property
+    def query_time(self) -> float:
+        """Total latency of all timed attempts of model calls (see `n_timed_queries`)."""
+        return self._query_time
+
+    @property
+    def n_timed_queries(self) -> int:
+        return self._n_timed_queries
+
+    @property
+    def n_retries(self) -> int:
+        return self.retry_wait_histogram.count
+
+    @property
+    def queue_wait_time(self) -> float:
+        return self._queue_wait_time
+
 
 GLOBAL_MODEL_STATS = GlobalModelStats()
 
+GLOBAL_RATE_LIMITER = RateLimiter(
+    base_backoff=float(os.getenv("MSWEA_RATE_LIMIT_BASE_BACKOFF", "4")),
+    max_backoff=float(os.getenv("MSWEA_RATE_LIMIT_MAX_BACKOFF", "60")),
+    stats=GLOBAL_MODEL_STATS,
+)
+"""Rate limits shared by all models of the process. Requests/tokens per minute are set with the `rpm`/`tpm`
+options of the model config (or `MSWEA_MODEL_RPM`/`MSWEA_MODEL_TPM`)."""
+
 
 def get_model(input_model_name: str | None = None, config: dict | None = None) -> Model:
     """Get an initialized model object from any kind of user input or settings."""
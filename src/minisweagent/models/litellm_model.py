@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 import os
+import time
 from collections.abc import Callable
 from pathlib import Path
 from typing import Any, Literal
@@ -8,17 +10,48 @@ from typing import Any, Literal
 import litellm
 from pydantic import BaseModel
 from tenacity import (
+    RetryCallState,
     before_sleep_log,
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.utils.cache_control import set_cache_control
+from minisweagent.models.utils.openai_utils import get_tool_calls
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
+from minisweagent.models.utils.streaming import consume_stream
 
 logger = logging.getLogger("litellm_model")
+_log_retry = before_sleep_log(logger, logging.WARNING)
+
+
+def _before_sleep(retry_state: RetryCallState) -> None:
+    """Log the retry and add the backoff to `retry_wait_time` of the model instance (and the global stats)."""
+    _log_retry(retry_state)
+    retry_state.args[0].retry_wait_time += retry_state.upcoming_sleep
+    GLOBAL_MODEL_STATS.record_retry(retry_state.upcoming_sleep)
+
+
+_retry = retry(
+    reraise=True,
+    stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
+    wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
+    before_sleep=_before_sleep,
+    retry=retry_if_not_exception_type(
+        (
+            litellm.exceptions.UnsupportedParamsError,
+            litellm.exceptions.NotFoundError,
+            litellm.exceptions.PermissionDeniedError,
+            litellm.exceptions.ContextWindowExceededError,
+            litellm.exceptions.APIError,
+            litellm.exceptions.AuthenticationError,
+            KeyboardInterrupt,
+        )
+    ),
+)
+"""Retry transient errors. Works for both sync and async functions."""
 
 
 class LitellmModelConfig(BaseModel):
@@ -29,6 +62,14 @@ class LitellmModelConfig(BaseModel):
     """Set explicit cache control markers, for example for Anthropic models"""
     cost_tracking: Literal["default", "ignore_errors"] = os.getenv("MSWEA_COST_TRACKING", "default")  # type: ignore[assignment]
     """Cost tracking mode for this model. Can be "default" or "ignore_errors" (ignore errors/missing cost info)"""
+    rpm: int = int(os.getenv("MSWEA_MODEL_RPM", "0"))
+    """Requests per minute, shared by all instances of this model in the process (0: unlimited)"""
+    tpm: int = int(os.getenv("MSWEA_MODEL_TPM", "0"))
+    """Tokens per minute, shared by all instances of this model in the process (0: unlimited)"""
+    stream: bool = False
+    """Stream the response. Time to first token and time to action are reported in `extra.response.streaming`."""
+    stream_stop_regex: str = r"```bash\s*\n(.*?)\n```"
+    """When streaming, stop generation as soon as this regex matches (i.e., the action is complete)."""
 
 
 class LitellmModel:
@@ -44,39 +85,78 @@ class LitellmModel:
 
         self.cost = 0.0
         self.n_calls = 0
+        self.retry_wait_time = 0.0
+        """Total time spent waiting between retries and for rate limit capacity (seconds)."""
+        GLOBAL_RATE_LIMITER.configure(self.rate_limit_key, rpm=self.config.rpm, tpm=self.config.tpm)
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
-    @retry(
-        reraise=True,
-        stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        retry=retry_if_not_exception_type(
-            (
-                litellm.exceptions.UnsupportedParamsError,
-                litellm.exceptions.NotFoundError,
-                litellm.exceptions.PermissionDeniedError,
-                litellm.exceptions.ContextWindowExceededError,
-                litellm.exceptions.APIError,
-                litellm.exceptions.AuthenticationError,
-                KeyboardInterrupt,
-            )
-        ),
-    )
+    @property
+    def rate_limit_key(self) -> str:
+        return self.config.model_name
+
+    @_retry
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
+        start_time = time.perf_counter()
         try:
+            if self.config.stream:
+                return self._query_streaming(messages, **kwargs)
             return litellm.completion(
                 model=self.config.model_name, messages=messages, **(self.config.model_kwargs | kwargs)
             )
         except litellm.exceptions.AuthenticationError as e:
             e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
             raise e
+        finally:
+            GLOBAL_MODEL_STATS.record_latency(time.perf_counter() - start_time)
 
-    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+    @_retry
+    @GLOBAL_RATE_LIMITER.limit
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        start_time = time.perf_counter()
+        try:
+            if self.config.stream:
+                return await asyncio.to_thread(self._query_streaming, messages, **kwargs)
+            return await litellm.acompletion(
+                model=self.config.model_name, messages=messages, **(self.config.model_kwargs | kwargs)
+            )
+        except litellm.exceptions.AuthenticationError as e:
+            e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
+            raise e
+        finally:
+            GLOBAL_MODEL_STATS.record_latency(time.perf_counter() - start_time)
+
+    def _query_streaming(self, messages: list[dict[str, str]], **kwargs):
+        start_time = time.time()
+        stream = litellm.completion(
+            model=self.config.model_name, messages=messages, stream=True, **(self.config.model_kwargs | kwargs)
+        )
+        chunks = []
+
+        def deltas():
+            for chunk in stream:
+                chunks.append(chunk)
+                yield (chunk.choices[0].delta.content or "") if chunk.choices else ""
+
+        text, stats = consume_stream(deltas(), stop_regex=self.config.stream_stop_regex, start_time=start_time)
+        if stats["stopped_early"] and hasattr(stream.completion_stream, "close"):
+            stream.completion_stream.close()  # stops generation
+        response = litellm.stream_chunk_builder(chunks, messages=messages)
+        response.choices[0].message.content = text  # type: ignore[union-attr]
+        response.streaming = stats  # type: ignore[union-attr]
+        return response
+
+    def _prepare_messages(self, messages: list[dict[str, str]]) -> list[dict[str, str]]:
         if self.config.set_cache_control:
             messages = set_cache_control(messages, mode=self.config.set_cache_control)
-        response = self._query([{"role": msg["role"], "content": msg["content"]} for msg in messages], **kwargs)
+        return [
+            {key: msg[key] for key in ("role", "content", "tool_calls", "tool_call_id") if key in msg}
+            for msg in messages
+        ]
+
+    def _process_response(self, response) -> dict:
+        """Update cost and call counters and convert the response to the message format of the agent."""
         try:
             cost = litellm.cost_calculator.completion_cost(response, model=self.config.model_name)
             if cost <= 0.0:
@@ -97,12 +177,22 @@ class LitellmModel:
         self.n_calls += 1
         self.cost += cost
         GLOBAL_MODEL_STATS.add(cost)
-        return {
+        result = {
             "content": response.choices[0].message.content or "",  # type: ignore
             "extra": {
                 "response": response.model_dump(),
             },
         }
+        if tool_calls := get_tool_calls(response):
+            result["tool_calls"] = tool_calls
+        return result
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        return self._process_response(self._query(self._prepare_messages(messages), **kwargs))
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Async version of `query` (using `litellm.acompletion`)."""
+        return self._process_response(await self._aquery(self._prepare_messages(messages), **kwargs))
 
     def get_template_vars(self) -> dict[str, Any]:
         return self.config.model_dump() | {"n_model_calls": self.n_calls, "model_cost": self.cost}
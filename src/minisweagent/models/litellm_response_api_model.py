@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from collections.abc import Callable
 
@@ -7,12 +8,12 @@ from tenacity import (
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.litellm_model import LitellmModel, LitellmModelConfig
 from minisweagent.models.utils.openai_utils import coerce_responses_text
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
 
 logger = logging.getLogger("litellm_response_api_model")
 
@@ -29,7 +30,7 @@ class LitellmResponseAPIModel(LitellmModel):
     @retry(
         reraise=True,
         stop=stop_after_attempt(10),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         retry=retry_if_not_exception_type(
             (
@@ -43,6 +44,7 @@ class LitellmResponseAPIModel(LitellmModel):
             )
         ),
     )
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
         try:
             # Remove 'timestamp' field added by agent - not supported by OpenAI responses API
@@ -77,3 +79,7 @@ class LitellmResponseAPIModel(LitellmModel):
         return {
             "content": text,
         }
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        # litellm's chat completion API doesn't apply here, so run the sync query in a worker thread
+        return await asyncio.to_thread(self.query, messages, **kwargs)
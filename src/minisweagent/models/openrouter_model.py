@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import time
 from typing import Any, Literal
 
 import requests
@@ -10,11 +11,12 @@ from tenacity import (
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.utils.cache_control import set_cache_control
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
+from minisweagent.models.utils.streaming import build_response_from_sse
 
 logger = logging.getLogger("openrouter_model")
 
@@ -26,6 +28,14 @@ class OpenRouterModelConfig(BaseModel):
     """Set explicit cache control markers, for example for Anthropic models"""
     cost_tracking: Literal["default", "ignore_errors"] = os.getenv("MSWEA_COST_TRACKING", "default")  # type: ignore[assignment]
     """Cost tracking mode for this model. Can be "default" or "ignore_errors" (ignore errors/missing cost info)"""
+    stream: bool = False
+    """Stream the response. Time to first token and time to action are reported in `extra.response.streaming`."""
+    stream_stop_regex: str = r"```bash\s*\n(.*?)\n```"
+    """When streaming, stop generation as soon as this regex matches (i.e., the action is complete)."""
+    rpm: int = int(os.getenv("MSWEA_MODEL_RPM", "0"))
+    """Requests per minute, shared by all instances of this model in the process (0: unlimited)"""
+    tpm: int = int(os.getenv("MSWEA_MODEL_TPM", "0"))
+    """Tokens per minute, shared by all instances of this model in the process (0: unlimited)"""
 
 
 class OpenRouterAPIError(Exception):
@@ -51,13 +61,16 @@ class OpenRouterModel:
         self.config = OpenRouterModelConfig(**kwargs)
         self.cost = 0.0
         self.n_calls = 0
+        self.retry_wait_time = 0.0
+        """Total time spent waiting for rate limit capacity (seconds)."""
+        GLOBAL_RATE_LIMITER.configure(self.rate_limit_key, rpm=self.config.rpm, tpm=self.config.tpm)
         self._api_url = "https://openrouter.ai/api/v1/chat/completions"
         self._api_key = os.getenv("OPENROUTER_API_KEY", "")
 
     @retry(
         reraise=True,
         stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         retry=retry_if_not_exception_type(
             (
@@ -66,6 +79,7 @@ class OpenRouterModel:
             )
         ),
     )
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
         headers = {
             "Authorization": f"Bearer {self._api_key}",
@@ -76,12 +90,24 @@ class OpenRouterModel:
             "model": self.config.model_name,
             "messages": messages,
             "usage": {"include": True},
+            **({"stream": True} if self.config.stream else {}),
             **(self.config.model_kwargs | kwargs),
         }
 
+        start_time = time.time()
         try:
-            response = requests.post(self._api_url, headers=headers, data=json.dumps(payload), timeout=60)
+            response = requests.post(
+                self._api_url, headers=headers, data=json.dumps(payload), timeout=60, stream=self.config.stream
+            )
             response.raise_for_status()
+            if self.config.stream:
+                return build_response_from_sse(
+                    response,
+                    stop_regex=self.config.stream_stop_regex,
+                    start_time=start_time,
+                    messages=messages,
+                    cost_model_name=f"openrouter/{self.config.model_name}",
+                )
             return response.json()
         except requests.exceptions.HTTPError as e:
             if response.status_code == 401:
@@ -94,6 +120,10 @@ class OpenRouterModel:
         except requests.exceptions.RequestException as e:
             raise OpenRouterAPIError(f"Request failed: {e}") from e
 
+    @property
+    def rate_limit_key(self) -> str:
+        return f"openrouter/{self.config.model_name}"
+
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         if self.config.set_cache_control:
             messages = set_cache_control(messages, mode=self.config.set_cache_control)
@@ -11,11 +11,11 @@ from tenacity import (
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.utils.cache_control import set_cache_control
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
 
 logger = logging.getLogger("portkey_model")
 
@@ -43,6 +43,10 @@ class PortkeyModelConfig(BaseModel):
     """Set explicit cache control markers, for example for Anthropic models"""
     cost_tracking: Literal["default", "ignore_errors"] = os.getenv("MSWEA_COST_TRACKING", "default")  # type: ignore[assignment]
     """Cost tracking mode for this model. Can be "default" or "ignore_errors" (ignore errors/missing cost info)"""
+    rpm: int = int(os.getenv("MSWEA_MODEL_RPM", "0"))
+    """Requests per minute, shared by all instances of this model in the process (0: unlimited)"""
+    tpm: int = int(os.getenv("MSWEA_MODEL_TPM", "0"))
+    """Tokens per minute, shared by all instances of this model in the process (0: unlimited)"""
 
 
 class PortkeyModel:
@@ -50,6 +54,9 @@ class PortkeyModel:
         self.config = config_class(**kwargs)
         self.cost = 0.0
         self.n_calls = 0
+        self.retry_wait_time = 0.0
+        """Total time spent waiting for rate limit capacity (seconds)."""
+        GLOBAL_RATE_LIMITER.configure(self.rate_limit_key, rpm=self.config.rpm, tpm=self.config.tpm)
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
@@ -75,10 +82,11 @@ class PortkeyModel:
     @retry(
         reraise=True,
         stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         retry=retry_if_not_exception_type((KeyboardInterrupt, TypeError, ValueError)),
     )
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
         # return self.client.with_options(metadata={"request_id": request_id}).chat.completions.create(
         return self.client.chat.completions.create(
@@ -103,6 +111,10 @@ class PortkeyModel:
             },
         }
 
+    @property
+    def rate_limit_key(self) -> str:
+        return f"portkey/{self.config.model_name}"
+
     def get_template_vars(self) -> dict[str, Any]:
         return self.config.model_dump() | {"n_model_calls": self.n_calls, "model_cost": self.cost}
 
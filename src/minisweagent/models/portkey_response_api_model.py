@@ -7,13 +7,13 @@ from tenacity import (
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.portkey_model import PortkeyModel, PortkeyModelConfig
 from minisweagent.models.utils.cache_control import set_cache_control
 from minisweagent.models.utils.openai_utils import coerce_responses_text
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
 
 logger = logging.getLogger("portkey_response_api_model")
 
@@ -30,10 +30,11 @@ class PortkeyResponseAPIModel(PortkeyModel):
     @retry(
         reraise=True,
         stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         retry=retry_if_not_exception_type((KeyboardInterrupt, TypeError, ValueError)),
     )
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
         input_messages = messages if self._previous_response_id is None else messages[-1:]
         resp = self.client.responses.create(  # type: ignore[call-overload]
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import time
 from typing import Any
 
 import requests
@@ -10,10 +11,11 @@ from tenacity import (
     retry,
     retry_if_not_exception_type,
     stop_after_attempt,
-    wait_exponential,
 )
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
+from minisweagent.models.utils.rate_limit import wait_unless_rate_limited
+from minisweagent.models.utils.streaming import build_response_from_sse
 
 logger = logging.getLogger("requesty_model")
 
@@ -21,6 +23,14 @@ logger = logging.getLogger("requesty_model")
 class RequestyModelConfig(BaseModel):
     model_name: str
     model_kwargs: dict[str, Any] = {}
+    stream: bool = False
+    """Stream the response. Time to first token and time to action are reported in `extra.response.streaming`."""
+    stream_stop_regex: str = r"```bash\s*\n(.*?)\n```"
+    """When streaming, stop generation as soon as this regex matches (i.e., the action is complete)."""
+    rpm: int = int(os.getenv("MSWEA_MODEL_RPM", "0"))
+    """Requests per minute, shared by all instances of this model in the process (0: unlimited)"""
+    tpm: int = int(os.getenv("MSWEA_MODEL_TPM", "0"))
+    """Tokens per minute, shared by all instances of this model in the process (0: unlimited)"""
 
 
 class RequestyAPIError(Exception):
@@ -46,13 +56,16 @@ class RequestyModel:
         self.config = RequestyModelConfig(**kwargs)
         self.cost = 0.0
         self.n_calls = 0
+        self.retry_wait_time = 0.0
+        """Total time spent waiting for rate limit capacity (seconds)."""
+        GLOBAL_RATE_LIMITER.configure(self.rate_limit_key, rpm=self.config.rpm, tpm=self.config.tpm)
         self._api_url = "https://router.requesty.ai/v1/chat/completions"
         self._api_key = os.getenv("REQUESTY_API_KEY", "")
 
     @retry(
         reraise=True,
         stop=stop_after_attempt(10),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
+        wait=wait_unless_rate_limited(multiplier=1, min=4, max=60),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         retry=retry_if_not_exception_type(
             (
@@ -61,6 +74,7 @@ class RequestyModel:
             )
         ),
     )
+    @GLOBAL_RATE_LIMITER.limit
     def _query(self, messages: list[dict[str, str]], **kwargs):
         headers = {
             "Authorization": f"Bearer {self._api_key}",
@@ -72,12 +86,24 @@ class RequestyModel:
         payload = {
             "model": self.config.model_name,
             "messages": messages,
+            **({"stream": True} if self.config.stream else {}),
             **(self.config.model_kwargs | kwargs),
         }
 
+        start_time = time.time()
         try:
-            response = requests.post(self._api_url, headers=headers, data=json.dumps(payload), timeout=60)
+            response = requests.post(
+                self._api_url, headers=headers, data=json.dumps(payload), timeout=60, stream=self.config.stream
+            )
             response.raise_for_status()
+            if self.config.stream:
+                return build_response_from_sse(
+                    response,
+                    stop_regex=self.config.stream_stop_regex,
+                    start_time=start_time,
+                    messages=messages,
+                    cost_model_name=self.config.model_name,
+                )
             return response.json()
         except requests.exceptions.HTTPError as e:
             if response.status_code == 401:
@@ -90,6 +116,10 @@ class RequestyModel:
         except requests.exceptions.RequestException as e:
             raise RequestyAPIError(f"Request failed: {e}") from e
 
+    @property
+    def rate_limit_key(self) -> str:
+        return f"requesty/{self.config.model_name}"
+
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         response = self._query([{"role": msg["role"], "content": msg["content"]} for msg in messages], **kwargs)
 
@@ -5,7 +5,7 @@ import litellm
 from minisweagent.models import GLOBAL_MODEL_STATS
 from minisweagent.models.litellm_model import LitellmModel
 from minisweagent.models.utils.cache_control import set_cache_control
-from minisweagent.models.utils.openai_utils import coerce_responses_text
+from minisweagent.models.utils.openai_utils import coerce_responses_text, get_tool_calls
 
 logger = logging.getLogger("robust_litellm_model")
 
@@ -23,16 +23,14 @@ class RobustLitellmModel(LitellmModel):
         valid_keys = {"role", "content", "name", "tool_calls", "tool_call_id"}
         return {k: v for k, v in message.items() if k in valid_keys}
 
-    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+    def _prepare_messages(self, messages: list[dict[str, str]]) -> list[dict[str, str]]:
         if self.config.set_cache_control:
             messages = set_cache_control(messages, mode=self.config.set_cache_control)
 
         # Clean messages before sending
-        cleaned_messages = [self._clean_message(m) for m in messages]
-
-        # Call the parent's internal _query method with cleaned messages
-        response = self._query(cleaned_messages, **kwargs)
+        return [self._clean_message(m) for m in messages]
 
+    def _process_response(self, response) -> dict:
         # Match stock LitellmModel behavior first (chat-completions shape),
         # then fall back to Responses API extraction.
         text = ""
@@ -40,7 +38,8 @@ class RobustLitellmModel(LitellmModel):
             text = response.choices[0].message.content or ""  # type: ignore[attr-defined]
         except Exception:
             text = ""
-        if not text:
+        tool_calls = get_tool_calls(response)
+        if not text and not tool_calls:
             text = coerce_responses_text(response)
 
         # Robust cost calculation
@@ -64,10 +63,13 @@ class RobustLitellmModel(LitellmModel):
         model_dump = getattr(response, "model_dump", None)
         dumped_response = model_dump() if callable(model_dump) else {}
 
-        return {
+        result = {
             "content": text,
             "extra": {
                 "response": dumped_response,
                 "cost": cost,
             },
         }
+        if tool_calls:
+            result["tool_calls"] = tool_calls
+        return result
@@ -39,3 +39,14 @@ def coerce_responses_text(resp: Any) -> str:
     except (AttributeError, IndexError, TypeError):
         logger.warning(f"Could not extract text from response: {resp}")
         return ""
+
+
+def get_tool_calls(resp: Any) -> list[dict]:
+    """Tool calls of the first choice of a chat completion response, as dicts (empty if there are none)."""
+    try:
+        tool_calls = resp.choices[0].message.tool_calls
+    except (AttributeError, IndexError, TypeError):
+        return []
+    if not isinstance(tool_calls, list):
+        return []
+    return [call.model_dump() if hasattr(call, "model_dump") else dict(call) for call in tool_calls]
@@ -0,0 +1,278 @@
+"""Process-wide rate limiting of model calls.
+
+All model instances that talk to the same model (e.g., the models of all worker threads of a batch run)
+share the limits of one key in `GLOBAL_RATE_LIMITER`:
+
+* Requests and tokens per minute (token buckets, only if `rpm`/`tpm` are configured).
+* When the provider rejects a call because of rate limits, the key is blocked for all callers
+  (for `Retry-After` seconds if the provider sends it, else with exponential backoff). Waiting callers
+  are spread over a jittered window after the block, so that they don't hit the API all at once.
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from tenacity import RetryCallState, wait_exponential
+
+logger = logging.getLogger("minisweagent.rate_limit")
+
+
+def iter_exception_chain(exception: BaseException | None) -> Iterator[BaseException]:
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        yield exception
+        exception = exception.__cause__ or exception.__context__
+
+
+def _status_code(exception: BaseException) -> int | None:
+    if isinstance(status_code := getattr(exception, "status_code", None), int):
+        return status_code
+    return getattr(getattr(exception, "response", None), "status_code", None)
+
+
+def is_rate_limit_error(exception: BaseException | None) -> bool:
+    """Whether the provider rejected the call because of rate limits or because it is overloaded."""
+    for exc in iter_exception_chain(exception):
+        if _status_code(exc) in (429, 529) or "RateLimit" in type(exc).__name__:
+            return True
+        if "overloaded" in str(exc).lower():
+            return True
+    return False
+
+
+def get_retry_after(exception: BaseException | None) -> float | None:
+    """Seconds to wait according to the `Retry-After` (or `retry-after-ms`) header of the error response."""
+    for exc in iter_exception_chain(exception):
+        headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(
+            exc, "litellm_response_headers", None
+        )
+        if not headers:
+            continue
+        try:
+            if (value := headers.get("retry-after-ms")) is not None:
+                return max(float(value) / 1000, 0.0)
+            if (value := headers.get("retry-after")) is not None:
+                try:
+                    return max(float(value), 0.0)
+                except ValueError:
+                    return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class wait_unless_rate_limited(wait_exponential):
+    """Exponential backoff between retries, except after rate limit errors
+    (the `RateLimiter` makes the next attempt wait for those).
+    """
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        if retry_state.outcome is not None and is_rate_limit_error(retry_state.outcome.exception()):
+            return 0.0
+        return super().__call__(retry_state)
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough number of prompt tokens (4 characters per token)."""
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+
+def get_total_tokens(response: Any) -> int | None:
+    """Total tokens of a response (a dict from a plain HTTP API or a response object), None if not reported."""
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    total_tokens = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    return total_tokens if isinstance(total_tokens, int) else None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` (possibly going into debt) and return the seconds until it is covered."""
+        self._refill(now)
+        self.tokens -= amount
+        return max(-self.tokens / self.rate, 0.0)
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Take (or give back, if negative) `amount` without waiting, e.g., to correct an estimate."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass
+class _KeyState:
+    requests: TokenBucket | None = None
+    tokens: TokenBucket | None = None
+    blocked_until: float = 0.0
+    block_duration: float = 0.0
+    n_consecutive_rate_limits: int = 0
+
+
+class Request:
+    """A call that acquired capacity (see `RateLimiter.request`)."""
+
+    def __init__(self, key: str, estimated_tokens: int, wait_time: float):
+        self.key = key
+        self.estimated_tokens = estimated_tokens
+        self.wait_time = wait_time
+        """Seconds that the call waited for capacity."""
+        self.used_tokens: int | None = None
+        """Set to the actual number of tokens of the call to correct the token bucket."""
+
+
+class RateLimiter:
+    def __init__(self, *, base_backoff: float = 4.0, max_backoff: float = 60.0, jitter: float = 0.5, stats: Any = None):
+        """Rate limits of all model calls of the process, per key (model name, prefixed with the provider
+        for models that don't go through litellm).
+
+        Args:
+            base_backoff: Seconds to block a key after the first rate limit error (without `Retry-After`),
+                doubled with every consecutive rate limit error.
+            max_backoff: Upper bound of the backoff.
+            jitter: Waiting callers are spread over this fraction of the block after it ends.
+            stats: `GlobalModelStats` that record rate limit errors and the time spent waiting for capacity.
+        """
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._keys: dict[str, _KeyState] = {}
+
+    def _state(self, key: str) -> _KeyState:
+        return self._keys.setdefault(key, _KeyState())
+
+    def configure(self, key: str, *, rpm: float = 0, tpm: float = 0) -> None:
+        """Set the requests and tokens per minute of `key` (0: unlimited). Keeps the buckets if they are unchanged."""
+        with self._lock:
+            state = self._state(key)
+            if (state.requests.capacity if state.requests else 0) != rpm:
+                state.requests = TokenBucket(rpm) if rpm else None
+            if (state.tokens.capacity if state.tokens else 0) != tpm:
+                state.tokens = TokenBucket(tpm) if tpm else None
+
+    def reserve(self, key: str, tokens: int = 0) -> float:
+        """Reserve capacity for one call and return the seconds to wait before sending it."""
+        with self._lock:
+            state = self._state(key)
+            now = time.monotonic()
+            wait = 0.0
+            if state.blocked_until > now:
+                wait = state.blocked_until - now + random.uniform(0, self.jitter * state.block_duration)
+            if state.requests is not None:
+                wait = max(wait, state.requests.reserve(1, now))
+            if state.tokens is not None and tokens:
+                wait = max(wait, state.tokens.reserve(tokens, now))
+            return wait
+
+    def on_rate_limit(self, key: str, retry_after: float | None = None) -> float:
+        """Block `key` after the provider rejected a call. Returns the seconds for which it is blocked."""
+        if self.stats is not None:
+            self.stats.record_rate_limit()
+        with self._lock:
+            state = self._state(key)
+            state.n_consecutive_rate_limits += 1
+            if retry_after is None:
+                retry_after = min(self.base_backoff * 2 ** (state.n_consecutive_rate_limits - 1), self.max_backoff)
+            now = time.monotonic()
+            if now + retry_after > state.blocked_until:
+                state.blocked_until = now + retry_after
+                state.block_duration = retry_after
+        logger.warning(f"Rate limited on {key}, pausing all calls for {retry_after:.1f}s")
+        return retry_after
+
+    def on_success(self, key: str) -> None:
+        with self._lock:
+            self._state(key).n_consecutive_rate_limits = 0
+
+    def _finish(self, request: Request, exception: BaseException | None) -> None:
+        """Correct the token estimate (failed calls don't use tokens) and handle rate limit errors."""
+        used_tokens = request.used_tokens if exception is None else 0
+        if used_tokens is not None and request.estimated_tokens != used_tokens:
+            with self._lock:
+                if (bucket := self._state(request.key).tokens) is not None:
+                    bucket.adjust(used_tokens - request.estimated_tokens, time.monotonic())
+        if exception is None:
+            self.on_success(request.key)
+        elif is_rate_limit_error(exception):
+            self.on_rate_limit(request.key, get_retry_after(exception))
+
+    def _start(self, key: str, tokens: int, wait: float) -> Request:
+        if self.stats is not None:
+            self.stats.record_queue_wait(wait)
+        return Request(key, tokens, wait)
+
+    @contextlib.contextmanager
+    def request(self, key: str, tokens: int = 0) -> Iterator[Request]:
+        """Wait for capacity for one call of `key` with about `tokens` tokens, then run the body (the call).
+        Rate limit errors of the call block the key for all callers.
+        """
+        wait = self.reserve(key, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        request = self._start(key, tokens, wait)
+        try:
+            yield request
+        except BaseException as e:
+            self._finish(request, e)
+            raise
+        self._finish(request, None)
+
+    @contextlib.asynccontextmanager
+    async def arequest(self, key: str, tokens: int = 0) -> AsyncIterator[Request]:
+        """Async version of `request`."""
+        wait = self.reserve(key, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        request = self._start(key, tokens, wait)
+        try:
+            yield request
+        except BaseException as e:
+            self._finish(request, e)
+            raise
+        self._finish(request, None)
+
+    def limit(self, func: Callable) -> Callable:
+        """Decorator for the `_query` methods of models (sync or async, below the retry decorator):
+        Every attempt waits for capacity of `model.rate_limit_key` and the wait is added to `model.retry_wait_time`.
+        """
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(model, messages: list[dict], *args, **kwargs):
+                async with self.arequest(model.rate_limit_key, estimate_tokens(messages)) as request:
+                    model.retry_wait_time += request.wait_time
+                    response = await func(model, messages, *args, **kwargs)
+                    request.used_tokens = get_total_tokens(response)
+                    return response
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(model, messages: list[dict], *args, **kwargs):
+            with self.request(model.rate_limit_key, estimate_tokens(messages)) as request:
+                model.retry_wait_time += request.wait_time
+                response = func(model, messages, *args, **kwargs)
+                request.used_tokens = get_total_tokens(response)
+                return response
+
+        return wrapper
@@ -0,0 +1,87 @@
+"""Helpers for streaming model responses and stopping generation early,
+e.g., as soon as the closing fence of the action block has arrived.
+"""
+
+import json
+import re
+import time
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import litellm
+import requests
+
+
+def _closing_literal(regex: str) -> str:
+    """The literal text that every match of `regex` ends with (e.g., the closing fence of the action block).
+    Empty if there is none (or it can't be determined easily).
+    """
+    if "|" in regex or re.compile(regex).flags & re.IGNORECASE:
+        return ""
+    match = re.search(r"(?<!\\)(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])+$", regex)
+    return re.sub(r"\\(.)", r"\1", match.group()) if match else ""
+
+
+def consume_stream(deltas: Iterable[str], *, stop_regex: str, start_time: float) -> tuple[str, dict[str, Any]]:
+    """Concatenate streamed text deltas until the stream ends or `stop_regex` matches.
+
+    Returns the text (truncated to the end of the match) and stats with times relative to `start_time`.
+    """
+    text, stats = "", {"time_to_first_token": None, "time_to_action": None, "stopped_early": False}
+    pattern = re.compile(stop_regex, re.DOTALL) if stop_regex else None
+    closing = _closing_literal(stop_regex) if stop_regex else ""
+    for delta in deltas:
+        if not delta:
+            continue
+        if stats["time_to_first_token"] is None:
+            stats["time_to_first_token"] = time.time() - start_time
+        text += delta
+        if pattern is None:
+            continue
+        # A new match ends in this delta, so there is none unless the delta completes the closing literal
+        # (this avoids searching the whole text again for every delta)
+        if closing and closing not in text[max(0, len(text) - len(delta) - len(closing) + 1) :]:
+            continue
+        if match := pattern.search(text):
+            text, stats["stopped_early"] = text[: match.end()], True
+            break
+    stats["time_to_action"] = time.time() - start_time
+    return text, stats
+
+
+def iter_sse_data(response: requests.Response) -> Iterator[dict]:
+    """Iterate over the JSON payloads of an (OpenAI-compatible) server-sent events stream."""
+    for line in response.iter_lines():
+        if line.startswith(b"data: ") and line != b"data: [DONE]":
+            yield json.loads(line[len(b"data: ") :])
+
+
+def build_response_from_sse(
+    response: requests.Response, *, stop_regex: str, start_time: float, messages: list[dict], cost_model_name: str
+) -> dict:
+    """Consume a server-sent events stream and return it as a (non-streaming) chat completion dict.
+
+    If the stream is stopped before the provider reports usage, the cost is estimated from token counts.
+    """
+    chunks = []
+
+    def deltas():
+        for chunk in iter_sse_data(response):
+            chunks.append(chunk)
+            if chunk.get("choices"):
+                yield chunk["choices"][0].get("delta", {}).get("content") or ""
+
+    text, stats = consume_stream(deltas(), stop_regex=stop_regex, start_time=start_time)
+    response.close()
+    usage = next((chunk["usage"] for chunk in reversed(chunks) if chunk.get("usage")), None)
+    if usage is None:
+        try:
+            usage = {"cost": litellm.completion_cost(model=cost_model_name, messages=messages, completion=text)}
+        except Exception:
+            usage = {}
+    return {
+        "id": chunks[0].get("id") if chunks else None,
+        "choices": [{"message": {"role": "assistant", "content": text}}],
+        "usage": usage,
+        "streaming": stats,
+    }
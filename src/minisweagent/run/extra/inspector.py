@@ -17,6 +17,7 @@ from textual.containers import Container, Vertical, VerticalScroll
 from textual.widgets import Footer, Header, Static
 
 from minisweagent.agents.interactive_textual import _messages_to_steps
+from minisweagent.run.utils.save import load_traj
 
 app = typer.Typer(rich_markup_mode="rich", add_completion=False)
 
@@ -98,7 +99,7 @@ class TrajectoryInspector(App):
 
         trajectory_file = self.trajectory_files[self.i_trajectory]
         try:
-            data = json.loads(trajectory_file.read_text())
+            data = load_traj(trajectory_file)
 
             if isinstance(data, list):
                 self.messages = data
@@ -196,7 +197,7 @@ def main(
     if path_obj.is_file():
         trajectory_files = [path_obj]
     elif path_obj.is_dir():
-        trajectory_files = sorted(path_obj.rglob("*.traj.json"))
+        trajectory_files = sorted([*path_obj.rglob("*.traj.json"), *path_obj.rglob("*.traj.jsonl")])
         if not trajectory_files:
             raise typer.BadParameter(f"No trajectory files found in '{path}'")
     else:
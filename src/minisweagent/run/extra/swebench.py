@@ -3,28 +3,55 @@
 """Run mini-SWE-agent on SWE-bench instances in batch mode."""
 # Read this first: https://mini-swe-agent.com/latest/usage/swebench/  (usage docs)
 
+import asyncio
 import concurrent.futures
-import json
+import contextlib
+import heapq
+import os
 import random
 import re
-import threading
 import time
 import traceback
+from collections.abc import Iterator
 from pathlib import Path
 
 import typer
 import yaml
 from datasets import load_dataset
-from jinja2 import StrictUndefined, Template
-from rich.live import Live
 
-from minisweagent import Environment
-from minisweagent.agents.default import DefaultAgent
+from minisweagent import Environment, Model
+from minisweagent.agents.async_default import AsyncDefaultAgent
+from minisweagent.agents.default import DefaultAgent, get_template
 from minisweagent.config import builtin_config_dir, get_config_path
-from minisweagent.environments import get_environment
+from minisweagent.environments import get_environment, get_environment_class
 from minisweagent.models import get_model
 from minisweagent.run.extra.utils.batch_progress import RunBatchProgressManager
-from minisweagent.run.utils.save import save_traj
+from minisweagent.run.extra.utils.concurrency import ConcurrencyController
+from minisweagent.run.extra.utils.image_prefetch import ImagePrefetcher
+from minisweagent.run.extra.utils.instance_store import InstanceStore
+from minisweagent.run.extra.utils.metrics import MetricsRenderer
+from minisweagent.run.extra.utils.preds_journal import PredsJournal, read_journals
+from minisweagent.run.extra.utils.progress_events import (
+    JsonlRenderer,
+    LogRenderer,
+    ProgressEventBus,
+    ProgressRenderer,
+    ProgressReporter,
+    RichRenderer,
+)
+from minisweagent.run.extra.utils.requeue import RequeuePolicy
+from minisweagent.run.extra.utils.run_manifest import (
+    FAILED_AGENT,
+    FAILED_INFRA,
+    FAILED_STATES,
+    FINISHED_STATES,
+    SAVED,
+    RunManifest,
+)
+from minisweagent.run.extra.utils.scheduling import DurationEstimates, Schedule
+from minisweagent.run.extra.utils.work_queue import WorkQueue
+from minisweagent.run.utils.checkpoint import CheckpointWriter, load_checkpoint, restore_checkpoint
+from minisweagent.run.utils.save import TrajectoryWriter, save_traj
 from minisweagent.utils.log import add_file_handler, logger
 
 _HELP_TEXT = """Run mini-SWE-agent on SWEBench instances.
@@ -46,25 +73,48 @@ DATASET_MAPPING = {
     "_test": "klieret/swe-bench-dummy-test-dataset",
 }
 
-
-_OUTPUT_FILE_LOCK = threading.Lock()
+_QUEUE_POLL_INTERVAL = 5.0
+"""Seconds between checks for requeued instances of the work queue that became claimable."""
 
 
 class ProgressTrackingAgent(DefaultAgent):
-    """Simple wrapper around DefaultAgent that provides progress updates."""
-
-    def __init__(self, *args, progress_manager: RunBatchProgressManager, instance_id: str = "", **kwargs):
+    """Simple wrapper around DefaultAgent that provides progress updates and checkpoints."""
+
+    def __init__(
+        self,
+        *args,
+        progress_manager: ProgressReporter,
+        instance_id: str = "",
+        checkpoint_path: Path | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
-        self.progress_manager: RunBatchProgressManager = progress_manager
+        self.progress_manager: ProgressReporter = progress_manager
         self.instance_id = instance_id
+        self.checkpoint_writer = CheckpointWriter(checkpoint_path) if checkpoint_path is not None else None
 
     def step(self) -> dict:
-        """Override step to provide progress updates."""
+        """Override step to provide progress updates and to checkpoint the state after the previous step."""
         self.progress_manager.update_instance_status(
             self.instance_id, f"Step {self.model.n_calls + 1:3d} (${self.model.cost:.2f})"
         )
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.save(self)
         return super().step()
 
+    @contextlib.contextmanager
+    def execution_context(self, action: dict) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            with super().execution_context(action):
+                yield
+        finally:
+            self.progress_manager.on_action_executed(self.instance_id, time.perf_counter() - start_time)
+
+
+class AsyncProgressTrackingAgent(ProgressTrackingAgent, AsyncDefaultAgent):
+    """ProgressTrackingAgent for `--async` mode. `step` passes on the coroutine from `AsyncDefaultAgent.step`."""
+
 
 def get_swebench_docker_image_name(instance: dict) -> str:
     """Get the image name for a SWEBench instance."""
@@ -81,111 +131,661 @@ def get_sb_environment(config: dict, instance: dict) -> Environment:
     env_config = config.setdefault("environment", {})
     env_config["environment_class"] = env_config.get("environment_class", "docker")
     image_name = get_swebench_docker_image_name(instance)
-    if env_config["environment_class"] in ("docker", "podman"):
+    if env_config["environment_class"] in ("docker", "podman", "docker_api"):
         env_config["image"] = image_name
     elif env_config["environment_class"] == "singularity":
         env_config["image"] = "docker://" + image_name
     env = get_environment(env_config)
     if startup_command := config.get("run", {}).get("env_startup_command"):
-        startup_command = Template(startup_command, undefined=StrictUndefined).render(**instance)
+        startup_command = get_template(startup_command).render(**instance)
         out = env.execute(startup_command)
         if out["returncode"] != 0:
             raise RuntimeError(f"Error executing startup command: {out}")
     return env
 
 
-def update_preds_file(output_path: Path, instance_id: str, model_name: str, result: str):
-    """Update the output JSON file with results from a single instance."""
-    with _OUTPUT_FILE_LOCK:
-        output_data = {}
-        if output_path.exists():
-            output_data = json.loads(output_path.read_text())
-        output_data[instance_id] = {
-            "model_name_or_path": model_name,
-            "instance_id": instance_id,
-            "model_patch": result,
-        }
-        output_path.write_text(json.dumps(output_data, indent=2))
-
-
-def remove_from_preds_file(output_path: Path, instance_id: str):
-    """Remove an instance from the predictions file."""
-    if not output_path.exists():
-        return
-    with _OUTPUT_FILE_LOCK:
-        output_data = json.loads(output_path.read_text())
-        if instance_id in output_data:
-            del output_data[instance_id]
-            output_path.write_text(json.dumps(output_data, indent=2))
+def get_image_prefetcher(
+    config: dict, instances: list[dict], progress_manager: ProgressReporter
+) -> ImagePrefetcher | None:
+    """Start prefetching the images of the instances if `run.prefetch` is set (docker and podman only).
+    Not supported with a work queue (where the order of the instances is not known in advance).
+    """
+    prefetch_config = config.get("run", {}).get("prefetch")
+    env_config = config.get("environment", {})
+    environment_class = env_config.get("environment_class", "docker")
+    if not prefetch_config or not instances or environment_class not in ("docker", "podman"):
+        return None
+    default_executable = "podman" if environment_class == "podman" else os.getenv("MSWEA_DOCKER_EXECUTABLE", "docker")
+    return ImagePrefetcher(
+        [get_swebench_docker_image_name(instance) for instance in instances],
+        executable=env_config.get("executable", default_executable),
+        pull_timeout=env_config.get("pull_timeout", 600),
+        progress_manager=progress_manager,
+        **prefetch_config,
+    )
+
+
+def get_progress_event_bus(
+    n_instances: int,
+    *,
+    headless: bool = False,
+    jsonl_path: str = "",
+    metrics_port: int = 0,
+    metrics_file: str = "",
+    manifest: RunManifest | None = None,
+) -> ProgressEventBus:
+    """Show the progress in a live display (or, if `headless`, in periodic log lines) and optionally write
+    all progress events to `jsonl_path`. With `metrics_port` and/or `metrics_file`, metrics are exported in the
+    Prometheus text format (with the instance states from `manifest`).
+    """
+    renderers: list[ProgressRenderer] = [
+        LogRenderer(n_instances) if headless else RichRenderer(RunBatchProgressManager(n_instances))
+    ]
+    if jsonl_path:
+        renderers.append(JsonlRenderer(Path(jsonl_path)))
+    if metrics_port or metrics_file:
+        renderers.append(
+            MetricsRenderer(
+                n_instances,
+                manifest=manifest,
+                port=metrics_port or None,
+                path=Path(metrics_file) if metrics_file else None,
+            )
+        )
+    return ProgressEventBus(renderers)
+
+
+def get_concurrency_controller(config: dict, min_workers: int, workers: int) -> ConcurrencyController | None:
+    """Adapt the number of active workers between `min_workers` and `workers` (tuned with `run.concurrency`).
+    None if `min_workers` is not set (then `workers` instances run at a time).
+    """
+    if not 0 < min_workers < workers:
+        return None
+    return ConcurrencyController(min_workers, workers, **config.get("run", {}).get("concurrency", {})).start()
+
+
+def _record_result(
+    instance_id: str,
+    models: list[Model],
+    state: str,
+    exit_status: str,
+    result: str,
+    *,
+    journal: PredsJournal,
+    progress_manager: ProgressReporter,
+    manifest: RunManifest | None,
+    requeue_policy: RequeuePolicy | None,
+) -> float | None:
+    """Record the prediction and the final state of an instance, or requeue it after an infrastructure failure
+    (then returns the seconds after which it should be retried). The cost and steps of all `models` (one per attempt)
+    are added up.
+    """
+    if state == FAILED_INFRA and manifest is not None and requeue_policy is not None:
+        if (retry_delay := requeue_policy.delay(manifest.record_infra_failure(instance_id))) is not None:
+            logger.warning(f"Requeuing {instance_id} in {retry_delay:.0f}s after infrastructure failure: {exit_status}")
+            manifest.requeue(instance_id, reason=f"{exit_status}: {result}", delay=retry_delay)
+            progress_manager.on_instance_requeued(instance_id, exit_status)
+            return retry_delay
+    journal.add(instance_id, models[0].config.model_name, result)
+    if manifest is not None:
+        cost, n_steps = sum(model.cost for model in models), sum(model.n_calls for model in models)
+        manifest.finish(instance_id, state, exit_status=exit_status, cost=cost, n_steps=n_steps)
+    progress_manager.on_instance_end(instance_id, exit_status)
+    return None
+
+
+class _AgentRun:
+    """One run of an agent on an instance (or an attempt of it), shared by `process_instance`, `aprocess_instance`
+    and `_run_attempt`: prepares the output directory, loads the checkpoint (with `resume`), starts the agent and
+    saves its trajectory. An error in the `with` block is recorded as the outcome of the run instead of being raised:
+    `FAILED_INFRA` if it was raised in an `infra` block (e.g., starting the environment), else `FAILED_AGENT`.
+    """
+
+    def __init__(
+        self,
+        instance_id: str,
+        instance_dir: Path,
+        model: Model,
+        config: dict,
+        progress_manager: ProgressReporter,
+        *,
+        journal: PredsJournal,
+        resume: bool,
+        stream_traj: bool,
+        extra_info: dict | None = None,
+    ):
+        self.instance_id = instance_id
+        self.model = model
+        self.config = config
+        self.progress_manager = progress_manager
+        self.stream_traj = stream_traj
+        self.extra_info = extra_info or {}
+        self.checkpoint_path = instance_dir / f"{instance_id}.checkpoint.jsonl"
+        self.checkpoint = load_checkpoint(self.checkpoint_path) if resume else None
+        # avoid inconsistent state if something here fails and there's leftover previous files
+        journal.remove(instance_id)
+        for suffix in (".traj.json", ".traj.jsonl"):
+            (instance_dir / f"{instance_id}{suffix}").unlink(missing_ok=True)
+        self.traj_path = instance_dir / (f"{instance_id}.traj.jsonl" if stream_traj else f"{instance_id}.traj.json")
+        self.agent: ProgressTrackingAgent | None = None
+        self.state, self.exit_status, self.result = SAVED, "", ""
+        self._start_time = time.time()
+
+    def start_agent(self, agent_class: type[ProgressTrackingAgent], env: Environment) -> ProgressTrackingAgent:
+        """Start the agent in `env`. If there is a checkpoint, the caller restores it and continues the run."""
+        agent = agent_class(
+            self.model,
+            env,
+            progress_manager=self.progress_manager,
+            instance_id=self.instance_id,
+            checkpoint_path=self.checkpoint_path,
+            **self.config.get("agent", {}),
+        )
+        if self.stream_traj:
+            agent.trajectory_writer = TrajectoryWriter(self.traj_path, instance_id=self.instance_id)
+        if self.checkpoint is not None:
+            self.progress_manager.update_instance_status(self.instance_id, "Restoring checkpoint")
+        self.agent = agent
+        return agent
+
+    @contextlib.contextmanager
+    def infra(self) -> Iterator[None]:
+        """Errors in this block are infrastructure failures (so the instance can be requeued)."""
+        try:
+            yield
+        except Exception:
+            self.state = FAILED_INFRA
+            raise
+
+    def finish(self, exit_status: str, result: str) -> None:
+        self.exit_status, self.result = exit_status, result
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "_AgentRun":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        extra_info = {}
+        if isinstance(exc, Exception):
+            attempt = f" (attempt {self.extra_info['attempt']})" if "attempt" in self.extra_info else ""
+            logger.error(f"Error processing instance {self.instance_id}{attempt}: {exc}", exc_info=exc)
+            self.exit_status, self.result = type(exc).__name__, str(exc)
+            extra_info = {"traceback": "".join(traceback.format_exception(exc))}
+            if self.state != FAILED_INFRA:
+                self.state = FAILED_AGENT
+        save_traj(
+            self.agent,
+            self.traj_path,
+            exit_status=self.exit_status,
+            result=self.result,
+            extra_info=extra_info | {"instance_time": time.time() - self._start_time} | self.extra_info,
+            instance_id=self.instance_id,
+            print_fct=logger.info,
+        )
+        return isinstance(exc, Exception)
 
 
 def process_instance(
     instance: dict,
     output_dir: Path,
     config: dict,
-    progress_manager: RunBatchProgressManager,
-) -> None:
-    """Process a single SWEBench instance."""
+    progress_manager: ProgressReporter,
+    *,
+    preds_journal: PredsJournal | None = None,
+    image_prefetcher: ImagePrefetcher | None = None,
+    resume: bool = False,
+    stream_traj: bool = False,
+    manifest: RunManifest | None = None,
+    requeue_policy: RequeuePolicy | None = None,
+    attempt_journals: list[PredsJournal] | None = None,
+) -> float | None:
+    """Process a single SWEBench instance. With `resume`, continue from the last checkpoint (if any).
+    With `stream_traj`, the trajectory is streamed to `<instance_id>.traj.jsonl` while the agent runs.
+    The prediction is recorded in `preds_journal` (by default, the journal in `output_dir` is opened and compacted).
+    With `image_prefetcher`, a running prefetch of the image of the instance is awaited before starting the environment.
+    With `manifest`, the lifecycle state of the instance is recorded in the run manifest.
+    With `manifest` and `requeue_policy`, an instance whose environment could not be started is requeued instead:
+    Returns the seconds after which it should be retried (None if the instance is done).
+    With `attempt_journals`, the instance is run several times (see `process_attempts`).
+    """
+    if attempt_journals:
+        return process_attempts(
+            instance,
+            output_dir,
+            config,
+            progress_manager,
+            attempt_journals=attempt_journals,
+            preds_journal=preds_journal,
+            image_prefetcher=image_prefetcher,
+            resume=resume,
+            stream_traj=stream_traj,
+            manifest=manifest,
+            requeue_policy=requeue_policy,
+        )
     instance_id = instance["instance_id"]
-    instance_dir = output_dir / instance_id
-    # avoid inconsistent state if something here fails and there's leftover previous files
-    remove_from_preds_file(output_dir / "preds.json", instance_id)
-    (instance_dir / f"{instance_id}.traj.json").unlink(missing_ok=True)
+    journal = preds_journal or PredsJournal(output_dir / "preds.jsonl")
     model = get_model(config=config.get("model", {}))
-    task = instance["problem_statement"]
+    run = _AgentRun(
+        instance_id,
+        output_dir / instance_id,
+        model,
+        config,
+        progress_manager,
+        journal=journal,
+        resume=resume,
+        stream_traj=stream_traj,
+    )
 
     progress_manager.on_instance_start(instance_id)
     progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
+    if manifest is not None:
+        manifest.start(instance_id)
 
-    agent = None
-    extra_info = None
+    retry_delay = None
+    try:
+        with run:
+            with run.infra():
+                if image_prefetcher is not None:
+                    progress_manager.update_instance_status(instance_id, "Waiting for image prefetch")
+                    image_prefetcher.wait(get_swebench_docker_image_name(instance))
+                env_start_time = time.perf_counter()
+                env = get_sb_environment(config, instance)
+            progress_manager.on_env_started(instance_id, time.perf_counter() - env_start_time)
+            if manifest is not None:
+                manifest.env_ready(instance_id)
+            agent = run.start_agent(ProgressTrackingAgent, env)
+            if run.checkpoint is not None:
+                restore_checkpoint(agent, run.checkpoint)
+                run.finish(*agent.continue_run())
+            else:
+                run.finish(*agent.run(instance["problem_statement"]))
+        retry_delay = _record_result(
+            instance_id,
+            [model],
+            run.state,
+            run.exit_status,
+            run.result,
+            journal=journal,
+            progress_manager=progress_manager,
+            manifest=manifest,
+            requeue_policy=requeue_policy,
+        )
+    finally:
+        if preds_journal is None:
+            journal.close()
+        if image_prefetcher is not None:
+            image_prefetcher.release(get_swebench_docker_image_name(instance), requeued=retry_delay is not None)
+    return retry_delay
 
+
+async def aprocess_instance(
+    instance: dict,
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    preds_journal: PredsJournal | None = None,
+    image_prefetcher: ImagePrefetcher | None = None,
+    resume: bool = False,
+    stream_traj: bool = False,
+    manifest: RunManifest | None = None,
+    requeue_policy: RequeuePolicy | None = None,
+    attempt_journals: list[PredsJournal] | None = None,
+) -> float | None:
+    """Async version of `process_instance`. Only starting (and restoring) the environment is done in a worker thread
+    (all attempts of `process_attempts` run in a worker thread).
+    """
+    if attempt_journals:
+        return await asyncio.to_thread(
+            process_attempts,
+            instance,
+            output_dir,
+            config,
+            progress_manager,
+            attempt_journals=attempt_journals,
+            preds_journal=preds_journal,
+            image_prefetcher=image_prefetcher,
+            resume=resume,
+            stream_traj=stream_traj,
+            manifest=manifest,
+            requeue_policy=requeue_policy,
+        )
+    instance_id = instance["instance_id"]
+    journal = preds_journal or PredsJournal(output_dir / "preds.jsonl")
+    model = get_model(config=config.get("model", {}))
+    run = _AgentRun(
+        instance_id,
+        output_dir / instance_id,
+        model,
+        config,
+        progress_manager,
+        journal=journal,
+        resume=resume,
+        stream_traj=stream_traj,
+    )
+
+    progress_manager.on_instance_start(instance_id)
+    progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
+    if manifest is not None:
+        manifest.start(instance_id)
+
+    retry_delay = None
     try:
-        env = get_sb_environment(config, instance)
-        agent = ProgressTrackingAgent(
-            model,
-            env,
+        with run:
+            with run.infra():
+                if image_prefetcher is not None:
+                    progress_manager.update_instance_status(instance_id, "Waiting for image prefetch")
+                    await asyncio.to_thread(image_prefetcher.wait, get_swebench_docker_image_name(instance))
+                env_start_time = time.perf_counter()
+                env = await asyncio.to_thread(get_sb_environment, config, instance)
+            progress_manager.on_env_started(instance_id, time.perf_counter() - env_start_time)
+            if manifest is not None:
+                manifest.env_ready(instance_id)
+            agent = run.start_agent(AsyncProgressTrackingAgent, env)
+            if run.checkpoint is not None:
+                await asyncio.to_thread(restore_checkpoint, agent, run.checkpoint)
+                run.finish(*await agent.continue_run())
+            else:
+                run.finish(*await agent.run(instance["problem_statement"]))
+        retry_delay = _record_result(
+            instance_id,
+            [model],
+            run.state,
+            run.exit_status,
+            run.result,
+            journal=journal,
             progress_manager=progress_manager,
-            instance_id=instance_id,
-            **config.get("agent", {}),
+            manifest=manifest,
+            requeue_policy=requeue_policy,
         )
-        exit_status, result = agent.run(task)
-    except Exception as e:
-        logger.error(f"Error processing instance {instance_id}: {e}", exc_info=True)
-        exit_status, result = type(e).__name__, str(e)
-        extra_info = {"traceback": traceback.format_exc()}
     finally:
-        save_traj(
-            agent,
-            instance_dir / f"{instance_id}.traj.json",
-            exit_status=exit_status,
-            result=result,
-            extra_info=extra_info,
-            instance_id=instance_id,
-            print_fct=logger.info,
+        if preds_journal is None:
+            journal.close()
+        if image_prefetcher is not None:
+            await asyncio.to_thread(
+                image_prefetcher.release, get_swebench_docker_image_name(instance), requeued=retry_delay is not None
+            )
+    return retry_delay
+
+
+def _run_attempt(
+    k: int,
+    instance: dict,
+    env: Environment,
+    model: Model,
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    journal: PredsJournal,
+    resume: bool,
+    stream_traj: bool,
+) -> tuple[str, str, str]:
+    """Run attempt `k` of `process_attempts` in a fork of `env`. Returns the state, exit status and result."""
+    instance_id = instance["instance_id"]
+    run = _AgentRun(
+        instance_id,
+        output_dir / f"attempt_{k}" / instance_id,
+        model,
+        config,
+        progress_manager,
+        journal=journal,
+        resume=resume,
+        stream_traj=stream_traj,
+        extra_info={"attempt": k},
+    )
+    progress_manager.update_instance_status(instance_id, f"Attempt {k}: starting fork")
+    with run:
+        with run.infra():
+            fork = env.fork()  # type: ignore[attr-defined]
+        try:
+            agent = run.start_agent(ProgressTrackingAgent, fork)
+            if run.checkpoint is not None:
+                restore_checkpoint(agent, run.checkpoint)
+                run.finish(*agent.continue_run())
+            else:
+                run.finish(*agent.run(instance["problem_statement"]))
+        finally:
+            fork.cleanup()
+    journal.add(instance_id, model.config.model_name, run.result)
+    return run.state, run.exit_status, run.result
+
+
+def process_attempts(
+    instance: dict,
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    attempt_journals: list[PredsJournal],
+    preds_journal: PredsJournal | None = None,
+    image_prefetcher: ImagePrefetcher | None = None,
+    resume: bool = False,
+    stream_traj: bool = False,
+    manifest: RunManifest | None = None,
+    requeue_policy: RequeuePolicy | None = None,
+) -> float | None:
+    """Run one attempt per journal in `attempt_journals` on an instance. The environment is only started (and
+    `env_startup_command` only run) once: it is snapshotted and every attempt runs in a fork of it
+    (see `DockerEnvironment.fork`).
+
+    Attempt `k` is saved like a run of its own to `output_dir/attempt_<k>/` (its prediction in `attempt_journals[k - 1]`).
+    The prediction of the instance in `preds_journal` is that of the first submitted attempt (else of the first
+    attempt that could start a fork). The other arguments are as for `process_instance`. The instance is requeued if
+    its environment could not be started or if no attempt could start a fork.
+    """
+    instance_id = instance["instance_id"]
+    journal = preds_journal or PredsJournal(output_dir / "preds.jsonl")
+    journal.remove(instance_id)
+    models = [get_model(config=config.get("model", {})) for _ in attempt_journals]
+
+    progress_manager.on_instance_start(instance_id)
+    progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
+    if manifest is not None:
+        manifest.start(instance_id)
+
+    attempts: list[tuple[str, str, str]] = []  # state, exit status and result
+    retry_delay = None
+    try:
+        try:
+            if image_prefetcher is not None:
+                progress_manager.update_instance_status(instance_id, "Waiting for image prefetch")
+                image_prefetcher.wait(get_swebench_docker_image_name(instance))
+            env_start_time = time.perf_counter()
+            env = get_sb_environment(config, instance)
+        except Exception as e:
+            logger.error(f"Error processing instance {instance_id}: {e}", exc_info=True)
+            attempts.append((FAILED_INFRA, type(e).__name__, str(e)))
+        else:
+            try:
+                progress_manager.update_instance_status(instance_id, "Taking snapshot")
+                env.snapshot()  # type: ignore[attr-defined]
+                progress_manager.on_env_started(instance_id, time.perf_counter() - env_start_time)
+                if manifest is not None:
+                    manifest.env_ready(instance_id)
+                for k, (model, attempt_journal) in enumerate(zip(models, attempt_journals), 1):
+                    attempts.append(
+                        _run_attempt(
+                            k,
+                            instance,
+                            env,
+                            model,
+                            output_dir,
+                            config,
+                            progress_manager,
+                            journal=attempt_journal,
+                            resume=resume,
+                            stream_traj=stream_traj,
+                        )
+                    )
+            except Exception as e:  # taking the snapshot failed (`_run_attempt` records the errors of the attempts)
+                logger.error(f"Error processing instance {instance_id}: {e}", exc_info=True)
+                attempts.append((FAILED_INFRA, type(e).__name__, str(e)))
+            finally:
+                env.cleanup()
+        state, exit_status, result = max(
+            attempts, key=lambda attempt: (attempt[1] == "Submitted", attempt[0] != FAILED_INFRA)
+        )
+        retry_delay = _record_result(
+            instance_id,
+            models,
+            state,
+            exit_status,
+            result,
+            journal=journal,
+            progress_manager=progress_manager,
+            manifest=manifest,
+            requeue_policy=requeue_policy,
         )
-        update_preds_file(output_dir / "preds.json", instance_id, model.config.model_name, result)
-        progress_manager.on_instance_end(instance_id, exit_status)
+    finally:
+        if image_prefetcher is not None:
+            image_prefetcher.release(get_swebench_docker_image_name(instance), requeued=retry_delay is not None)
+    if preds_journal is None:
+        journal.close()
+    return retry_delay
 
 
-def filter_instances(
-    instances: list[dict], *, filter_spec: str, slice_spec: str = "", shuffle: bool = False
-) -> list[dict]:
-    """Filter and slice a list of SWEBench instances."""
+async def aprocess_instances(
+    instances: list[dict],
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    workers: int,
+    concurrency: ConcurrencyController | None = None,
+    preds_journal: PredsJournal | None = None,
+    image_prefetcher: ImagePrefetcher | None = None,
+    resume: bool = False,
+    stream_traj: bool = False,
+    manifest: RunManifest | None = None,
+    requeue_policy: RequeuePolicy | None = None,
+    attempt_journals: list[PredsJournal] | None = None,
+) -> None:
+    """Process instances as coroutines on the current event loop, with at most `workers` running at a time
+    (or as many as `concurrency` allows). Requeued instances wait for their retry without taking up a worker.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def process(instance: dict) -> None:
+        while True:
+            async with concurrency.aslot() if concurrency is not None else semaphore:
+                try:
+                    retry_delay = await aprocess_instance(
+                        instance,
+                        output_dir,
+                        config,
+                        progress_manager,
+                        preds_journal=preds_journal,
+                        image_prefetcher=image_prefetcher,
+                        resume=resume,
+                        stream_traj=stream_traj,
+                        manifest=manifest,
+                        requeue_policy=requeue_policy,
+                        attempt_journals=attempt_journals,
+                    )
+                except Exception as e:
+                    logger.error(f"Error in task for instance {instance['instance_id']}: {e}", exc_info=True)
+                    progress_manager.on_uncaught_exception(instance["instance_id"], e)
+                    return
+            if retry_delay is None:
+                return
+            await asyncio.sleep(retry_delay)
+
+    await asyncio.gather(*(process(instance) for instance in instances))
+
+
+def process_queue(
+    work_queue: WorkQueue,
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    concurrency: ConcurrencyController | None = None,
+    **kwargs,
+) -> None:
+    """Process instances claimed from the work queue until there are none left. `kwargs` go to `process_instance`.
+    With `concurrency`, an instance is only claimed once the controller allows another active worker.
+    Requeued instances are returned to the work queue with their retry delay (then any run can claim them).
+    """
+    while True:
+        with concurrency.slot() if concurrency is not None else contextlib.nullcontext():
+            if (instance := work_queue.claim()) is not None:
+                retry_delay = None
+                try:
+                    retry_delay = process_instance(instance, output_dir, config, progress_manager, **kwargs)
+                except Exception as e:
+                    logger.error(f"Error in worker for instance {instance['instance_id']}: {e}", exc_info=True)
+                    progress_manager.on_uncaught_exception(instance["instance_id"], e)
+                finally:
+                    work_queue.complete(instance["instance_id"], retry_delay=retry_delay)
+                continue
+        # Nothing to claim now, but requeued instances might become claimable later
+        if (wait := work_queue.wait_time()) is None:
+            return
+        time.sleep(min(wait, _QUEUE_POLL_INTERVAL))
+
+
+async def aprocess_queue(
+    work_queue: WorkQueue,
+    output_dir: Path,
+    config: dict,
+    progress_manager: ProgressReporter,
+    *,
+    workers: int,
+    concurrency: ConcurrencyController | None = None,
+    **kwargs,
+) -> None:
+    """Async version of `process_queue` with `workers` instances (or as many as `concurrency` allows) running
+    at a time.
+    """
+
+    async def process() -> None:
+        while True:
+            async with concurrency.aslot() if concurrency is not None else contextlib.nullcontext():
+                if (instance := await asyncio.to_thread(work_queue.claim)) is not None:
+                    retry_delay = None
+                    try:
+                        retry_delay = await aprocess_instance(instance, output_dir, config, progress_manager, **kwargs)
+                    except Exception as e:
+                        logger.error(f"Error in task for instance {instance['instance_id']}: {e}", exc_info=True)
+                        progress_manager.on_uncaught_exception(instance["instance_id"], e)
+                    finally:
+                        await asyncio.to_thread(work_queue.complete, instance["instance_id"], retry_delay=retry_delay)
+                    continue
+            if (wait := await asyncio.to_thread(work_queue.wait_time)) is None:
+                return
+            await asyncio.sleep(min(wait, _QUEUE_POLL_INTERVAL))
+
+    await asyncio.gather(*(process() for _ in range(workers)))
+
+
+def filter_instance_ids(
+    instance_ids: list[str], *, filter_spec: str, slice_spec: str = "", shuffle: bool = False
+) -> list[str]:
+    """Filter and slice a list of SWEBench instance IDs."""
     if shuffle:
-        instances = sorted(instances.copy(), key=lambda x: x["instance_id"])
+        instance_ids = sorted(instance_ids)
         random.seed(42)
-        random.shuffle(instances)
-    before_filter = len(instances)
-    instances = [instance for instance in instances if re.match(filter_spec, instance["instance_id"])]
-    if (after_filter := len(instances)) != before_filter:
+        random.shuffle(instance_ids)
+    before_filter = len(instance_ids)
+    instance_ids = [instance_id for instance_id in instance_ids if re.match(filter_spec, instance_id)]
+    if (after_filter := len(instance_ids)) != before_filter:
         logger.info(f"Instance filter: {before_filter} -> {after_filter} instances")
     if slice_spec:
         values = [int(x) if x else None for x in slice_spec.split(":")]
-        instances = instances[slice(*values)]
-        if (after_slice := len(instances)) != before_filter:
+        instance_ids = instance_ids[slice(*values)]
+        if (after_slice := len(instance_ids)) != before_filter:
             logger.info(f"Instance slice: {before_filter} -> {after_slice} instances")
-    return instances
+    return instance_ids
+
+
+def filter_instances(
+    instances: list[dict], *, filter_spec: str, slice_spec: str = "", shuffle: bool = False
+) -> list[dict]:
+    """Filter and slice a list of SWEBench instances."""
+    by_id = {instance["instance_id"]: instance for instance in instances}
+    instance_ids = filter_instance_ids(list(by_id), filter_spec=filter_spec, slice_spec=slice_spec, shuffle=shuffle)
+    return [by_id[instance_id] for instance_id in instance_ids]
 
 
 # fmt: off
@@ -198,9 +798,21 @@ def main(
     shuffle: bool = typer.Option(False, "--shuffle", help="Shuffle instances", rich_help_panel="Data selection"),
     output: str = typer.Option("", "-o", "--output", help="Output directory", rich_help_panel="Basic"),
     workers: int = typer.Option(1, "-w", "--workers", help="Number of worker threads for parallel processing", rich_help_panel="Basic"),
+    min_workers: int = typer.Option(0, "--min-workers", help="Adapt the number of active workers between this and --workers to rate limits, model latency and host load (0: always --workers)", rich_help_panel="Advanced"),
+    async_mode: bool = typer.Option(False, "--async", help="Run instances as coroutines on a single event loop instead of threads. --workers sets the number of concurrent instances", rich_help_panel="Advanced"),
     model: str | None = typer.Option(None, "-m", "--model", help="Model to use", rich_help_panel="Basic"),
     model_class: str | None = typer.Option(None, "-c", "--model-class", help="Model class to use (e.g., 'anthropic' or 'minisweagent.models.anthropic.AnthropicModel')", rich_help_panel="Advanced"),
     redo_existing: bool = typer.Option(False, "--redo-existing", help="Redo existing instances", rich_help_panel="Data selection"),
+    retry_failed: bool = typer.Option(False, "--retry-failed", help="Redo instances that failed with an exception (according to the run manifest), but skip the other existing instances", rich_help_panel="Data selection"),
+    resume: bool = typer.Option(False, "--resume", help="Continue unfinished instances from their last checkpoint instead of starting over", rich_help_panel="Basic"),
+    stream_traj: bool = typer.Option(False, "--stream-traj", help="Stream trajectories to <instance_id>.traj.jsonl while running (instead of writing <instance_id>.traj.json at the end)", rich_help_panel="Advanced"),
+    schedule_from: str = typer.Option("", "--schedule-from", help="Start the instances with the longest expected duration first, estimated from the trajectories in this output directory of a prior run", rich_help_panel="Advanced"),
+    headless: bool = typer.Option(False, "--headless", help="Log the progress every minute instead of showing a live display (e.g., for runs without a terminal)", rich_help_panel="Advanced"),
+    progress_jsonl: str = typer.Option("", "--progress-jsonl", help="Also write all progress events (instance start, status, end) as JSON lines to this file", rich_help_panel="Advanced"),
+    metrics_port: int = typer.Option(0, "--metrics-port", help="Serve metrics of the run (throughput, cost, latencies) in the Prometheus text format on localhost:<port>/metrics", rich_help_panel="Advanced"),
+    metrics_file: str = typer.Option("", "--metrics-file", help="Rewrite metrics of the run in the Prometheus text format to this file every 15s (e.g., for the node exporter textfile collector)", rich_help_panel="Advanced"),
+    attempts: int = typer.Option(1, "--attempts", help="Run every instance this many times, each attempt in a fork of the same container after the startup command (saved to attempt_<k>/ in the output directory)", rich_help_panel="Advanced"),
+    queue: str = typer.Option("", "--queue", help="SQLite file of a work queue to share the run with runs on other hosts (on a shared filesystem, with the same output directory)", rich_help_panel="Advanced"),
     config_spec: Path = typer.Option( builtin_config_dir / "extra" / "swebench.yaml", "-c", "--config", help="Path to a config file", rich_help_panel="Basic"),
     environment_class: str | None = typer.Option( None, "--environment-class", help="Environment type to use. Recommended are docker or singularity", rich_help_panel="Advanced"),
 ) -> None:
@@ -210,17 +822,6 @@ def main(
     logger.info(f"Results will be saved to {output_path}")
     add_file_handler(output_path / "minisweagent.log")
 
-    dataset_path = DATASET_MAPPING.get(subset, subset)
-    logger.info(f"Loading dataset {dataset_path}, split {split}...")
-    instances = list(load_dataset(dataset_path, split=split))
-
-    instances = filter_instances(instances, filter_spec=filter_spec, slice_spec=slice_spec, shuffle=shuffle)
-    if not redo_existing and (output_path / "preds.json").exists():
-        existing_instances = list(json.loads((output_path / "preds.json").read_text()).keys())
-        logger.info(f"Skipping {len(existing_instances)} existing instances")
-        instances = [instance for instance in instances if instance["instance_id"] not in existing_instances]
-    logger.info(f"Running on {len(instances)} instances...")
-
     config_path = get_config_path(config_spec)
     logger.info(f"Loading agent config from '{config_path}'")
     config = yaml.safe_load(config_path.read_text())
@@ -230,37 +831,188 @@ def main(
         config.setdefault("model", {})["model_name"] = model
     if model_class is not None:
         config.setdefault("model", {})["model_class"] = model_class
+    if attempts > 1:
+        env_class = config.get("environment", {}).get("environment_class", "docker")
+        if not hasattr(get_environment_class(env_class), "fork"):
+            raise typer.BadParameter(f"--attempts needs an environment that can be forked (e.g., docker), not {env_class}")
 
-    progress_manager = RunBatchProgressManager(len(instances), output_path / f"exit_statuses_{time.time()}.yaml")
-
-    def process_futures(futures: dict[concurrent.futures.Future, str]):
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                future.result()
-            except concurrent.futures.CancelledError:
-                pass
-            except Exception as e:
-                instance_id = futures[future]
-                logger.error(f"Error in future for instance {instance_id}: {e}", exc_info=True)
-                progress_manager.on_uncaught_exception(instance_id, e)
-
-    with Live(progress_manager.render_group, refresh_per_second=4):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            futures = {
-                executor.submit(process_instance, instance, output_path, config, progress_manager): instance[
-                    "instance_id"
-                ]
-                for instance in instances
-            }
-            try:
-                process_futures(futures)
-            except KeyboardInterrupt:
-                logger.info("Cancelling all pending jobs. Press ^C again to exit immediately.")
-                for future in futures:
-                    if not future.running() and not future.done():
-                        future.cancel()
-                process_futures(futures)
+    dataset_path = DATASET_MAPPING.get(subset, subset)
+    logger.info(f"Loading dataset {dataset_path}, split {split}...")
+    instance_store = InstanceStore.from_dataset(load_dataset(dataset_path, split=split))
+
+    instance_ids = filter_instance_ids(
+        instance_store.instance_ids(), filter_spec=filter_spec, slice_spec=slice_spec, shuffle=shuffle
+    )
+    work_queue = WorkQueue(Path(queue)) if queue else None
+    # With a work queue, every run writes its own journal, they are merged into preds.json
+    journal_name = "preds.jsonl" if work_queue is None else f"preds.{work_queue.worker_id}.jsonl"
+    preds_journal = PredsJournal(output_path / journal_name, import_legacy=work_queue is None)
+    attempt_journals = None
+    if attempts > 1:
+        attempt_journals = [
+            PredsJournal(output_path / f"attempt_{k}" / journal_name, import_legacy=work_queue is None)
+            for k in range(1, attempts + 1)
+        ]
+    if work_queue is None:
+        existing_instances = preds_journal.instance_ids
+    else:
+        existing_instances = set(read_journals(output_path))
+    manifest = RunManifest(output_path / "manifest.sqlite", worker_id=work_queue.worker_id if work_queue else None)
+    existing_instances = existing_instances | manifest.instance_ids(FINISHED_STATES)
+    if retry_failed:
+        failed_instances = manifest.instance_ids(FAILED_STATES)
+        logger.info(f"Retrying {len(failed_instances)} failed instances")
+        existing_instances -= failed_instances
+    if not redo_existing and existing_instances:
+        logger.info(f"Skipping {len(existing_instances)} existing instances")
+        instance_ids = [instance_id for instance_id in instance_ids if instance_id not in existing_instances]
+    instances = instance_store.get_many(instance_ids)
+    instance_store.close()
+    schedule = None
+    if schedule_from:
+        schedule = Schedule(instances, DurationEstimates.from_trajectories(Path(schedule_from)), workers)
+        instances = schedule.instances
+    manifest.queue(instance["instance_id"] for instance in instances)
+    if work_queue is not None:
+        logger.info(f"Added {work_queue.add(instances)} instances to the work queue {queue}")
+        instances = []  # claimed from the queue instead
+    n_instances = len(instances) if work_queue is None else work_queue.counts().get("pending", 0)
+    logger.info(f"Running on {n_instances} instances...")
+
+    progress_manager = get_progress_event_bus(
+        n_instances,
+        headless=headless,
+        jsonl_path=progress_jsonl,
+        metrics_port=metrics_port,
+        metrics_file=metrics_file,
+        manifest=manifest,
+    )
+    image_prefetcher = get_image_prefetcher(config, instances, progress_manager)
+    concurrency = get_concurrency_controller(config, min_workers, workers)
+    instance_kwargs = {
+        "preds_journal": preds_journal,
+        "image_prefetcher": image_prefetcher,
+        "resume": resume,
+        "stream_traj": stream_traj,
+        "manifest": manifest,
+        "requeue_policy": RequeuePolicy(**config.get("run", {}).get("requeue", {})),
+        "attempt_journals": attempt_journals,
+    }
+
+    def process_futures(futures: dict[concurrent.futures.Future, str], submit=None):
+        """Wait for all futures. With `submit`, requeued instances are submitted again after their retry delay
+        (the other instances keep running meanwhile).
+        """
+        pending = set(futures)
+        retries: list[tuple[float, str]] = []  # heap of (time of the retry, instance ID)
+        while pending or retries:
+            while retries and retries[0][0] <= time.monotonic():
+                instance_id = heapq.heappop(retries)[1]
+                future = submit(instance_id)
+                futures[future] = instance_id
+                pending.add(future)
+            timeout = max(retries[0][0] - time.monotonic(), 0) if retries else None
+            if not pending:
+                time.sleep(timeout or 0)
+                continue
+            done, pending = concurrent.futures.wait(
+                pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                try:
+                    retry_delay = future.result()
+                except concurrent.futures.CancelledError:
+                    continue
+                except Exception as e:
+                    instance_id = futures[future]
+                    logger.error(f"Error in future for instance {instance_id}: {e}", exc_info=True)
+                    progress_manager.on_uncaught_exception(instance_id, e)
+                    continue
+                if submit is not None and retry_delay is not None:
+                    heapq.heappush(retries, (time.monotonic() + retry_delay, futures[future]))
 
+    try:
+        with progress_manager:
+            if async_mode and work_queue is not None:
+                asyncio.run(
+                    aprocess_queue(
+                        work_queue,
+                        output_path,
+                        config,
+                        progress_manager,
+                        workers=workers,
+                        concurrency=concurrency,
+                        **instance_kwargs,
+                    )
+                )
+                return
+            if async_mode:
+                asyncio.run(
+                    aprocess_instances(
+                        instances,
+                        output_path,
+                        config,
+                        progress_manager,
+                        workers=workers,
+                        concurrency=concurrency,
+                        **instance_kwargs,
+                    )
+                )
+                return
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                if work_queue is not None:
+                    futures = {
+                        executor.submit(
+                            process_queue,
+                            work_queue,
+                            output_path,
+                            config,
+                            progress_manager,
+                            concurrency=concurrency,
+                            **instance_kwargs,
+                        ): f"queue worker {i}"
+                        for i in range(workers)
+                    }
+                    submit = None
+                else:
+                    # With a controller, worker threads wait for a slot before they start the instance
+                    task = (process_instance,) if concurrency is None else (concurrency.call, process_instance)
+                    instances_by_id = {instance["instance_id"]: instance for instance in instances}
+
+                    def submit(instance_id: str) -> concurrent.futures.Future:
+                        instance = instances_by_id[instance_id]
+                        return executor.submit(*task, instance, output_path, config, progress_manager, **instance_kwargs)
+
+                    futures = {submit(instance_id): instance_id for instance_id in instances_by_id}
+                try:
+                    process_futures(futures, submit)
+                except KeyboardInterrupt:
+                    logger.info("Cancelling all pending jobs. Press ^C again to exit immediately.")
+                    if work_queue is not None:
+                        work_queue.stop()
+                    for future in futures:
+                        if not future.running() and not future.done():
+                            future.cancel()
+                    process_futures(futures)
+    finally:
+        if concurrency is not None:
+            concurrency.stop()
+        if image_prefetcher is not None:
+            image_prefetcher.stop()
+        if work_queue is not None:
+            work_queue.close()
+        preds_journal.close(merge=work_queue is not None)
+        for attempt_journal in attempt_journals or []:
+            attempt_journal.close(merge=work_queue is not None)
+        logger.info(f"Wrote predictions to {output_path / 'preds.json'}")
+        if schedule is not None:
+            schedule.report(output_path)
+        if requeues := manifest.requeues():
+            logger.info(
+                f"Requeued {len({r['instance_id'] for r in requeues})} instances {len(requeues)} times "
+                "after infrastructure failures"
+            )
+        logger.info(f"Instances by state: {manifest.counts()} (see `mini-extra swebench-status {output_path}`)")
 
 if __name__ == "__main__":
     app()
@@ -15,6 +15,7 @@ from minisweagent.run.extra.swebench import (
     DATASET_MAPPING,
     get_sb_environment,
 )
+from minisweagent.run.extra.utils.instance_store import InstanceStore
 from minisweagent.run.utils.save import save_traj
 from minisweagent.utils.log import logger
 
@@ -40,13 +41,11 @@ def main(
     """Run on a single SWE-Bench instance."""
     dataset_path = DATASET_MAPPING.get(subset, subset)
     logger.info(f"Loading dataset from {dataset_path}, split {split}...")
-    instances = {
-        inst["instance_id"]: inst  # type: ignore
-        for inst in load_dataset(dataset_path, split=split)
-    }
+    instance_store = InstanceStore.from_dataset(load_dataset(dataset_path, split=split))
     if instance_spec.isnumeric():
-        instance_spec = sorted(instances.keys())[int(instance_spec)]
-    instance: dict = instances[instance_spec]  # type: ignore
+        instance_spec = instance_store.sorted_instance_id(int(instance_spec))
+    instance = instance_store[instance_spec]
+    instance_store.close()
 
     config_path = get_config_path(config_path)
     logger.info(f"Loading agent config from '{config_path}'")
@@ -0,0 +1,60 @@
+"""Show the state of a SWE-bench batch run (from its run manifest)."""
+
+from pathlib import Path
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from minisweagent.run.extra.utils.run_manifest import RunManifest
+
+app = typer.Typer(add_completion=False)
+
+
+def _fmt_seconds(seconds: float | None) -> str:
+    return "n/a" if seconds is None else f"{seconds:.0f}s"
+
+
+# fmt: off
+@app.command()
+def main(
+    output: Path = typer.Argument(..., help="Output directory of the run"),
+    state: str | None = typer.Option(None, "--state", help="List the instances in this state (e.g., failed_infra)"),
+) -> None:
+    # fmt: on
+    """Show the state of a SWE-bench batch run."""
+    if not (output / "manifest.sqlite").exists():
+        raise typer.BadParameter(f"No run manifest in {output}")
+    manifest = RunManifest(output / "manifest.sqlite")
+    console = Console()
+    if state is not None:
+        for instance_id in sorted(manifest.instance_ids([state])):
+            console.print(instance_id)
+        return
+    summary = manifest.summary()
+    for title, counts in [("State", summary["states"]), ("Exit status", summary["exit_statuses"])]:
+        table = Table()
+        table.add_column(title)
+        table.add_column("Count", justify="right", style="bold cyan")
+        for key, count in counts.items():
+            table.add_row(key, str(count))
+        console.print(table)
+    if requeues := manifest.requeues():
+        table = Table(title="Requeued after infrastructure failures")
+        table.add_column("Instance")
+        table.add_column("Attempt", justify="right")
+        table.add_column("Delay", justify="right")
+        table.add_column("Reason")
+        for requeue in requeues:
+            reason = (requeue["reason"].strip().splitlines() or [""])[0][:100]
+            table.add_row(requeue["instance_id"], str(requeue["attempt"]), _fmt_seconds(requeue["delay"]), reason)
+        console.print(table)
+    console.print(
+        f"{summary['n_finished']} finished instances ({summary['attempts']} attempts), cost ${summary['cost']:.2f}, "
+        f"mean environment start {_fmt_seconds(summary['mean_env_start_time'])}, "
+        f"mean agent time {_fmt_seconds(summary['mean_agent_time'])}"
+    )
+
+
+if __name__ == "__main__":
+    app()
@@ -54,6 +54,8 @@ class RunBatchProgressManager:
         self._total_instances = num_instances
 
         self._instances_by_exit_status = collections.defaultdict(list)
+        self._requeued_by_exit_status = collections.defaultdict(list)
+        """Instances that were requeued after an infrastructure failure (not counted as completed)."""
         self._main_progress_bar = Progress(
             SpinnerColumn(spinner_name="dots2"),
             TextColumn("[progress.description]{task.description} (${task.fields[total_cost]})"),
@@ -79,6 +81,9 @@ class RunBatchProgressManager:
             "[cyan]Overall Progress", total=num_instances, total_cost="0.00", eta=""
         )
 
+        self._prefetch_progress_bar: Progress | None = None
+        """Progress of the background image prefetch (only shown if images are prefetched)."""
+
         self.render_group = Group(self._main_progress_bar, Table(), self._task_progress_bar)
         self._yaml_report_path = yaml_report_path
 
@@ -111,6 +116,9 @@ class RunBatchProgressManager:
             for status, instances in sorted_items:
                 instances_str = _shorten_str(", ".join(reversed(instances)), 55)
                 t.add_row(status, str(len(instances)), instances_str)
+            for status, instances in self._requeued_by_exit_status.items():
+                instances_str = _shorten_str(", ".join(reversed(instances)), 55)
+                t.add_row(f"Requeued ({status})", str(len(instances)), instances_str, style="yellow")
         assert self.render_group is not None
         self.render_group.renderables[1] = t
 
@@ -133,6 +141,18 @@ class RunBatchProgressManager:
             )
         self._update_total_costs()
 
+    def update_prefetch_status(self, *, pulled: int, pulling: int, total: int) -> None:
+        with self._lock:
+            if self._prefetch_progress_bar is None:
+                self._prefetch_progress_bar = Progress(
+                    TextColumn("[magenta]Image prefetch ({task.fields[pulling]} pulling)"),
+                    BarColumn(),
+                    MofNCompleteColumn(),
+                )
+                self._prefetch_progress_bar.add_task("prefetch", total=total, pulling=0)
+                self.render_group.renderables.append(self._prefetch_progress_bar)
+            self._prefetch_progress_bar.update(TaskID(0), completed=pulled, total=total, pulling=pulling)
+
     def on_instance_start(self, instance_id: str):
         with self._lock:
             self._spinner_tasks[instance_id] = self._task_progress_bar.add_task(
@@ -155,9 +175,25 @@ class RunBatchProgressManager:
         if self._yaml_report_path is not None:
             self._save_overview_data_yaml(self._yaml_report_path)
 
+    def on_instance_requeued(self, instance_id: str, exit_status: str | None) -> None:
+        """The instance failed for infrastructure reasons and will be retried (it's not completed)."""
+        self._requeued_by_exit_status[exit_status].append(instance_id)
+        with self._lock:
+            try:
+                self._task_progress_bar.remove_task(self._spinner_tasks[instance_id])
+            except KeyError:
+                pass
+        self.update_exit_status_table()
+
     def on_uncaught_exception(self, instance_id: str, exception: Exception) -> None:
         self.on_instance_end(instance_id, f"Uncaught {type(exception).__name__}")
 
+    def on_env_started(self, instance_id: str, seconds: float) -> None:
+        """Timings are not shown (see `MetricsRenderer`)."""
+
+    def on_action_executed(self, instance_id: str, seconds: float) -> None:
+        """Timings are not shown (see `MetricsRenderer`)."""
+
     def print_report(self) -> None:
         """Print complete list of instances and their exit statuses."""
         for status, instances in self._instances_by_exit_status.items():
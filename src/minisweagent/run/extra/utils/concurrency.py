@@ -0,0 +1,284 @@
+"""Adapt the number of instances that a batch run processes at a time.
+
+Every `interval` seconds, the controller looks at the model calls since the last decision (how many were
+rejected because of rate limits or overload, how long calls took) and at the pressure on the host
+(CPU load, available memory, free disk). It then adjusts the limit within `[min_workers, max_workers]`:
+it backs off multiplicatively under pressure and probes one more worker at a time otherwise
+(after a cooldown, so that the limit doesn't oscillate).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from minisweagent.models import GLOBAL_MODEL_STATS, GlobalModelStats
+
+logger = logging.getLogger("minisweagent.concurrency")
+
+
+@dataclass
+class Signals:
+    """What the controller observed since its last decision. None if not available."""
+
+    n_calls: int
+    n_rate_limited: int
+    latency: float | None
+    """Average latency of a model call in seconds."""
+    load: float | None
+    """1 minute load average per CPU."""
+    free_memory: float | None
+    """Available memory as a fraction of the total memory."""
+    free_disk_gb: float | None
+
+    @property
+    def rate_limited_fraction(self) -> float:
+        return self.n_rate_limited / max(self.n_calls + self.n_rate_limited, 1)
+
+
+def _free_memory() -> float | None:
+    try:
+        meminfo = dict(line.split(":", 1) for line in Path("/proc/meminfo").read_text().splitlines() if ":" in line)
+        return int(meminfo["MemAvailable"].split()[0]) / int(meminfo["MemTotal"].split()[0])
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _load() -> float | None:
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+
+class ConcurrencyController:
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        *,
+        initial_workers: int | None = None,
+        interval: float = 30.0,
+        max_rate_limited: float = 0.05,
+        max_latency_increase: float = 1.5,
+        max_load: float = 1.5,
+        min_free_memory: float = 0.1,
+        min_free_disk_gb: float = 5.0,
+        disk_path: str = "/var/lib/docker",
+        decrease_factor: float = 0.75,
+        cooldown: int = 2,
+        model_stats: GlobalModelStats = GLOBAL_MODEL_STATS,
+    ):
+        """Limit the number of active workers to between `min_workers` and `max_workers`.
+
+        Args:
+            min_workers: Lower bound of the limit.
+            max_workers: Upper bound of the limit (the number of worker threads/coroutines of the run).
+            initial_workers: Limit to start with (default: `min_workers`).
+            interval: Seconds between decisions.
+            max_rate_limited: Back off if more than this fraction of model calls was rejected with
+                rate limit or overload errors.
+            max_latency_increase: Don't add workers while model calls take longer than this factor times
+                the fastest average latency that was observed.
+            max_load: Back off if the load average per CPU is higher.
+            min_free_memory: Back off if less than this fraction of the memory is available.
+            min_free_disk_gb: Back off if less disk space is free.
+            disk_path: Path on the disk that holds the containers (falls back to `/` if it doesn't exist).
+            decrease_factor: The limit is multiplied with this factor when backing off.
+            cooldown: Number of intervals after backing off before workers are added again.
+            model_stats: Source of the model call statistics.
+        """
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError(f"Need 1 <= min_workers <= max_workers, got {min_workers} and {max_workers}")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.max_rate_limited = max_rate_limited
+        self.max_latency_increase = max_latency_increase
+        self.max_load = max_load
+        self.min_free_memory = min_free_memory
+        self.min_free_disk_gb = min_free_disk_gb
+        self.disk_path = disk_path if Path(disk_path).exists() else "/"
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.model_stats = model_stats
+        self._limit = min(max(initial_workers or min_workers, min_workers), max_workers)
+        self._active = 0
+        self._max_active = 0
+        """Highest number of active workers since the last decision."""
+        self._cond = threading.Condition()
+        self._cooldown_left = 0
+        self._baseline_latency: float | None = None
+        self._last_stats = self._read_model_stats()
+        self.decisions: list[dict] = []
+        """Every decision with the signals it was based on."""
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    # --- Slots ---
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._active >= self._limit:
+                return False
+            self._active += 1
+            self._max_active = max(self._max_active, self._active)
+            return True
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+            self._max_active = max(self._max_active, self._active)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, poll_interval: float = 0.5):
+        """Like `slot`, but waits without blocking the event loop."""
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def call(self, fn, /, *args, **kwargs):
+        """Call `fn` while holding a slot."""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    # --- Decisions ---
+
+    def _read_model_stats(self) -> tuple[int, int, float, int]:
+        stats = self.model_stats
+        return stats.n_calls, stats.n_rate_limited, stats.query_time, stats.n_timed_queries
+
+    def _free_disk_gb(self) -> float | None:
+        try:
+            return shutil.disk_usage(self.disk_path).free / 1e9
+        except OSError:
+            return None
+
+    def sample(self) -> Signals:
+        """Observe the signals since the last sample."""
+        stats = self._read_model_stats()
+        n_calls, n_rate_limited, query_time, n_timed_queries = (
+            now - before for now, before in zip(stats, self._last_stats)
+        )
+        self._last_stats = stats
+        return Signals(
+            n_calls=n_calls,
+            n_rate_limited=n_rate_limited,
+            latency=query_time / n_timed_queries if n_timed_queries else None,
+            load=_load(),
+            free_memory=_free_memory(),
+            free_disk_gb=self._free_disk_gb(),
+        )
+
+    def _pressure(self, signals: Signals) -> list[str]:
+        """Reasons to back off."""
+        reasons = []
+        if signals.n_rate_limited and signals.rate_limited_fraction > self.max_rate_limited:
+            reasons.append(f"{signals.rate_limited_fraction:.0%} of model calls rate limited")
+        if signals.load is not None and signals.load > self.max_load:
+            reasons.append(f"load {signals.load:.2f} per CPU")
+        if signals.free_memory is not None and signals.free_memory < self.min_free_memory:
+            reasons.append(f"{signals.free_memory:.0%} memory available")
+        if signals.free_disk_gb is not None and signals.free_disk_gb < self.min_free_disk_gb:
+            reasons.append(f"{signals.free_disk_gb:.1f} GB disk free")
+        return reasons
+
+    def decide(self, signals: Signals) -> tuple[int, str]:
+        """New limit and the reason for it."""
+        with self._cond:
+            max_active = self._max_active
+            self._max_active = self._active
+        if signals.latency is not None:
+            self._baseline_latency = min(self._baseline_latency or signals.latency, signals.latency)
+        if reasons := self._pressure(signals):
+            self._cooldown_left = self.cooldown
+            new_limit = max(self.min_workers, min(self._limit - 1, math.floor(self._limit * self.decrease_factor)))
+            return new_limit, "backing off: " + ", ".join(reasons)
+        if self._cooldown_left > 0:
+            self._cooldown_left -= 1
+            return self._limit, "cooling down"
+        if self._limit >= self.max_workers:
+            return self._limit, "at maximum"
+        if max_active < self._limit:
+            return self._limit, f"only {max_active} of {self._limit} workers were busy"
+        if (
+            signals.latency is not None
+            and self._baseline_latency
+            and signals.latency > self.max_latency_increase * self._baseline_latency
+        ):
+            return self._limit, f"model latency {signals.latency:.1f}s (fastest {self._baseline_latency:.1f}s)"
+        return self._limit + 1, "no pressure"
+
+    def set_limit(self, limit: int) -> None:
+        with self._cond:
+            self._limit = min(max(limit, self.min_workers), self.max_workers)
+            self._cond.notify_all()
+
+    def adjust(self) -> int:
+        """Sample the signals, decide on and apply a new limit (logging the decision). Returns the new limit."""
+        signals = self.sample()
+        old_limit = self._limit
+        new_limit, reason = self.decide(signals)
+        self.set_limit(new_limit)
+        self.decisions.append(
+            {"time": time.time(), "old": old_limit, "new": self._limit, "reason": reason} | vars(signals)
+        )
+        logger.info(
+            f"Workers {old_limit} -> {self._limit} ({reason}; {signals.n_calls} model calls, "
+            f"{signals.n_rate_limited} rate limited, latency {_fmt(signals.latency, 's')}, "
+            f"load {_fmt(signals.load)}, memory {_fmt(signals.free_memory, '%', 100)}, "
+            f"disk {_fmt(signals.free_disk_gb, ' GB')})"
+        )
+        return self._limit
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.adjust()
+            except Exception as e:
+                logger.error(f"Failed to adjust the number of workers: {e}", exc_info=True)
+
+    def start(self) -> "ConcurrencyController":
+        """Start adjusting the limit in the background."""
+        logger.info(f"Adapting workers between {self.min_workers} and {self.max_workers}, starting with {self._limit}")
+        self._thread = threading.Thread(target=self._loop, name="concurrency", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def _fmt(value: float | None, unit: str = "", scale: float = 1.0) -> str:
+    return "n/a" if value is None else f"{value * scale:.2f}{unit}"
@@ -0,0 +1,171 @@
+"""Pull the container images of upcoming instances in the background, so that workers of a batch run
+(almost) never wait for a `docker pull` while they hold a slot.
+"""
+
+import collections
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from minisweagent.run.extra.utils.progress_events import ProgressReporter
+
+logger = logging.getLogger("minisweagent.prefetch")
+
+
+class ImagePrefetcher:
+    def __init__(
+        self,
+        images: list[str],
+        *,
+        executable: str = "docker",
+        lookahead: int = 8,
+        max_concurrent_pulls: int = 2,
+        min_free_disk_gb: float = 0.0,
+        disk_path: str = "/var/lib/docker",
+        pull_timeout: int = 600,
+        progress_manager: ProgressReporter | None = None,
+    ):
+        """Prefetch `images` (one per instance, in the order in which the instances are processed).
+
+        Args:
+            images: Images of all instances of the run, in order.
+            executable: Path to the docker/podman executable.
+            lookahead: Number of images to pull ahead of the instances that have been started.
+            max_concurrent_pulls: Number of images that are pulled at the same time.
+            min_free_disk_gb: Before pulling (and whenever an instance finishes), images of finished instances
+                are removed (least recently finished first) while less disk space is free. Only images that were
+                pulled by the prefetcher are removed. 0 disables eviction.
+            disk_path: Path on the disk that holds the images (falls back to `/` if it doesn't exist).
+            pull_timeout: Timeout in seconds for a single pull.
+            progress_manager: Shows the prefetch progress if set.
+        """
+        self.executable = executable
+        self.lookahead = lookahead
+        self.min_free_disk_gb = min_free_disk_gb
+        self.disk_path = disk_path if Path(disk_path).exists() else "/"
+        self.pull_timeout = pull_timeout
+        self.progress_manager = progress_manager
+        self._images = list(dict.fromkeys(images))
+        self._n_remaining = collections.Counter(images)
+        """Number of instances that still need an image."""
+        self._cond = threading.Condition()
+        self._next = 0
+        """Index of the next image to pull."""
+        self._n_started = 0
+        self._pulls: dict[str, threading.Event] = {}
+        self._n_pulled = 0
+        self._n_pulling = 0
+        self._owned: set[str] = set()
+        """Images that were pulled by us (and can therefore be removed)."""
+        self._evictable: collections.deque[str] = collections.deque()
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._pull_loop, name=f"prefetch-{i}", daemon=True)
+            for i in range(max_concurrent_pulls)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _next_image(self) -> str | None:
+        """Wait until the next image is within the lookahead window and claim it. None if there is none left."""
+        with self._cond:
+            while not self._stopped and self._next < len(self._images):
+                if self._images[self._next] in self._pulls:  # instance was started before we got to it
+                    self._next += 1
+                elif self._next < self._n_started + self.lookahead:
+                    image = self._images[self._next]
+                    self._next += 1
+                    self._pulls[image] = threading.Event()
+                    self._n_pulling += 1
+                    return image
+                else:
+                    self._cond.wait()
+            return None
+
+    def _pull_loop(self) -> None:
+        while (image := self._next_image()) is not None:
+            self._make_disk_space()
+            self._pull(image)
+
+    def _run(self, *args: str, timeout: int = 60) -> subprocess.CompletedProcess:
+        return subprocess.run([self.executable, *args], capture_output=True, text=True, timeout=timeout)
+
+    def _pull(self, image: str) -> None:
+        start_time = time.time()
+        try:
+            if self._run("image", "inspect", image).returncode != 0:
+                result = self._run("pull", image, timeout=self.pull_timeout)
+                if result.returncode != 0:
+                    logger.warning(f"Failed to prefetch {image}: {result.stderr.strip()}")
+                else:
+                    logger.info(f"Prefetched {image} in {time.time() - start_time:.1f}s")
+                    with self._cond:
+                        self._owned.add(image)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Timed out prefetching {image}")
+        finally:
+            with self._cond:
+                self._n_pulling -= 1
+                self._n_pulled += 1
+                self._pulls[image].set()
+            self._update_progress()
+
+    def _update_progress(self) -> None:
+        if self.progress_manager is not None:
+            self.progress_manager.update_prefetch_status(
+                pulled=self._n_pulled, pulling=self._n_pulling, total=len(self._images)
+            )
+
+    def _free_disk_gb(self) -> float:
+        return shutil.disk_usage(self.disk_path).free / 1e9
+
+    def _make_disk_space(self) -> None:
+        """Remove images of finished instances while less than `min_free_disk_gb` is free."""
+        if not self.min_free_disk_gb:
+            return
+        while self._free_disk_gb() < self.min_free_disk_gb:
+            with self._cond:
+                if not self._evictable:
+                    logger.warning(f"Less than {self.min_free_disk_gb} GB free, but no image can be removed")
+                    return
+                image = self._evictable.popleft()
+            result = self._run("rmi", image)
+            if result.returncode != 0:  # e.g., the container is still being removed
+                logger.debug(f"Failed to remove {image}: {result.stderr.strip()}")
+                with self._cond:
+                    self._evictable.append(image)
+                return
+            logger.info(f"Removed image {image} to free disk space")
+            with self._cond:
+                self._owned.discard(image)
+
+    def wait(self, image: str) -> None:
+        """Called when an instance is started: Advance the lookahead window and wait for a pull of `image`
+        that is already running. Images that are not being prefetched are left to the environment to pull.
+        """
+        with self._cond:
+            self._n_started += 1
+            self._cond.notify_all()
+            if (event := self._pulls.get(image)) is None:
+                self._pulls[image] = event = threading.Event()
+                event.set()
+        event.wait(self.pull_timeout)
+
+    def release(self, image: str, *, requeued: bool = False) -> None:
+        """Called when an instance is finished. Its image can be removed if no other instance needs it.
+        With `requeued`, the instance will be retried, so it still needs its image.
+        """
+        with self._cond:
+            if not requeued:
+                self._n_remaining[image] -= 1
+            if self._n_remaining[image] <= 0 and image in self._owned:
+                self._evictable.append(image)
+        self._make_disk_space()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
@@ -0,0 +1,124 @@
+"""Local store of the instances of a dataset (a SQLite file with an index on `instance_id`).
+
+The store is built once per dataset version (HuggingFace datasets are identified by their fingerprint)
+and cached in `MSWEA_INSTANCE_CACHE_DIR`. Instances are selected by ID (filters and slices only look at the IDs)
+and only the selected instances are loaded, so that large datasets don't have to be materialized on every start.
+"""
+
+import json
+import os
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from platformdirs import user_cache_dir
+
+INSTANCE_CACHE_DIR = Path(os.getenv("MSWEA_INSTANCE_CACHE_DIR") or Path(user_cache_dir("mini-swe-agent")) / "instances")
+
+_SCHEMA = """
+CREATE TABLE instances (
+    instance_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX instances_position ON instances (position);
+"""
+
+_MAX_VARIABLES = 500
+"""Number of instance IDs per query (SQLite limits the number of variables per statement)."""
+
+
+class InstanceStore:
+    def __init__(self, conn: sqlite3.Connection):
+        """Use `open`, `build` or `from_dataset` to get a store."""
+        self._conn = conn
+
+    @classmethod
+    def open(cls, path: Path) -> "InstanceStore":
+        return cls(sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False))
+
+    @classmethod
+    def build(cls, instances: Iterable[dict], path: Path | None = None) -> "InstanceStore":
+        """Write `instances` (streamed, in order) to a new store at `path` (in memory if None).
+        The file is only moved into place when it is complete, so concurrent runs can build the same store.
+        """
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp") if path is not None else None
+        if tmp_path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)  # type: ignore[union-attr]
+            tmp_path.unlink(missing_ok=True)
+        conn = sqlite3.connect(tmp_path or ":memory:", check_same_thread=False)
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT OR REPLACE INTO instances (instance_id, position, data) VALUES (?, ?, ?)",
+            (
+                (instance["instance_id"], position, json.dumps(instance, default=str))
+                for position, instance in enumerate(instances)
+            ),
+        )
+        conn.commit()
+        if tmp_path is None:
+            return cls(conn)
+        conn.close()
+        os.replace(tmp_path, path)  # type: ignore[arg-type]
+        return cls.open(path)  # type: ignore[arg-type]
+
+    @classmethod
+    def from_dataset(cls, dataset: Any, cache_dir: Path = INSTANCE_CACHE_DIR) -> "InstanceStore":
+        """Store of a HuggingFace dataset (cached by its fingerprint) or of any other iterable of instances
+        (kept in memory).
+        """
+        if (fingerprint := getattr(dataset, "_fingerprint", None)) is None:
+            return cls.build(dataset)
+        path = cache_dir / f"{fingerprint}.sqlite"
+        if path.exists():
+            return cls.open(path)
+        return cls.build(dataset, path)
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM instances").fetchone()[0]
+
+    def __contains__(self, instance_id: str) -> bool:
+        return (
+            self._conn.execute("SELECT 1 FROM instances WHERE instance_id = ?", (instance_id,)).fetchone() is not None
+        )
+
+    def get(self, instance_id: str) -> dict | None:
+        row = self._conn.execute("SELECT data FROM instances WHERE instance_id = ?", (instance_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def __getitem__(self, instance_id: str) -> dict:
+        if (instance := self.get(instance_id)) is None:
+            raise KeyError(instance_id)
+        return instance
+
+    def instance_ids(self) -> list[str]:
+        """IDs of all instances in dataset order."""
+        return [row[0] for row in self._conn.execute("SELECT instance_id FROM instances ORDER BY position")]
+
+    def sorted_instance_id(self, index: int) -> str:
+        """ID of the instance at `index` when sorting all instances by ID."""
+        if index < 0:
+            index += len(self)
+        row = self._conn.execute(
+            "SELECT instance_id FROM instances ORDER BY instance_id LIMIT 1 OFFSET ?", (max(index, 0),)
+        ).fetchone()
+        if index < 0 or row is None:
+            raise IndexError(f"Instance index {index} out of range")
+        return row[0]
+
+    def get_many(self, instance_ids: list[str]) -> list[dict]:
+        """Instances with the given IDs (in the given order, unknown IDs are skipped)."""
+        data = {}
+        for start in range(0, len(instance_ids), _MAX_VARIABLES):
+            chunk = instance_ids[start : start + _MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            data |= dict(
+                self._conn.execute(
+                    f"SELECT instance_id, data FROM instances WHERE instance_id IN ({placeholders})", chunk
+                ).fetchall()
+            )
+        return [json.loads(data[instance_id]) for instance_id in instance_ids if instance_id in data]
+
+    def close(self) -> None:
+        self._conn.close()
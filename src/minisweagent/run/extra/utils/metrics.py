@@ -0,0 +1,221 @@
+"""Metrics of a batch run in the Prometheus text format, to watch a run from a dashboard.
+
+`MetricsRenderer` is a progress renderer (see `progress_events.py`) that aggregates the progress events and
+serves the metrics over HTTP on localhost (`--metrics-port`, scraped from `/metrics`) and/or periodically rewrites
+a `.prom` file (`--metrics-file`, e.g., for the textfile collector of the node exporter):
+
+* Instances per state (from the run manifest), in flight, started, requeued and completed per exit status.
+* Cost, model calls, rate limited calls and retries of all models of the process (from `GLOBAL_MODEL_STATS`),
+  histograms of the latency of model calls and of the backoff before retries.
+* Histograms of the time to start the environment of an instance and of the time to execute an action.
+
+Throughput is the rate of `mswea_instances_completed_total`.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import minisweagent.models
+from minisweagent.run.extra.utils.progress_events import ProgressEvent, ProgressRenderer
+from minisweagent.run.extra.utils.run_manifest import RunManifest
+from minisweagent.utils.histogram import LATENCY_BUCKETS, Histogram
+
+logger = logging.getLogger("minisweagent.metrics")
+
+ENV_START_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+"""Upper bounds (in seconds) for environment start times (including image pulls)."""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(value)
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = {k: str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"") for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+
+def format_metric(name: str, kind: str, help: str, samples: list[tuple[dict[str, str], float]]) -> list[str]:
+    """Lines of a counter or gauge (`kind`) with one sample per label set."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+    return lines
+
+
+def format_histogram(name: str, help: str, histogram: Histogram) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    cumulative_counts = histogram.cumulative_counts()
+    for bound, count in cumulative_counts:
+        lines.append(f'{name}_bucket{{le="{_format_value(bound)}"}} {count}')
+    lines.append(f"{name}_sum {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count {cumulative_counts[-1][1]}")
+    return lines
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: "_MetricsServer"
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.renderer.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # scrapes would clutter the output of the run
+
+
+class _MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], renderer: "MetricsRenderer"):
+        self.renderer = renderer
+        super().__init__(address, _MetricsHandler)
+
+
+class MetricsRenderer(ProgressRenderer):
+    def __init__(
+        self,
+        n_instances: int,
+        *,
+        manifest: RunManifest | None = None,
+        port: int | None = None,
+        host: str = "127.0.0.1",
+        path: Path | None = None,
+        interval: float = 15.0,
+    ):
+        """Serve the metrics on `host:port` (port 0: any free port, see `self.port`) and/or rewrite them to `path`
+        every `interval` seconds. With `manifest`, the number of instances per lifecycle state is included.
+        """
+        self.n_instances = n_instances
+        self.manifest = manifest
+        self.port = port
+        self.host = host
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._running: set[str] = set()
+        self._n_started = 0
+        self._n_requeued = 0
+        self._exit_statuses: Counter[str] = Counter()
+        self.env_start_histogram = Histogram(ENV_START_BUCKETS)
+        self.execute_histogram = Histogram(LATENCY_BUCKETS)
+        self._server: _MetricsServer | None = None
+        self._last_write = 0.0
+
+    def start(self) -> None:
+        if self.port is not None:
+            self._server = _MetricsServer((self.host, self.port), self)
+            self.port = self._server.server_address[1]
+            threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+            logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def handle(self, events: list[ProgressEvent]) -> None:
+        with self._lock:
+            for e in events:
+                if e.event == "start":
+                    self._running.add(e.instance_id)  # type: ignore[arg-type]
+                    self._n_started += 1
+                elif e.event in ("end", "requeued"):
+                    self._running.discard(e.instance_id)  # type: ignore[arg-type]
+                    if e.event == "end":
+                        self._exit_statuses[str(e.data["exit_status"])] += 1
+                    else:
+                        self._n_requeued += 1
+                elif e.event == "env_started":
+                    self.env_start_histogram.observe(e.data["seconds"])
+                elif e.event == "executed":
+                    self.execute_histogram.observe(e.data["seconds"])
+        if self.path is not None and time.time() - self._last_write >= self.interval:
+            self.write()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        stats = minisweagent.models.GLOBAL_MODEL_STATS
+        with self._lock:
+            n_running, n_started, n_requeued = len(self._running), self._n_started, self._n_requeued
+            exit_statuses = dict(self._exit_statuses)
+        lines = format_metric("mswea_instances", "gauge", "Instances to run in this process.", [({}, self.n_instances)])
+        if self.manifest is not None:
+            lines += format_metric(
+                "mswea_instances_by_state",
+                "gauge",
+                "Instances per lifecycle state in the run manifest (all hosts of the run).",
+                [({"state": state}, count) for state, count in sorted(self.manifest.counts().items())],
+            )
+        lines += format_metric("mswea_instances_in_flight", "gauge", "Instances running now.", [({}, n_running)])
+        lines += format_metric("mswea_instances_started_total", "counter", "Instances started.", [({}, n_started)])
+        lines += format_metric(
+            "mswea_instances_requeued_total",
+            "counter",
+            "Instances requeued after infrastructure failures.",
+            [({}, n_requeued)],
+        )
+        lines += format_metric(
+            "mswea_instances_completed_total",
+            "counter",
+            "Instances completed per exit status.",
+            [({"exit_status": exit_status}, count) for exit_status, count in sorted(exit_statuses.items())],
+        )
+        lines += format_metric(
+            "mswea_model_cost_dollars_total", "counter", "Cost of all model calls.", [({}, stats.cost)]
+        )
+        lines += format_metric("mswea_model_calls_total", "counter", "Model calls.", [({}, stats.n_calls)])
+        lines += format_metric(
+            "mswea_model_rate_limited_total",
+            "counter",
+            "Model calls rejected because of rate limits or overload.",
+            [({}, stats.n_rate_limited)],
+        )
+        lines += format_metric(
+            "mswea_model_queue_wait_seconds_total",
+            "counter",
+            "Time model calls waited for rate limit capacity.",
+            [({}, stats.queue_wait_time)],
+        )
+        lines += format_histogram(
+            "mswea_model_latency_seconds", "Latency of single attempts of model calls.", stats.latency_histogram
+        )
+        lines += format_histogram(
+            "mswea_model_retry_wait_seconds",
+            "Backoff before retries of failed model calls.",
+            stats.retry_wait_histogram,
+        )
+        lines += format_histogram(
+            "mswea_env_start_seconds", "Time to start the environment of an instance.", self.env_start_histogram
+        )
+        lines += format_histogram(
+            "mswea_env_execute_seconds", "Time to execute an action in the environment.", self.execute_histogram
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Rewrite the metrics file (atomically, so that collectors never read a partial file)."""
+        assert self.path is not None
+        self._last_write = time.time()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(self.render())
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        if self.path is not None:
+            self.write()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
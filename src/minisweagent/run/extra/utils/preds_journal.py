@@ -0,0 +1,150 @@
+"""Append-only journal of the predictions of a batch run (`preds.jsonl`).
+
+Every finished instance appends one line, so recording a prediction costs O(1) I/O no matter how many
+instances are done (instead of re-reading and re-writing all of `preds.json`).
+The journal is compacted into the `preds.json` that the SWE-bench harness expects with `compact()`.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with path.open("rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _replay(path: Path) -> dict[str, dict]:
+    """The latest record (prediction or removal) per instance ID of the journal at `path`."""
+    records: dict[str, dict] = {}
+    with path.open() as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["instance_id"]] = record
+    return records
+
+
+def _predictions(records: dict[str, dict]) -> dict[str, dict]:
+    """The predictions (without the `timestamp` of their records) of `records`, skipping removed ones."""
+    return {
+        instance_id: {key: value for key, value in record.items() if key != "timestamp"}
+        for instance_id, record in records.items()
+        if not record.get("removed")
+    }
+
+
+def read_journals(output_dir: Path) -> dict[str, dict]:
+    """Predictions from all journals in `output_dir` (`preds.jsonl` and the per-worker `preds.*.jsonl`
+    of runs that share a work queue). If several journals have a record for the same instance, the one
+    with the latest `timestamp` wins (so a stale prediction of an older run can't override a newer one).
+    """
+    latest: dict[str, dict] = {}
+    for path in sorted(output_dir.glob("preds*.jsonl")):
+        for instance_id, record in _replay(path).items():
+            if instance_id not in latest or record.get("timestamp", 0) >= latest[instance_id].get("timestamp", 0):
+                latest[instance_id] = record
+    return _predictions(latest)
+
+
+class PredsJournal:
+    def __init__(self, path: Path, *, sync_every: int = 32, sync_interval: float = 5.0, import_legacy: bool = True):
+        """Open (or create) the journal at `path`.
+
+        Every record is flushed as it is written (so it survives a killed process), but `os.fsync` is only
+        called every `sync_every` records or `sync_interval` seconds (to bound the loss on a host crash
+        without syncing the disk for every instance).
+
+        If there is no journal yet, but a `preds.json` next to it (an output directory from before journals),
+        the predictions from `preds.json` are imported (unless `import_legacy` is False).
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._index: dict[str, dict] = {}
+        """Latest prediction per instance ID (the journal replayed)."""
+        self._n_unsynced = 0
+        self._last_sync = time.monotonic()
+        legacy_preds_path = path.with_name("preds.json")
+        import_legacy = import_legacy and not path.exists() and legacy_preds_path.exists()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            self._index = _predictions(_replay(path))
+        self._file = path.open("a")
+        if self._file.tell() > 0 and not _ends_with_newline(path):
+            self._file.write("\n")  # last record was only partially written
+        if import_legacy:
+            for prediction in json.loads(legacy_preds_path.read_text()).values():
+                self._append(prediction)
+            self.sync()
+
+    @property
+    def instance_ids(self) -> set[str]:
+        """IDs of all instances with a prediction."""
+        with self._lock:
+            return set(self._index)
+
+    def get(self, instance_id: str) -> dict | None:
+        return self._index.get(instance_id)
+
+    def _append(self, record: dict) -> None:
+        # the wall clock time orders the records of different journals (see `read_journals`)
+        self._file.write(json.dumps(record | {"timestamp": time.time()}) + "\n")
+        self._file.flush()
+        if record.get("removed"):
+            self._index.pop(record["instance_id"], None)
+        else:
+            self._index[record["instance_id"]] = record
+        self._n_unsynced += 1
+        if self._n_unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._n_unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def add(self, instance_id: str, model_name: str, result: str) -> None:
+        """Record the prediction of an instance (replacing any previous prediction)."""
+        with self._lock:
+            self._append({"model_name_or_path": model_name, "instance_id": instance_id, "model_patch": result})
+
+    def remove(self, instance_id: str) -> None:
+        """Remove the prediction of an instance (if there is one)."""
+        with self._lock:
+            if instance_id in self._index:
+                self._append({"instance_id": instance_id, "removed": True})
+
+    def sync(self) -> None:
+        """Force all records to disk."""
+        with self._lock:
+            if self._n_unsynced:
+                self._sync()
+
+    def compact(self, preds_path: Path | None = None, *, merge: bool = False) -> Path:
+        """Atomically write all current predictions to `preds_path` (default: `preds.json` next to the journal).
+        With `merge`, the predictions of all other journals in the same directory are included (see `read_journals`).
+        """
+        preds_path = preds_path or self.path.with_name("preds.json")
+        with self._lock:
+            self._file.flush()
+            data = read_journals(self.path.parent) if merge else dict(self._index)
+        tmp_path = preds_path.with_name(preds_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data, indent=2))
+        os.replace(tmp_path, preds_path)
+        return preds_path
+
+    def close(self, *, merge: bool = False) -> None:
+        """Sync the journal, compact it into `preds.json` and close it."""
+        if self._file.closed:
+            return
+        self.sync()
+        self.compact(merge=merge)
+        self._file.close()
@@ -0,0 +1,237 @@
+"""Progress events of a batch run.
+
+Workers only put events on a queue (a `queue.SimpleQueue`, so reporting progress doesn't contend for a lock).
+A single consumer thread takes them off in batches and passes them to the renderers:
+
+* `RichRenderer`: the live display of `RunBatchProgressManager` (the default).
+* `LogRenderer`: a progress log line every so often, for runs without a terminal (`--headless`).
+* `JsonlRenderer`: every event as a JSON line (for monitoring or for analyzing the run later).
+* `MetricsRenderer` (in `metrics.py`): metrics in the Prometheus text format (for dashboards).
+"""
+
+import abc
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Protocol
+
+from rich.live import Live
+
+import minisweagent.models
+from minisweagent.run.extra.utils.batch_progress import RunBatchProgressManager
+
+logger = logging.getLogger("minisweagent.progress")
+
+
+class ProgressReporter(Protocol):
+    """What the workers report progress to (`ProgressEventBus` or directly a `RunBatchProgressManager`)."""
+
+    def on_instance_start(self, instance_id: str) -> None: ...
+
+    def update_instance_status(self, instance_id: str, message: str) -> None: ...
+
+    def on_instance_end(self, instance_id: str, exit_status: str | None) -> None: ...
+
+    def on_instance_requeued(self, instance_id: str, exit_status: str | None) -> None: ...
+
+    def on_uncaught_exception(self, instance_id: str, exception: Exception) -> None: ...
+
+    def on_env_started(self, instance_id: str, seconds: float) -> None: ...
+
+    def on_action_executed(self, instance_id: str, seconds: float) -> None: ...
+
+    def update_prefetch_status(self, *, pulled: int, pulling: int, total: int) -> None: ...
+
+
+@dataclass
+class ProgressEvent:
+    event: str
+    """One of `start`, `status`, `end`, `requeued`, `env_started`, `executed` and `prefetch`."""
+    instance_id: str | None = None
+    data: dict = field(default_factory=dict)
+    time: float = field(default_factory=time.time)
+
+
+class ProgressRenderer(abc.ABC):
+    def start(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def handle(self, events: list[ProgressEvent]) -> None:
+        """Called from the consumer thread with the events since the last call (in order)."""
+
+    def close(self) -> None:
+        pass
+
+
+class RichRenderer(ProgressRenderer):
+    def __init__(self, manager: RunBatchProgressManager, *, refresh_per_second: float = 4):
+        """Show the progress with `manager` in a `rich.live.Live` display."""
+        self.manager = manager
+        self.refresh_per_second = refresh_per_second
+        self._live: Live | None = None
+
+    def start(self) -> None:
+        self._live = Live(self.manager.render_group, refresh_per_second=self.refresh_per_second)
+        self._live.start()
+
+    def handle(self, events: list[ProgressEvent]) -> None:
+        # Only the last status of an instance in the batch would be visible anyway
+        last_status = {e.instance_id: i for i, e in enumerate(events) if e.event == "status"}
+        for i, e in enumerate(events):
+            if e.event == "start":
+                self.manager.on_instance_start(e.instance_id)  # type: ignore[arg-type]
+            elif e.event == "status" and last_status[e.instance_id] == i:
+                self.manager.update_instance_status(e.instance_id, e.data["message"])  # type: ignore[arg-type]
+            elif e.event == "end":
+                self.manager.on_instance_end(e.instance_id, e.data["exit_status"])  # type: ignore[arg-type]
+            elif e.event == "requeued":
+                self.manager.on_instance_requeued(e.instance_id, e.data["exit_status"])  # type: ignore[arg-type]
+            elif e.event == "prefetch":
+                self.manager.update_prefetch_status(**e.data)
+
+    def close(self) -> None:
+        if self._live is not None:
+            self._live.stop()
+
+
+class LogRenderer(ProgressRenderer):
+    def __init__(self, n_instances: int, *, interval: float = 60.0):
+        """Log the progress every `interval` seconds (and when the run ends)."""
+        self.n_instances = n_instances
+        self.interval = interval
+        self._start_time = time.time()
+        self._last_log = self._start_time
+        self._running: set[str] = set()
+        self._exit_statuses: Counter[str] = Counter()
+        self._n_requeued = 0
+
+    def handle(self, events: list[ProgressEvent]) -> None:
+        for e in events:
+            if e.event == "start":
+                self._running.add(e.instance_id)  # type: ignore[arg-type]
+            elif e.event in ("end", "requeued"):
+                self._running.discard(e.instance_id)  # type: ignore[arg-type]
+                if e.event == "end":
+                    self._exit_statuses[str(e.data["exit_status"])] += 1
+                else:
+                    self._n_requeued += 1
+        if time.time() - self._last_log >= self.interval:
+            self.log()
+
+    def log(self) -> None:
+        self._last_log = time.time()
+        n_done = sum(self._exit_statuses.values())
+        elapsed = self._last_log - self._start_time
+        eta = f", eta {timedelta(seconds=int(elapsed / n_done * (self.n_instances - n_done)))}" if n_done else ""
+        logger.info(
+            f"Progress: {n_done}/{self.n_instances} instances done, {len(self._running)} running, "
+            f"{self._n_requeued} requeued, cost ${minisweagent.models.GLOBAL_MODEL_STATS.cost:.2f}, "
+            f"elapsed {timedelta(seconds=int(elapsed))}{eta}, exit statuses {dict(self._exit_statuses.most_common())}"
+        )
+
+    def close(self) -> None:
+        self.log()
+
+
+class JsonlRenderer(ProgressRenderer):
+    def __init__(self, path: Path):
+        """Append every event to `path` as a JSON line."""
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("a")
+
+    def handle(self, events: list[ProgressEvent]) -> None:
+        for e in events:
+            self._file.write(json.dumps(asdict(e)) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ProgressEventBus:
+    def __init__(self, renderers: list[ProgressRenderer], *, interval: float = 0.25):
+        """Collect the progress events of all workers and pass them to `renderers` every `interval` seconds.
+        Use as a context manager (or call `start` and `close`).
+        """
+        self.renderers = renderers
+        self.interval = interval
+        self._queue: queue.SimpleQueue[ProgressEvent] = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- Producers (any thread) ---
+
+    def on_instance_start(self, instance_id: str) -> None:
+        self._queue.put(ProgressEvent("start", instance_id))
+
+    def update_instance_status(self, instance_id: str, message: str) -> None:
+        self._queue.put(ProgressEvent("status", instance_id, {"message": message}))
+
+    def on_instance_end(self, instance_id: str, exit_status: str | None) -> None:
+        self._queue.put(ProgressEvent("end", instance_id, {"exit_status": exit_status}))
+
+    def on_instance_requeued(self, instance_id: str, exit_status: str | None) -> None:
+        self._queue.put(ProgressEvent("requeued", instance_id, {"exit_status": exit_status}))
+
+    def on_uncaught_exception(self, instance_id: str, exception: Exception) -> None:
+        self.on_instance_end(instance_id, f"Uncaught {type(exception).__name__}")
+
+    def on_env_started(self, instance_id: str, seconds: float) -> None:
+        self._queue.put(ProgressEvent("env_started", instance_id, {"seconds": seconds}))
+
+    def on_action_executed(self, instance_id: str, seconds: float) -> None:
+        self._queue.put(ProgressEvent("executed", instance_id, {"seconds": seconds}))
+
+    def update_prefetch_status(self, *, pulled: int, pulling: int, total: int) -> None:
+        self._queue.put(ProgressEvent("prefetch", data={"pulled": pulled, "pulling": pulling, "total": total}))
+
+    # --- Consumer ---
+
+    def _drain(self) -> list[ProgressEvent]:
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _dispatch(self, events: list[ProgressEvent]) -> None:
+        for renderer in self.renderers:
+            try:
+                renderer.handle(events)
+            except Exception as e:
+                logger.error(f"Progress renderer {type(renderer).__name__} failed: {e}", exc_info=True)
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._dispatch(self._drain())
+
+    def start(self) -> "ProgressEventBus":
+        for renderer in self.renderers:
+            renderer.start()
+        self._thread = threading.Thread(target=self._loop, name="progress", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Pass on the remaining events and close the renderers."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._dispatch(self._drain())
+        for renderer in self.renderers:
+            renderer.close()
+
+    def __enter__(self) -> "ProgressEventBus":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,37 @@
+"""Requeue instances that failed for infrastructure reasons (e.g., the image could not be pulled, `docker run`
+timed out or the `run.env_startup_command` failed).
+
+Such failures happen before the agent makes any model call, so retrying them doesn't cost any LM budget.
+The instance is retried after an exponential backoff (while the workers process other instances), until it
+has failed `max_attempts` times. Then it is recorded as `failed_infra` like before.
+"""
+
+import random
+
+
+class RequeuePolicy:
+    def __init__(
+        self, *, max_attempts: int = 3, base_delay: float = 30.0, max_delay: float = 600.0, jitter: float = 0.1
+    ):
+        """Configured with `run.requeue` in the config.
+
+        Args:
+            max_attempts: Number of attempts (including the first one) before an instance is given up (1: never requeue).
+            base_delay: Seconds before the first retry, doubled for every further retry.
+            max_delay: Upper bound of the delay.
+            jitter: Delays are shortened by up to this fraction, so that instances that failed together
+                (e.g., because the docker daemon was overloaded) are not retried all at once.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, n_failures: int) -> float | None:
+        """Seconds to wait before retrying an instance after its `n_failures`-th infrastructure failure
+        (None if it shouldn't be retried).
+        """
+        if n_failures >= self.max_attempts:
+            return None
+        delay = min(self.base_delay * 2 ** (n_failures - 1), self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1)
@@ -0,0 +1,230 @@
+"""Manifest of a batch run: the lifecycle state of every instance in a SQLite file in the output directory.
+
+Every state change is one small write (instead of rewriting a report after every instance), so the state of a run
+(and which instances to skip or retry) can be queried without opening the trajectories of all instances.
+Runs that share the output directory (e.g., through a work queue) share the manifest.
+
+States: `queued` -> `starting_env` -> `running` -> `saved` (the agent finished, with any exit status),
+`failed_infra` (the environment could not be started) or `failed_agent` (the agent raised an exception).
+Instances whose environment could not be started can be requeued (back to `queued`); every requeue is recorded
+with its reason in the `requeues` table.
+"""
+
+import os
+import socket
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import contextmanager
+from pathlib import Path
+
+QUEUED = "queued"
+STARTING_ENV = "starting_env"
+RUNNING = "running"
+SAVED = "saved"
+FAILED_INFRA = "failed_infra"
+FAILED_AGENT = "failed_agent"
+
+FAILED_STATES = (FAILED_INFRA, FAILED_AGENT)
+FINISHED_STATES = (SAVED, *FAILED_STATES)
+
+_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    queued_at REAL,
+    started_at REAL,
+    env_ready_at REAL,
+    finished_at REAL,
+    cost REAL,
+    n_steps INTEGER,
+    exit_status TEXT,
+    infra_failures INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+)
+""",
+    "CREATE INDEX IF NOT EXISTS instances_state ON instances (state)",
+    """
+CREATE TABLE IF NOT EXISTS requeues (
+    instance_id TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    worker TEXT,
+    reason TEXT NOT NULL,
+    delay REAL NOT NULL,
+    time REAL NOT NULL
+)
+""",
+)
+
+
+class RunManifest:
+    def __init__(self, path: Path, *, worker_id: str | None = None):
+        """Open (or create) the manifest at `path` (usually `manifest.sqlite` in the output directory).
+
+        Args:
+            path: Path to the SQLite file.
+            worker_id: Recorded with the instances that this run processes (default: `<hostname>-<pid>`).
+        """
+        self.path = path
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _transaction(self):
+        """Connection with a write transaction. A new connection per transaction, so that threads can share it."""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def queue(self, instance_ids: Iterable[str]) -> None:
+        """Mark instances as queued (finished instances are redone, with a fresh count of infrastructure failures).
+        Instances that are queued or being processed (possibly by another run) are left as they are.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO instances (instance_id, state, queued_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (instance_id) DO UPDATE SET state = excluded.state, queued_at = excluded.queued_at, "
+                "infra_failures = 0, updated_at = excluded.updated_at WHERE state IN (?, ?, ?)",
+                [(instance_id, QUEUED, now, now, *FINISHED_STATES) for instance_id in instance_ids],
+            )
+
+    def start(self, instance_id: str) -> None:
+        """The run started processing the instance (starting its environment). Counts as a new attempt."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO instances (instance_id, state, attempts, worker, started_at, updated_at) "
+                "VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (instance_id) DO UPDATE SET state = excluded.state, attempts = attempts + 1, "
+                "worker = excluded.worker, started_at = excluded.started_at, env_ready_at = NULL, "
+                "finished_at = NULL, cost = NULL, n_steps = NULL, exit_status = NULL, updated_at = excluded.updated_at",
+                (instance_id, STARTING_ENV, self.worker_id, now, now),
+            )
+
+    def env_ready(self, instance_id: str) -> None:
+        """The environment is up and the agent runs."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE instances SET state = ?, env_ready_at = ?, updated_at = ? WHERE instance_id = ?",
+                (RUNNING, now, now, instance_id),
+            )
+
+    def finish(
+        self, instance_id: str, state: str, *, exit_status: str | None, cost: float = 0.0, n_steps: int = 0
+    ) -> None:
+        """The instance is done (`state` is one of `FINISHED_STATES`)."""
+        if state not in FINISHED_STATES:
+            raise ValueError(f"Not a finished state: {state}")
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE instances SET state = ?, exit_status = ?, cost = ?, n_steps = ?, finished_at = ?, "
+                "updated_at = ? WHERE instance_id = ?",
+                (state, exit_status, cost, n_steps, now, now, instance_id),
+            )
+
+    def record_infra_failure(self, instance_id: str) -> int:
+        """Count an infrastructure failure of the instance. Returns its number of infrastructure failures
+        since it was queued (over all runs that share the manifest).
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE instances SET infra_failures = infra_failures + 1 WHERE instance_id = ?", (instance_id,)
+            )
+            row = conn.execute("SELECT infra_failures FROM instances WHERE instance_id = ?", (instance_id,)).fetchone()
+        return row[0] if row is not None else 1
+
+    def requeue(self, instance_id: str, *, reason: str, delay: float) -> None:
+        """The instance is retried in `delay` seconds because of an infrastructure failure."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE instances SET state = ?, queued_at = ?, updated_at = ? WHERE instance_id = ?",
+                (QUEUED, now, now, instance_id),
+            )
+            conn.execute(
+                "INSERT INTO requeues (instance_id, attempt, worker, reason, delay, time) "
+                "SELECT instance_id, attempts, ?, ?, ?, ? FROM instances WHERE instance_id = ?",
+                (self.worker_id, reason, delay, now, instance_id),
+            )
+
+    def requeues(self) -> list[dict]:
+        """All requeues (instance ID, attempt that failed, worker, reason, delay, time) in order."""
+        columns = ("instance_id", "attempt", "worker", "reason", "delay", "time")
+        rows = self._query(f"SELECT {', '.join(columns)} FROM requeues ORDER BY time")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=60)
+        try:
+            return conn.execute(sql, parameters).fetchall()
+        finally:
+            conn.close()
+
+    def get(self, instance_id: str) -> dict | None:
+        """All fields of an instance (None if it is not in the manifest)."""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=60)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT * FROM instances WHERE instance_id = ?", (instance_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row is not None else None
+
+    def states(self) -> dict[str, str]:
+        """Instance ID -> state."""
+        return dict(self._query("SELECT instance_id, state FROM instances"))
+
+    def instance_ids(self, states: Iterable[str]) -> set[str]:
+        """IDs of the instances in any of `states`."""
+        states = list(states)
+        placeholders = ", ".join("?" * len(states))
+        return {
+            row[0]
+            for row in self._query(f"SELECT instance_id FROM instances WHERE state IN ({placeholders})", tuple(states))
+        }
+
+    def counts(self) -> dict[str, int]:
+        """Number of instances per state."""
+        return dict(self._query("SELECT state, COUNT(*) FROM instances GROUP BY state"))
+
+    def summary(self) -> dict:
+        """Counts per state and per exit status, attempts, cost and timings of the finished instances."""
+        n_finished, attempts, cost, env_time, agent_time = self._query(
+            "SELECT COUNT(*), SUM(attempts), SUM(cost), AVG(env_ready_at - started_at), AVG(finished_at - env_ready_at) "
+            f"FROM instances WHERE state IN ({', '.join('?' * len(FINISHED_STATES))})",
+            FINISHED_STATES,
+        )[0]
+        return {
+            "states": self.counts(),
+            "exit_statuses": dict(
+                self._query(
+                    "SELECT exit_status, COUNT(*) FROM instances WHERE exit_status IS NOT NULL "
+                    "GROUP BY exit_status ORDER BY COUNT(*) DESC"
+                )
+            ),
+            "n_finished": n_finished,
+            "attempts": attempts or 0,
+            "requeues": dict(
+                self._query("SELECT instance_id, COUNT(*) FROM requeues GROUP BY instance_id ORDER BY instance_id")
+            ),
+            "cost": cost or 0.0,
+            "mean_env_start_time": env_time,
+            "mean_agent_time": agent_time,
+        }
@@ -0,0 +1,154 @@
+"""Order the instances of a batch run by their expected duration (longest first), so that long instances
+don't start at the end of the run while all other workers are idle.
+
+Durations are taken from trajectories of prior runs (the wall time of the instance if it was recorded,
+else the time of the agent steps or the number of steps times the average time per step).
+Instances without history get the average duration of their repository, or of all instances.
+"""
+
+import heapq
+import json
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger("minisweagent.scheduling")
+
+
+def get_repo(instance: dict) -> str:
+    """Repository of an instance from its ID (e.g., `django__django` for `django__django-11099`).
+    Always derived from the ID (not the `repo` field), because the duration history only has instance IDs.
+    """
+    return instance["instance_id"].rsplit("-", 1)[0]
+
+
+def _last_line(path: Path, block_size: int = 65536) -> bytes:
+    with path.open("rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b""
+        while position > 0 and data.rstrip(b"\n").count(b"\n") == 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+    return data.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+
+
+def _read_info(path: Path) -> dict | None:
+    """The `info` block of a trajectory (for streamed trajectories, only the footer is read)."""
+    try:
+        if path.suffix == ".jsonl":
+            record = json.loads(_last_line(path))
+            return record.get("info") if record.get("type") == "footer" else None
+        return json.loads(path.read_text()).get("info")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def read_durations(trajectory_dir: Path) -> dict[str, dict]:
+    """Instance ID -> `{"time": seconds or None, "steps": number of steps}` from the trajectories in
+    `trajectory_dir` (the output directory of a batch run).
+    """
+    durations = {}
+    for path in sorted([*trajectory_dir.glob("*/*.traj.json"), *trajectory_dir.glob("*/*.traj.jsonl")]):
+        if (info := _read_info(path)) is None:
+            continue
+        model_stats = info.get("model_stats", {})
+        duration = info.get("instance_time") or model_stats.get("step_time") or None
+        durations[path.parent.name] = {"time": duration, "steps": model_stats.get("api_calls", 0)}
+    return durations
+
+
+class DurationEstimates:
+    def __init__(self, durations: dict[str, dict]):
+        """Estimate durations from the durations of prior runs (see `read_durations`)."""
+        step_times = [d["time"] / d["steps"] for d in durations.values() if d["time"] and d["steps"]]
+        seconds_per_step = statistics.mean(step_times) if step_times else None
+        self.durations: dict[str, float] = {}
+        for instance_id, duration in durations.items():
+            if duration["time"]:
+                self.durations[instance_id] = duration["time"]
+            elif duration["steps"] and seconds_per_step is not None:
+                self.durations[instance_id] = duration["steps"] * seconds_per_step
+        by_repo = defaultdict(list)
+        for instance_id, duration in self.durations.items():
+            by_repo[get_repo({"instance_id": instance_id})].append(duration)
+        self.repo_priors = {repo: statistics.mean(values) for repo, values in by_repo.items()}
+        self.global_prior = statistics.mean(self.durations.values()) if self.durations else 0.0
+
+    @classmethod
+    def from_trajectories(cls, trajectory_dir: Path) -> "DurationEstimates":
+        estimates = cls(read_durations(trajectory_dir))
+        logger.info(
+            f"Duration history: {len(estimates.durations)} instances from {len(estimates.repo_priors)} repositories "
+            f"in {trajectory_dir}"
+        )
+        return estimates
+
+    def predict(self, instance: dict) -> tuple[float, str]:
+        """Expected duration in seconds and where it comes from (`history`, `repo` or `global`)."""
+        if (duration := self.durations.get(instance["instance_id"])) is not None:
+            return duration, "history"
+        if (duration := self.repo_priors.get(get_repo(instance))) is not None:
+            return duration, "repo"
+        return self.global_prior, "global"
+
+
+def predict_makespan(durations: list[float], workers: int) -> float:
+    """Makespan when the durations are processed in order by `workers` workers (each takes the next one when free)."""
+    finish_times = [0.0] * max(workers, 1)
+    for duration in durations:
+        heapq.heappush(finish_times, heapq.heappop(finish_times) + duration)
+    return max(finish_times)
+
+
+class Schedule:
+    def __init__(self, instances: list[dict], estimates: DurationEstimates, workers: int):
+        """Order `instances` longest expected duration first."""
+        predictions = {instance["instance_id"]: estimates.predict(instance) for instance in instances}
+        self.instances = sorted(instances, key=lambda instance: -predictions[instance["instance_id"]][0])
+        self.predicted = {instance_id: duration for instance_id, (duration, _) in predictions.items()}
+        self.workers = workers
+        self.predicted_makespan = predict_makespan([self.predicted[i["instance_id"]] for i in self.instances], workers)
+        self.start_time = time.time()
+        sources = defaultdict(int)
+        for _, source in predictions.values():
+            sources[source] += 1
+        logger.info(
+            f"Scheduled {len(instances)} instances longest first (estimates from {dict(sources)}), "
+            f"predicted makespan {self.predicted_makespan / 60:.1f} min with {workers} workers"
+        )
+
+    def report(self, output_dir: Path) -> dict:
+        """Compare the predicted and actual makespan and durations, log it and write it to `schedule_report.yaml`."""
+        actual_makespan = time.time() - self.start_time
+        actual = {
+            instance_id: duration["time"]
+            for instance_id, duration in read_durations(output_dir).items()
+            if instance_id in self.predicted and duration["time"]
+        }
+        errors = [abs(self.predicted[instance_id] - duration) for instance_id, duration in actual.items()]
+        report = {
+            "workers": self.workers,
+            "predicted_makespan": self.predicted_makespan,
+            "actual_makespan": actual_makespan,
+            "mean_absolute_error": statistics.mean(errors) if errors else None,
+            "instances": {
+                instance["instance_id"]: {
+                    "predicted": self.predicted[instance["instance_id"]],
+                    "actual": actual.get(instance["instance_id"]),
+                }
+                for instance in self.instances
+            },
+        }
+        (output_dir / "schedule_report.yaml").write_text(yaml.dump(report, sort_keys=False))
+        logger.info(
+            f"Makespan: predicted {self.predicted_makespan / 60:.1f} min, actual {actual_makespan / 60:.1f} min"
+            + (f" (mean absolute error per instance {report['mean_absolute_error']:.0f}s)" if errors else "")
+        )
+        return report
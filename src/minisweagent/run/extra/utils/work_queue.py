@@ -0,0 +1,189 @@
+"""Queue of instances in a SQLite file, so that batch runs on several hosts (sharing a filesystem)
+can cooperate on one run.
+
+Every run adds its instances to the queue (instances that are already in the queue are ignored) and then
+claims instances one at a time. A claim is a lease that is renewed by a heartbeat while the instance is processed.
+Leases of dead runs expire and the instances are claimed again by other runs.
+Instances can be returned to the queue with a delay (e.g., after an infrastructure failure), then they are
+pending, but can only be claimed once their `lease_expires` has passed.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger("minisweagent.work_queue")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    instance_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class WorkQueue:
+    def __init__(self, path: Path, *, lease_timeout: float = 600.0, worker_id: str | None = None):
+        """Open (or create) the queue at `path`.
+
+        Args:
+            path: Path to the SQLite file (on a filesystem that all hosts share).
+            lease_timeout: Seconds without heartbeat after which a claimed instance is claimed again.
+            worker_id: Identifies this run in the queue (default: `<hostname>-<pid>`).
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._held: set[str] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._closed = threading.Event()
+        self._heartbeat_thread: threading.Thread | None = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """Connection with a write transaction. A new connection per transaction, so that threads can share the queue."""
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def add(self, instances: list[dict]) -> int:
+        """Add instances to the queue (keeping the order). Returns the number of instances that were not queued yet."""
+        with self._transaction() as conn:
+            start = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM instances").fetchone()[0]
+            n_before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO instances (instance_id, position, data) VALUES (?, ?, ?)",
+                [(instance["instance_id"], start + i, json.dumps(instance)) for i, instance in enumerate(instances)],
+            )
+            return conn.total_changes - n_before
+
+    def claim(self) -> dict | None:
+        """Claim the next pending instance (or one with an expired lease). None if there is nothing to claim now
+        (see `wait_time` for requeued instances that can be claimed later).
+        """
+        if self._stopped.is_set():
+            return None
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT instance_id, data, status FROM instances "
+                "WHERE status IN ('pending', 'running') AND COALESCE(lease_expires, 0) < ? "
+                "ORDER BY position LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            instance_id, data, status = row
+            conn.execute(
+                "UPDATE instances SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE instance_id = ?",
+                (self.worker_id, now + self.lease_timeout, instance_id),
+            )
+        if status == "running":
+            logger.warning(f"Reclaimed {instance_id} (lease expired)")
+        with self._lock:
+            self._held.add(instance_id)
+        self._start_heartbeat()
+        return json.loads(data)
+
+    def complete(self, instance_id: str, *, retry_delay: float | None = None) -> bool:
+        """Mark the instance as done, or with `retry_delay`, return it to the queue to be claimed again
+        in `retry_delay` seconds. Returns False (and changes nothing) if the lease of this run expired and the
+        instance was reclaimed by another run.
+        """
+        with self._lock:
+            self._held.discard(instance_id)
+        with self._transaction() as conn:
+            if retry_delay is None:
+                cursor = conn.execute(
+                    "UPDATE instances SET status = 'done', lease_expires = NULL "
+                    "WHERE instance_id = ? AND worker = ? AND status = 'running'",
+                    (instance_id, self.worker_id),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE instances SET status = 'pending', worker = NULL, lease_expires = ? "
+                    "WHERE instance_id = ? AND worker = ? AND status = 'running'",
+                    (time.time() + retry_delay, instance_id, self.worker_id),
+                )
+        if cursor.rowcount == 0:
+            logger.warning(f"Lease of {instance_id} was lost (reclaimed by another run), not completing it")
+            return False
+        return True
+
+    def wait_time(self) -> float | None:
+        """Seconds until the next instance might become claimable: a requeued instance, or an instance that is
+        running in another run (claimable if its lease expires because that run died). None if there are no such
+        instances left (or if the queue is stopped).
+        """
+        if self._stopped.is_set():
+            return None
+        with self._transaction() as conn:
+            (next_time,) = conn.execute(
+                "SELECT MIN(COALESCE(lease_expires, 0)) FROM instances "
+                "WHERE status = 'pending' OR (status = 'running' AND COALESCE(worker, '') != ?)",
+                (self.worker_id,),
+            ).fetchone()
+        return None if next_time is None else max(next_time - time.time(), 0.0)
+
+    def heartbeat(self) -> None:
+        """Renew the leases of all instances that are claimed by this run."""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE instances SET lease_expires = ? WHERE instance_id = ? AND worker = ? AND status = 'running'",
+                [(time.time() + self.lease_timeout, instance_id, self.worker_id) for instance_id in held],
+            )
+
+    def _heartbeat_loop(self) -> None:
+        while not self._closed.wait(self.lease_timeout / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                logger.warning(f"Heartbeat failed: {e}")
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+
+    def counts(self) -> dict[str, int]:
+        """Number of instances per status."""
+        with self._transaction() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM instances GROUP BY status").fetchall())
+
+    def stop(self) -> None:
+        """Don't claim any more instances (the claimed ones can still be completed)."""
+        self._stopped.set()
+
+    def close(self) -> None:
+        """Stop claiming and stop the heartbeat. Leases of unfinished instances expire, so that others claim them."""
+        self._stopped.set()
+        self._closed.set()
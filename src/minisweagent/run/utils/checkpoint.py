@@ -0,0 +1,135 @@
+"""Per-step checkpoints of an agent run, so that a crashed batch run can resume an instance
+from its last completed step instead of starting over.
+
+A checkpoint holds the messages, the model counters and the step timings. It is a JSON lines log
+(`<instance_id>.checkpoint.jsonl`) to which every step only appends what is new (messages and timings), followed by
+a `state` record with the counters. So a checkpoint costs O(1) I/O per step (instead of rewriting the whole
+history), and a partially written step is ignored when loading (everything after the last `state` record).
+Every step is synced to disk (a sync takes much less time than a step), so checkpoints also survive a host crash or
+reboot.
+
+To resume, the state of the (fresh) environment is rebuilt by replaying the actions of the checkpoint
+that might have changed it (i.e., all actions except for read-only commands like `cat` or `grep`).
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+from pathlib import Path
+
+from minisweagent import Agent
+from minisweagent.agents.default import FormatError
+
+logger = logging.getLogger("checkpoint")
+
+READ_ONLY_ACTION_REGEX = (
+    r"^(?!.*\s-(?:delete|exec|execdir|ok|okdir|fprint\w*|fls)\b)"  # actions of `find` that write
+    r"\s*(?:cat|ls|nl|head|tail|grep|rg|find|pwd|wc|tree|git\s+(?:diff|status|log|show))\b[^>;&|`$]*"
+    r"(?:\|\s*(?:head|tail|sed\s+-n|grep|wc|sort|uniq|nl)\b[^>;&|`$]*)*$"
+)
+"""Actions matching this regex are not replayed when resuming. Anything with redirects, `;`, `&&`,
+command substitution etc. is replayed to be on the safe side."""
+
+
+class CheckpointWriter:
+    def __init__(self, path: Path):
+        """Checkpoint log at `path`. It is started over by the first `save`."""
+        self.path = path
+        self._n_messages: int | None = None
+        self._n_timings = 0
+        self._template_vars: dict | None = None
+
+    def save(self, agent: Agent) -> None:
+        """Append the messages and timings that are new since the last save, and the current counters."""
+        messages = agent.messages
+        timings = timer.timings if (timer := getattr(agent, "timer", None)) else []
+        mode = "a"
+        if self._n_messages is None or len(messages) < self._n_messages:  # first save or a new run of the agent
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            mode, self._n_messages, self._n_timings, self._template_vars = "w", 0, 0, None
+        records = [{"type": "message", "message": message} for message in messages[self._n_messages :]]
+        records += [{"type": "timing", "timing": timing} for timing in timings[self._n_timings :]]
+        if (template_vars := getattr(agent, "extra_template_vars", {})) != self._template_vars:
+            records.append({"type": "extra_template_vars", "extra_template_vars": template_vars})
+            self._template_vars = dict(template_vars)
+        model_stats = {"instance_cost": agent.model.cost, "api_calls": agent.model.n_calls}
+        records.append({"type": "state", "model_stats": model_stats})
+        with self.path.open(mode) as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        if mode == "w":  # the new file has to be synced to its directory, too
+            dir_fd = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self._n_messages, self._n_timings = len(messages), len(timings)
+
+    def discard(self) -> None:
+        """Delete the checkpoint (e.g., because the run finished)."""
+        self.path.unlink(missing_ok=True)
+        self._n_messages = None
+
+
+def load_checkpoint(path: Path) -> dict | None:
+    """The state of the last complete step of the checkpoint log at `path` (None if there is none)."""
+    if not path.exists():
+        return None
+    checkpoint: dict | None = None
+    pending: dict = {"messages": [], "timings": [], "extra_template_vars": {}}
+    with path.open() as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring the partially written last step of the checkpoint {path}")
+                break
+            match record["type"]:
+                case "message":
+                    pending["messages"].append(record["message"])
+                case "timing":
+                    pending["timings"].append(record["timing"])
+                case "extra_template_vars":
+                    pending["extra_template_vars"] = record["extra_template_vars"]
+                case "state":
+                    pending["model_stats"] = record["model_stats"]
+                    checkpoint = {
+                        key: list(value) if isinstance(value, list) else value for key, value in pending.items()
+                    }
+    return checkpoint
+
+
+def get_replay_actions(agent: Agent, messages: list[dict], read_only_regex: str = READ_ONLY_ACTION_REGEX) -> list[str]:
+    """Actions in `messages` that might have changed the state of the environment, in order."""
+    actions = []
+    for message in messages:
+        if message["role"] != "assistant":
+            continue
+        try:
+            action = agent.parse_action(message)["action"]  # type: ignore[attr-defined]
+        except FormatError:
+            continue
+        if not re.match(read_only_regex, action, re.DOTALL):
+            actions.append(action)
+    return actions
+
+
+def restore_checkpoint(agent: Agent, checkpoint: dict) -> None:
+    """Restore messages and counters from the checkpoint and replay the actions in the environment of the agent."""
+    for action in get_replay_actions(agent, checkpoint["messages"]):
+        try:
+            agent.env.execute(action)
+        except (TimeoutError, subprocess.TimeoutExpired):
+            logger.warning(f"Replayed action timed out: {action!r}")
+    agent.messages = checkpoint["messages"]
+    if (writer := getattr(agent, "trajectory_writer", None)) is not None:
+        for message in agent.messages:
+            writer.add_message(message)
+    agent.extra_template_vars |= checkpoint["extra_template_vars"]  # type: ignore[attr-defined]
+    agent.model.cost = checkpoint["model_stats"]["instance_cost"]
+    agent.model.n_calls = checkpoint["model_stats"]["api_calls"]
+    if timer := getattr(agent, "timer", None):
+        timer.timings = checkpoint["timings"]
@@ -5,12 +5,76 @@ from typing import Any
 
 from minisweagent import Agent, __version__
 
+STREAM_FORMAT = "mini-swe-agent-1-stream"
+
 
 def _get_class_name_with_module(obj: Any) -> str:
     """Get the full class name with module path."""
     return f"{obj.__class__.__module__}.{obj.__class__.__name__}"
 
 
+class TrajectoryWriter:
+    """Appends the trajectory to a JSONL file while the agent runs (`.traj.jsonl`).
+
+    The first record is a header, then there is one record per message and finally a footer with the `info` block:
+
+        {"type": "header", "trajectory_format": "mini-swe-agent-1-stream", "mini_version": ..., **header}
+        {"type": "message", "message": {...}}
+        {"type": "footer", "info": {...}, **extra}
+
+    Every record is flushed as it is written, so a killed process leaves all messages up to that point on disk.
+    Use `load_traj` to read it in the `mini-swe-agent-1` format.
+    """
+
+    def __init__(self, path: Path, **header):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = path.open("w")
+        self._write({"type": "header", "trajectory_format": STREAM_FORMAT, "mini_version": __version__, **header})
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def add_message(self, message: dict) -> None:
+        self._write({"type": "message", "message": message})
+
+    def close(self, info: dict, **extra) -> None:
+        """Write the footer and close the file."""
+        if self._file.closed:
+            return
+        self._write({"type": "footer", "info": info, **extra})
+        self._file.close()
+
+
+def load_traj(path: Path) -> dict | list:
+    """Load a trajectory file. Streamed trajectories (`.traj.jsonl`) are consolidated into the `mini-swe-agent-1`
+    format. A streamed trajectory without footer (the run was killed) has an `info` block without exit status.
+    """
+    if path.suffix != ".jsonl":
+        return json.loads(path.read_text())
+    header, footer, messages = {}, {}, []
+    with path.open() as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # last record was only partially written
+            match record.pop("type", None):
+                case "header":
+                    header = record
+                case "message":
+                    messages.append(record["message"])
+                case "footer":
+                    footer = record
+    if header.get("trajectory_format") != STREAM_FORMAT:
+        raise ValueError(f"Not a streamed trajectory: {path}")
+    del header["trajectory_format"]
+    mini_version = header.pop("mini_version", None)
+    info = footer.pop("info", {"exit_status": None, "submission": None, "mini_version": mini_version})
+    return {"info": info, "messages": messages, "trajectory_format": "mini-swe-agent-1"} | header | footer
+
+
 def save_traj(
     agent: Agent | None,
     path: Path | None,
@@ -24,6 +88,10 @@ def save_traj(
 ):
     """Save the trajectory of the agent to a file.
 
+    If the agent streams its trajectory to `path` (see `TrajectoryWriter`), only the footer is written.
+    Any other `.traj.jsonl` path gets a complete streamed trajectory, all other paths the consolidated
+    `mini-swe-agent-1` format.
+
     Args:
         agent: The agent to save the trajectory of.
         path: The path to save the trajectory to.
@@ -61,10 +129,31 @@ def save_traj(
             "model_type": _get_class_name_with_module(agent.model),
             "environment_type": _get_class_name_with_module(agent.env),
         }
+        if timer := getattr(agent, "timer", None):
+            data["info"]["model_stats"] |= timer.summary()  # type: ignore[index]
+            data["timings"] = timer.timings
+        if (compactor := getattr(agent, "compactor", None)) and compactor.policies:
+            data["info"]["compaction_stats"] = compactor.stats  # type: ignore[index]
     if extra_info:
         data["info"].update(extra_info)  # type: ignore[union-attr]
 
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(data, indent=2))
+    writer: TrajectoryWriter | None = getattr(agent, "trajectory_writer", None)
+    if writer is not None and writer.path != path:
+        writer.close(**_split_footer(data))
+        writer = None
+    if writer is None and path.suffix == ".jsonl":
+        writer = TrajectoryWriter(path)
+        for message in data["messages"]:
+            writer.add_message(message)
+    if writer is not None:
+        writer.close(**_split_footer(data))
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=2))
     if print_path:
         print_fct(f"Saved trajectory to '{path}'")
+
+
+def _split_footer(data: dict) -> dict:
+    """Footer of a streamed trajectory: everything but the messages (and the format, which is in the header)."""
+    return {k: v for k, v in data.items() if k not in ("messages", "trajectory_format")}
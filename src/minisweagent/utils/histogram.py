@@ -0,0 +1,42 @@
+"""Thread-safe histograms of durations (with the fixed buckets of a Prometheus histogram)."""
+
+import bisect
+import math
+import threading
+from collections.abc import Sequence
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+"""Upper bounds (in seconds) for latencies of model calls and commands."""
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """Count observations per bucket. `buckets` are the upper bounds (inclusive), an `+Inf` bucket is added."""
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        """`(upper bound, number of observations <= upper bound)` for every bucket, ending with `+Inf`."""
+        with self._lock:
+            counts = list(self._counts)
+        result, total = [], 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            total += count
+            result.append((bound, total))
+        return result
@@ -0,0 +1,69 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+import yaml
+
+from minisweagent.agents.async_default import AsyncDefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+
+
+@pytest.fixture
+def default_config():
+    return yaml.safe_load(Path("src/minisweagent/config/default.yaml").read_text())["agent"]
+
+
+class SlowAsyncModel(DeterministicModel):
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        await asyncio.sleep(0.1)
+        return self.query(messages, **kwargs)
+
+
+class SlowAsyncEnvironment(LocalEnvironment):
+    async def aexecute(self, command: str, cwd: str = "") -> dict:
+        await asyncio.sleep(0.1)
+        return self.execute(command, cwd)
+
+
+async def test_successful_completion_with_sync_model_and_env(default_config):
+    """Models and environments without aquery/aexecute are run in worker threads."""
+    agent = AsyncDefaultAgent(
+        model=DeterministicModel(
+            outputs=[
+                "I'll echo a message\n```bash\necho 'hello world'\n```",
+                "Now finishing\n```bash\necho 'COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT'\necho 'done'\n```",
+            ]
+        ),
+        env=LocalEnvironment(),
+        **default_config,
+    )
+    exit_status, result = await agent.run("Echo hello world then finish")
+    assert (exit_status, result) == ("Submitted", "done\n")
+    assert "hello world" in agent.messages[3]["content"]
+    assert len(agent.messages) == 6
+
+
+async def test_format_error_and_step_limit(default_config):
+    agent = AsyncDefaultAgent(
+        model=DeterministicModel(outputs=["no action here", "```bash\necho 1\n```"]),
+        env=LocalEnvironment(),
+        **default_config | {"step_limit": 2},
+    )
+    exit_status, _ = await agent.run("Test")
+    assert exit_status == "LimitsExceeded"
+    assert "Please always provide EXACTLY ONE action" in agent.messages[3]["content"]
+
+
+async def test_agents_run_concurrently(default_config):
+    """Many agents share one event loop: total time is that of a single agent, not the sum."""
+    n_agents, n_steps = 50, 3
+    outputs = ["```bash\necho step\n```"] * (n_steps - 1) + ["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+    agents = [
+        AsyncDefaultAgent(model=SlowAsyncModel(outputs=outputs), env=SlowAsyncEnvironment(), **default_config)
+        for _ in range(n_agents)
+    ]
+    start = asyncio.get_running_loop().time()
+    results = await asyncio.gather(*(agent.run(f"Task {i}") for i, agent in enumerate(agents)))
+    assert all(exit_status == "Submitted" for exit_status, _ in results)
+    assert asyncio.get_running_loop().time() - start < n_agents * n_steps * 0.2 / 5
@@ -0,0 +1,237 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.agents.utils.compaction import CompactionConfig, Compactor, estimate_tokens
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.utils.save import save_traj
+
+
+def _history(n_steps: int, observation: str = "x" * 1000) -> list[dict]:
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    for i in range(n_steps):
+        messages.append({"role": "assistant", "content": f"step {i}\n```bash\necho {i}\n```"})
+        messages.append({"role": "user", "content": observation})
+    return messages
+
+
+def test_elide_observations_keeps_stable_prefix():
+    compactor = Compactor(
+        CompactionConfig(policies=[{"policy": "elide_observations", "trigger_tokens": 2000}], keep_last=4, min_span=4)
+    )
+    messages = _history(5)
+    assert compactor.compact(messages) == messages  # below trigger
+    messages = _history(10)
+    compacted = compactor.compact(messages)
+    assert compacted[:2] == messages[:2]
+    assert compacted[-4:] == messages[-4:]
+    assert compacted[3]["content"] == "[Output of this step elided to save context (1000 characters).]"
+    assert compacted[2] == messages[2]
+    assert len(compacted) == len(messages)
+    assert compactor.stats["n_compactions"] == 1
+
+    # The compacted prefix stays the same until the next compaction
+    messages += _history(1)[2:]
+    assert compactor.compact(messages)[: len(compacted)] == compacted
+    assert compactor.stats["n_compactions"] == 1
+    assert compactor.stats["n_queries"] == 3
+    assert compactor.stats["tokens_saved"] == 2 * (estimate_tokens(_history(8)) - estimate_tokens(compacted[:18]))
+
+
+def test_drop_superseded_views():
+    messages = [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "task"},
+        {"role": "assistant", "content": "```bash\ncat a.py\n```"},
+        {"role": "user", "content": "old content of a.py"},
+        {"role": "assistant", "content": "```bash\nnl -ba b.py\n```"},
+        {"role": "user", "content": "content of b.py"},
+        {"role": "assistant", "content": "```bash\nsed -n '1,10p' a.py\n```"},
+        {"role": "user", "content": "new content of a.py"},
+    ]
+    compactor = Compactor(
+        CompactionConfig(
+            policies=[{"policy": "drop_superseded_views", "trigger_tokens": 0, "stub_template": "superseded"}],
+            keep_last=2,
+            min_span=1,
+        )
+    )
+    assert [m["content"] for m in compactor.compact(messages)[3:]] == [
+        "superseded",
+        "```bash\nnl -ba b.py\n```",
+        "content of b.py",
+        "```bash\nsed -n '1,10p' a.py\n```",
+        "new content of a.py",
+    ]
+
+
+def _tool_call(call_id: str, command: str) -> dict:
+    return {
+        "id": call_id,
+        "type": "function",
+        "function": {"name": "bash", "arguments": json.dumps({"command": command})},
+    }
+
+
+def _tool_call_history(n_steps: int, n_calls: int = 2) -> list[dict]:
+    """History of the tool call action protocol with `n_calls` tool calls (and tool messages) per step."""
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    for i in range(n_steps):
+        calls = [_tool_call(f"call_{i}_{k}", f"echo {i}") for k in range(n_calls)]
+        messages.append({"role": "assistant", "content": f"step {i}", "tool_calls": calls})
+        messages.extend({"role": "tool", "content": "x" * 1000, "tool_call_id": call["id"]} for call in calls)
+    return messages
+
+
+def _assert_valid_tool_calls(messages: list[dict]) -> None:
+    """Every tool message answers a tool call of the preceding assistant message, and every tool call is answered."""
+    pending: list[str] = []
+    for message in messages:
+        if message["role"] == "tool":
+            assert message["tool_call_id"] in pending
+            pending.remove(message["tool_call_id"])
+        else:
+            assert pending == []
+            pending = [call["id"] for call in message.get("tool_calls") or []]
+    assert pending == []
+
+
+def test_drop_superseded_views_tool_calls():
+    messages = [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "task"},
+        {"role": "assistant", "content": "", "tool_calls": [_tool_call("1", "cat a.py")]},
+        {"role": "tool", "content": "old content of a.py", "tool_call_id": "1"},
+        {"role": "assistant", "content": "", "tool_calls": [_tool_call("2", "nl -ba b.py")]},
+        {"role": "tool", "content": "content of b.py", "tool_call_id": "2"},
+        {"role": "assistant", "content": None, "tool_calls": [_tool_call("3", "sed -n '1,10p' a.py")]},
+        {"role": "tool", "content": "new content of a.py", "tool_call_id": "3"},
+    ]
+    compactor = Compactor(
+        CompactionConfig(
+            policies=[{"policy": "drop_superseded_views", "trigger_tokens": 0, "stub_template": "superseded"}],
+            keep_last=2,
+            min_span=1,
+        )
+    )
+    compacted = compactor.compact(messages)
+    assert [m["content"] for m in compacted[3:8:2]] == ["superseded", "content of b.py", "new content of a.py"]
+    assert compacted[3]["tool_call_id"] == "1"
+
+
+@pytest.mark.parametrize("keep_last", [1, 2, 3, 4])
+def test_spans_keep_tool_calls_with_tool_messages(keep_last):
+    compactor = Compactor(
+        CompactionConfig(
+            policies=[
+                {
+                    "policy": "summarize",
+                    "trigger_tokens": 0,
+                    "summary_model": {
+                        "model_class": "deterministic",
+                        "model_name": "cheap",
+                        "outputs": ["summary"] * 9,
+                    },
+                }
+            ],
+            keep_last=keep_last,
+            min_span=1,
+        )
+    )
+    model = compactor.policies[0].model
+    prompts = []
+    query = model.query
+    model.query = lambda messages, **kwargs: prompts.append(messages[0]["content"]) or query(messages, **kwargs)
+    for n_steps in range(3, 6):
+        messages = _tool_call_history(n_steps)
+        compacted = compactor.compact(messages)
+        _assert_valid_tool_calls(compacted)
+        assert compacted[-1] == messages[-1]
+    assert compactor.stats["n_compactions"] >= 2
+    assert '{"command": "echo 0"}' in prompts[0]  # the commands of the tool calls are summarized
+
+
+def test_summarize():
+    compactor = Compactor(
+        CompactionConfig(
+            policies=[
+                {
+                    "policy": "summarize",
+                    "trigger_tokens": 0,
+                    "summary_model": {"model_class": "deterministic", "model_name": "cheap", "outputs": ["I echoed"]},
+                }
+            ],
+            keep_last=2,
+            min_span=2,
+        )
+    )
+    messages = _history(3)
+    assert compactor.compact(messages) == [
+        *messages[:2],
+        {"role": "user", "content": "<summary_of_previous_steps>\nI echoed\n</summary_of_previous_steps>"},
+        *messages[-2:],
+    ]
+    assert compactor.policies[0].model.n_calls == 1
+
+
+@pytest.mark.parametrize(("cost_limit", "exit_status"), [(0, "Submitted"), (5, "LimitsExceeded")])
+def test_agent_pays_for_summaries(cost_limit, exit_status):
+    config = yaml.safe_load(Path("src/minisweagent/config/default.yaml").read_text())["agent"]
+    outputs = [f"```bash\necho {i}\n```" for i in range(4)]
+    summary_model = {"model_class": "deterministic", "model_name": "cheap", "outputs": ["summary"] * 9}
+    agent = DefaultAgent(
+        model=DeterministicModel(outputs=[*outputs, "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]),
+        env=LocalEnvironment(),
+        **config
+        | {
+            "cost_limit": cost_limit,
+            "compaction": {
+                "policies": [
+                    {
+                        "policy": "summarize",
+                        "trigger_tokens": 0,
+                        "summary_model": summary_model | {"cost_per_call": 0.5},
+                    }
+                ],
+                "keep_last": 1,
+                "min_span": 1,
+            },
+        },
+    )
+    assert agent.run("Echo")[0] == exit_status
+    summary_model = agent.compactor.policies[0].model
+    assert summary_model.n_calls >= 2
+    assert agent.model.cost == agent.model.n_calls + 0.5 * summary_model.n_calls
+    if cost_limit:
+        assert agent.model.n_calls < 5  # stopped early because of the cost of the summaries
+
+
+@pytest.mark.parametrize("policy", ["elide_observations", "drop_superseded_views"])
+def test_agent_keeps_full_history(policy, tmp_path):
+    config = yaml.safe_load(Path("src/minisweagent/config/default.yaml").read_text())["agent"]
+    outputs = [f"```bash\nhead -c 2000 /dev/zero | tr '\\0' x; echo {i}\n```" for i in range(6)]
+    agent = DefaultAgent(
+        model=DeterministicModel(outputs=[*outputs, "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]),
+        env=LocalEnvironment(),
+        **config
+        | {
+            "compaction": {
+                "policies": [{"policy": policy, "trigger_tokens": 100, "view_regex": r"^(head)"}],
+                "keep_last": 2,
+                "min_span": 4,
+            }
+        },
+    )
+    assert agent.run("Print a lot")[0] == "Submitted"
+    assert len(agent.messages) == 2 + 2 * 7
+    assert all("elided" not in m["content"] for m in agent.messages)
+    assert agent.compactor.stats["n_compactions"] >= 1
+    assert agent.compactor.stats["tokens_saved"] > 0
+    save_traj(agent, tmp_path / "traj.json", print_path=False)
+    saved = json.loads((tmp_path / "traj.json").read_text())
+    assert saved["messages"] == agent.messages
+    assert saved["info"]["compaction_stats"] == agent.compactor.stats
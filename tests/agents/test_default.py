@@ -3,7 +3,7 @@ from pathlib import Path
 import pytest
 import yaml
 
-from minisweagent.agents.default import DefaultAgent, NonTerminatingException
+from minisweagent.agents.default import DefaultAgent, NonTerminatingException, get_template
 from minisweagent.environments.local import LocalEnvironment
 from minisweagent.models.test_models import DeterministicModel
 
@@ -273,6 +273,26 @@ def test_render_template_model_stats(default_config):
     assert result == "Calls: 2, Cost: 2.0"
 
 
+def test_render_template_caches_templates_and_static_vars(default_config):
+    """Templates are compiled once and static vars are only rebuilt when a config changes."""
+    agent = DefaultAgent(
+        model=DeterministicModel(outputs=["output1"]),
+        env=LocalEnvironment(env={"FOO": "bar"}),
+        **default_config,
+    )
+    template = "{{step_limit}} {{env.FOO}} {{n_model_calls}}"
+    assert agent.render_template(template) == "0 bar 0"
+    assert get_template(template) is get_template(template)
+    static_vars = agent.get_static_template_vars()
+    assert agent.get_static_template_vars() is static_vars
+
+    agent.model.query([])
+    agent.config.step_limit = 5
+    agent.env.config.env["FOO"] = "baz"
+    assert agent.render_template(template) == "5 baz 1"
+    assert agent.get_static_template_vars() is not static_vars
+
+
 def test_messages_include_timestamps(default_config):
     """Test that all messages include timestamps."""
     agent = DefaultAgent(
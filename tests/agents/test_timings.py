@@ -0,0 +1,57 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.agents.utils.timings import get_token_usage
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.utils.save import save_traj
+
+
+@pytest.fixture
+def default_config():
+    return yaml.safe_load(Path("src/minisweagent/config/default.yaml").read_text())["agent"]
+
+
+class UsageReportingModel(DeterministicModel):
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        usage = {"prompt_tokens": 100, "completion_tokens": 10, "prompt_tokens_details": {"cached_tokens": 80}}
+        return super().query(messages, **kwargs) | {"extra": {"response": {"usage": usage}}}
+
+
+def test_get_token_usage():
+    assert get_token_usage({"content": ""}) == {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    response = {"extra": {"response": {"usage": {"prompt_tokens": 3, "completion_tokens": 2}}}}
+    assert get_token_usage(response) == {"prompt_tokens": 3, "completion_tokens": 2, "cached_tokens": 0}
+
+
+def test_step_timings_are_saved(default_config, tmp_path):
+    agent = DefaultAgent(
+        model=UsageReportingModel(
+            outputs=["no action", "```bash\nsleep 0.2\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+        ),
+        env=LocalEnvironment(),
+        **default_config,
+    )
+    agent.run("Test")
+    timings = agent.timer.timings
+    assert [entry["exception"] for entry in timings] == ["FormatError", None, "Submitted"]
+    assert [entry["step"] for entry in timings] == [1, 2, 3]
+    assert timings[0]["execute"] == 0.0
+    assert timings[1]["execute"] >= 0.2
+    assert all(entry["render"] > 0 for entry in timings[:2])
+    assert all(entry["total"] >= entry["query"] + entry["execute"] for entry in timings)
+    assert timings[1]["cached_tokens"] == 80
+
+    save_traj(agent, tmp_path / "traj.json", print_path=False)
+    saved = json.loads((tmp_path / "traj.json").read_text())
+    assert saved["timings"] == timings
+    model_stats = saved["info"]["model_stats"]
+    assert model_stats["api_calls"] == 3
+    assert model_stats["n_format_errors"] == 1
+    assert model_stats["format_error_time"] == timings[0]["total"]
+    assert model_stats["execute_time"] == pytest.approx(sum(entry["execute"] for entry in timings))
+    assert (model_stats["prompt_tokens"], model_stats["completion_tokens"]) == (300, 30)
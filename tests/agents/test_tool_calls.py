@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.agents.utils.tool_calls import BASH_TOOL, get_bash_commands
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+
+
+def _tool_call(command: str, name: str = "bash", id: str = "call_0") -> dict:
+    return {"id": id, "type": "function", "function": {"name": name, "arguments": json.dumps({"command": command})}}
+
+
+class ToolCallingModel(DeterministicModel):
+    """Returns the outputs as tool calls. Outputs are lists of commands (`None` for a malformed call)."""
+
+    def __init__(self, tool_calls: list[list[str | None]]):
+        super().__init__(outputs=["thinking"] * len(tool_calls))
+        self.tool_calls = tool_calls
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        assert kwargs["tools"] == [BASH_TOOL]
+        calls = self.tool_calls[self.current_index + 1]
+        response = super().query(messages, **kwargs)
+        return response | {
+            "tool_calls": [
+                _tool_call(command, id=f"call_{i}")
+                if command is not None
+                else {"id": f"call_{i}", "type": "function", "function": {"name": "bash", "arguments": "{"}}
+                for i, command in enumerate(calls)
+            ]
+        }
+
+
+@pytest.fixture
+def tool_call_config():
+    config = yaml.safe_load(Path("src/minisweagent/config/extra/swebench_tool_call.yaml").read_text())["agent"]
+    return config | {"instance_template": "{{task}}", "cost_limit": 0}
+
+
+def test_get_bash_commands():
+    assert get_bash_commands([_tool_call("ls")]) == ["ls"]
+    assert get_bash_commands([_tool_call("ls"), _tool_call("pwd", id="call_1")]) == ["ls", "pwd"]
+    assert get_bash_commands([_tool_call("ls", name="python")]) == []
+    assert get_bash_commands([{"id": "call_0", "function": {"name": "bash", "arguments": "not json"}}]) == []
+    assert get_bash_commands([{"id": "call_0", "function": {"name": "bash", "arguments": '{"cmd": "ls"}'}}]) == []
+
+
+def test_tool_call_protocol(tool_call_config):
+    agent = DefaultAgent(
+        model=ToolCallingModel(
+            [
+                ["echo hello"],
+                [],
+                ["ls", "pwd"],
+                [None],
+                ["echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT; echo done"],
+            ]
+        ),
+        env=LocalEnvironment(),
+        **tool_call_config,
+    )
+    assert agent.run("Say hello") == ("Submitted", "done\n")
+    assert [message["role"] for message in agent.messages] == [
+        "system",
+        "user",
+        "assistant",
+        "tool",  # observation
+        "assistant",
+        "user",  # format error: no tool call to respond to
+        "assistant",
+        "tool",  # format error, once per tool call
+        "tool",
+        "assistant",
+        "tool",  # format error (malformed arguments)
+        "assistant",
+        "tool",  # submission
+    ]
+    assert agent.messages[3]["tool_call_id"] == "call_0"
+    assert "hello" in agent.messages[3]["content"]
+    assert "found 0 valid calls" in agent.messages[5]["content"]
+    assert [m["tool_call_id"] for m in agent.messages[7:9]] == ["call_0", "call_1"]
+    assert "found 2 valid calls" in agent.messages[7]["content"]
+    assert agent.timer.summary()["n_format_errors"] == 3
@@ -165,6 +165,7 @@ def test_timeout_template_config_with_truncation():
         Path("src/minisweagent/config/extra/swebench.yaml"),
         Path("src/minisweagent/config/extra/swebench_xml.yaml"),
         Path("src/minisweagent/config/extra/swebench_roulette.yaml"),
+        Path("src/minisweagent/config/extra/swebench_tool_call.yaml"),
     ]
 
     for config_file in config_files:
@@ -203,3 +204,20 @@ def test_timeout_template_config_with_truncation():
 
         # Result should be bounded (not grow with input size)
         assert len(result) < 15000
+
+
+def test_action_observation_template_elided_chars():
+    """Test that the template uses `elided_chars` from environments with an output_limit"""
+    config_path = Path(__file__).parent.parent.parent / "src" / "minisweagent" / "config" / "extra" / "swebench.yaml"
+    config = yaml.safe_load(config_path.read_text())
+    template = Template(config["agent"]["action_observation_template"], undefined=StrictUndefined)
+
+    result = template.render(output={"returncode": 0, "output": "A" * 5000 + "B" * 5000, "elided_chars": 123456})
+    assert "<warning>" in result
+    assert "123456 characters elided" in result
+    assert "A" * 5000 in result[result.find("<output_head>") : result.find("</output_head>")]
+    assert "B" * 5000 in result[result.find("<output_tail>") : result.find("</output_tail>")]
+
+    result = template.render(output={"returncode": 0, "output": "short", "elided_chars": 0})
+    assert "<warning>" not in result
+    assert "<output>\nshort</output>" in result
@@ -205,6 +205,21 @@ def test_docker_environment_command_failure(executable):
         env.cleanup()
 
 
+@pytest.mark.slow
+@pytest.mark.parametrize("executable", environment_params)
+async def test_docker_environment_aexecute(executable):
+    """Test that aexecute returns the same results as execute."""
+    env = DockerEnvironment(image="python:3.11", executable=executable, env={"FOO": "bar"}, timeout=2)
+
+    try:
+        for command in ["echo $FOO; pwd", "echo err >&2; exit 42"]:
+            assert await env.aexecute(command) == env.execute(command)
+        with pytest.raises(subprocess.TimeoutExpired):
+            await env.aexecute("sleep 10")
+    finally:
+        env.cleanup()
+
+
 @pytest.mark.slow
 @pytest.mark.parametrize("executable", environment_params)
 def test_docker_environment_custom_container_timeout(executable):
@@ -228,3 +243,92 @@ def test_docker_environment_custom_container_timeout(executable):
             )
     finally:
         env.cleanup()
+
+
+def test_docker_environment_session_command():
+    """Test the command of the shell session (without starting a container)."""
+    with patch.object(DockerEnvironment, "_start_container"):
+        env = DockerEnvironment(image="python:3.11", cwd="/testbed", env={"FOO": "bar"}, session=True)
+    env.container_id = "abc"
+    session = env._get_session()
+    assert session.cmd == ["docker", "exec", "-i", "-w", "/testbed", "-e", "FOO=bar", "abc", "bash", "-l"]
+    assert session.kill_prefix == ["docker", "exec", "abc"]
+    assert env._get_exec_command("ls", "/tmp") == [
+        "docker",
+        "exec",
+        "-w",
+        "/tmp",
+        "-e",
+        "FOO=bar",
+        "abc",
+        "bash",
+        "-lc",
+        "ls",
+    ]
+    env.container_id = None
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("executable", environment_params)
+async def test_docker_environment_session(executable):
+    """Test that the session mode gives the same results as a new `docker exec` per command."""
+    env = DockerEnvironment(image="python:3.11", executable=executable, env={"FOO": "bar"}, timeout=2)
+    session_env = DockerEnvironment(
+        image="python:3.11", executable=executable, env={"FOO": "bar"}, timeout=2, session=True
+    )
+    try:
+        for command in ["echo $FOO; pwd", "echo err >&2; exit 42", "cd /tmp; export BAR=1", "pwd; echo $BAR"]:
+            assert session_env.execute(command) == env.execute(command)
+        assert await session_env.aexecute("echo async") == {"output": "async\n", "returncode": 0}
+        with pytest.raises(subprocess.TimeoutExpired):
+            session_env.execute("sleep 10")
+        assert session_env.execute("echo alive")["output"] == "alive\n"
+        assert session_env._session.n_restarts == 0  # type: ignore[union-attr]
+    finally:
+        env.cleanup()
+        session_env.cleanup()
+
+
+def test_docker_environment_fork_commands():
+    """Test the commands of snapshots, forks and their cleanup (without starting containers)."""
+    with patch.object(DockerEnvironment, "_start_container"):
+        env = DockerEnvironment(image="python:3.11", cwd="/testbed")
+    env.container_id = "parent"
+    with (
+        patch("minisweagent.environments.docker.subprocess.run") as mock_run,
+        patch.object(
+            DockerEnvironment,
+            "_start_container",
+            autospec=True,
+            side_effect=lambda self: setattr(self, "container_id", "child"),
+        ),
+    ):
+        fork = env.fork()
+        assert env.fork().container_id == "child"  # from the same snapshot
+    image = mock_run.call_args.args[0][-1]
+    assert mock_run.call_count == 1
+    assert mock_run.call_args.args[0] == ["docker", "commit", "parent", image]
+    assert (fork.config.image, fork.config.cwd, env.config.image) == (image, "/testbed", "python:3.11")
+    with patch("minisweagent.environments.docker.subprocess.Popen") as mock_popen:
+        env.cleanup()
+    assert mock_popen.call_args.args[0] == (
+        "(timeout 60 docker stop parent || docker rm -f parent; docker rm -f child child; docker rmi "
+        f"{image}) >/dev/null 2>&1 &"
+    )
+    env.container_id = fork.container_id = None
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("executable", environment_params)
+def test_docker_environment_fork(executable):
+    """Test that forks start from the snapshot and are isolated from each other."""
+    env = DockerEnvironment(image="python:3.11", executable=executable, cwd="/tmp")
+    try:
+        env.execute("echo setup > state.txt")
+        forks = [env.fork(), env.fork()]
+        forks[0].execute("echo fork0 >> state.txt")
+        assert forks[0].execute("cat state.txt")["output"] == "setup\nfork0\n"
+        assert forks[1].execute("cat state.txt")["output"] == "setup\n"
+        assert env.execute("cat state.txt")["output"] == "setup\n"
+    finally:
+        env.cleanup()
@@ -0,0 +1,255 @@
+import json
+import os
+import socketserver
+import struct
+import subprocess
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from minisweagent.environments import get_environment
+from minisweagent.environments.docker_api import DockerAPIEnvironment, parse_run_args
+from minisweagent.environments.utils.docker_api import DockerAPIClient, DockerAPIError, MultiplexedStreamDecoder
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """Implements the endpoints used by `DockerAPIEnvironment`. Commands are run on the host in `server.root`."""
+
+    protocol_version = "HTTP/1.1"
+    server: "FakeDockerDaemon"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.n_connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.close_after_response:
+            self.close_connection = True
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        assert url.path.startswith("/v1.41/")
+        path = url.path.removeprefix("/v1.41")
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        self.server.requests.append((method, path, params, body))
+        parts = path.strip("/").split("/")
+        if (method, path) == ("POST", "/containers/create"):
+            if body["Image"] not in self.server.images:
+                return self._send_json(404, {"message": f"No such image: {body['Image']}"})
+            container_id = uuid.uuid4().hex
+            self.server.containers[container_id] = {"name": params["name"], **body, "state": "created"}
+            return self._send_json(201, {"Id": container_id, "Warnings": []})
+        if (method, path) == ("POST", "/images/create"):
+            image = f"{params['fromImage']}:{params['tag']}"
+            lines = [{"status": f"Pulling {image}"}]
+            if "missing" in image:
+                lines.append({"errorDetail": {"message": "not found"}, "error": "not found"})
+            else:
+                self.server.images.add(image)
+            return self._send_stream(b"".join(json.dumps(line).encode() + b"\n" for line in lines))
+        if method == "POST" and parts[0] == "containers" and parts[2] == "start":
+            self.server.containers[parts[1]]["state"] = "running"
+            return self._send_json(204)
+        if method == "POST" and parts[0] == "containers" and parts[2] == "exec":
+            exec_id = uuid.uuid4().hex
+            self.server.execs[exec_id] = {"container": parts[1], **body, "ExitCode": None}
+            return self._send_json(201, {"Id": exec_id})
+        if method == "POST" and parts[0] == "exec" and parts[2] == "start":
+            return self._start_exec(self.server.execs[parts[1]])
+        if method == "GET" and parts[0] == "exec" and parts[2] == "json":
+            exec_ = self.server.execs[parts[1]]
+            return self._send_json(200, {"ExitCode": exec_["ExitCode"], "Running": exec_["ExitCode"] is None})
+        if method == "DELETE" and parts[0] == "containers":
+            self.server.containers.pop(parts[1])
+            return self._send_json(204)
+        return self._send_json(404, {"message": f"page not found: {method} {path}"})
+
+    def _send_stream(self, data: bytes = b""):
+        """Response without length, the end of the body is the end of the connection (like a hijacked stream)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.end_headers()
+        self.wfile.write(data)
+        self.close_connection = True
+
+    def _start_exec(self, exec_):
+        self._send_stream()
+        env = os.environ | dict(item.split("=", 1) for item in exec_["Env"])
+        cmd = ["bash", "-c", exec_["Cmd"][2]]  # without the login shell of `bash -lc` (the profile of the host)
+        process = subprocess.Popen(cmd, cwd=self.server.root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        lock = threading.Lock()
+
+        def forward(pipe, stream: int):
+            while chunk := pipe.read1(65536):
+                with lock:
+                    try:
+                        self.wfile.write(struct.pack(">BxxxL", stream, len(chunk)) + chunk)
+                        self.wfile.flush()
+                    except OSError:  # the client timed out
+                        return
+
+        threads = [
+            threading.Thread(target=forward, args=(process.stdout, 1)),
+            threading.Thread(target=forward, args=(process.stderr, 2)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        exec_["ExitCode"] = process.wait()
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class FakeDockerDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, root: str):
+        super().__init__(socket_path, FakeDockerHandler)
+        self.root = root
+        self.lock = threading.Lock()
+        self.n_connections = 0
+        self.close_after_response = False
+        self.images = {"python:3.11"}
+        self.containers: dict[str, dict] = {}
+        self.execs: dict[str, dict] = {}
+        self.requests: list[tuple] = []
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "docker.sock")
+    (tmp_path / "root").mkdir()
+    server = FakeDockerDaemon(socket_path, str(tmp_path / "root"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _env(daemon, **kwargs) -> DockerAPIEnvironment:
+    return DockerAPIEnvironment(image="python:3.11", socket_path=daemon.server_address, **kwargs)
+
+
+def test_multiplexed_stream_decoder():
+    decoder = MultiplexedStreamDecoder()
+    data = struct.pack(">BxxxL", 1, 5) + b"hello" + struct.pack(">BxxxL", 2, 3) + b"err"
+    assert decoder.feed(data[:3]) == []
+    assert decoder.feed(data[3:10]) == []
+    assert decoder.feed(data[10:15]) == [(1, b"hello")]
+    assert decoder.pending == 2
+    assert decoder.feed(data[15:]) == [(2, b"err")]
+    assert decoder.pending == 0
+
+
+def test_parse_run_args():
+    container, params = parse_run_args(
+        ["--rm", "--network=host", "-v", "/a:/b:ro", "--memory", "2g", "--platform", "linux/amd64", "-e", "A=1"]
+    )
+    assert container == {
+        "HostConfig": {"AutoRemove": True, "NetworkMode": "host", "Binds": ["/a:/b:ro"], "Memory": 2 * 1024**3},
+        "Env": ["A=1"],
+    }
+    assert params == {"platform": "linux/amd64"}
+    with pytest.raises(ValueError, match="Unsupported"):
+        parse_run_args(["--gpus", "all"])
+
+
+def test_execute(daemon):
+    env = _env(daemon, env={"FOO": "bar"}, cwd="/testbed")
+    try:
+        assert env.execute("echo $FOO; echo err >&2; exit 3") == {"output": "bar\nerr\n", "returncode": 3}
+        assert env.execute("printf 'a\\r\\nb'") == {"output": "a\nb", "returncode": 0}
+    finally:
+        env.cleanup()
+    create = next(r for r in daemon.requests if r[1] == "/containers/create")
+    assert create[3]["WorkingDir"] == "/testbed"
+    assert create[3]["Cmd"] == ["sleep", "2h"]
+    assert create[3]["HostConfig"] == {"AutoRemove": True}
+    exec_ = next(iter(daemon.execs.values()))
+    assert exec_["Cmd"] == ["bash", "-lc", "echo $FOO; echo err >&2; exit 3"]
+    assert exec_["WorkingDir"] == "/testbed" and exec_["Env"] == ["FOO=bar"]
+    assert daemon.containers == {}  # removed by cleanup
+
+
+def test_output_limit_and_timeout(daemon):
+    env = _env(daemon, output_limit=10, timeout=1)
+    try:
+        assert env.execute("printf 'ab%.0s' $(seq 1000); echo -n END; exit 3") == {
+            "output": "ababaabEND",
+            "returncode": 3,
+            "elided_chars": 1993,
+            "output_bytes": 2003,
+        }
+        with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+            env.execute("echo started; sleep 5")
+        assert exc_info.value.output == b"started\n"
+    finally:
+        env.cleanup()
+
+
+def test_connections_are_pooled(daemon):
+    env = _env(daemon)
+    try:
+        n_connections = daemon.n_connections
+        for i in range(10):
+            assert env.execute(f"echo {i}")["output"] == f"{i}\n"
+        # every attached exec needs its own connection, the other requests reuse one
+        assert daemon.n_connections - n_connections <= 11
+    finally:
+        env.cleanup()
+
+
+def test_idle_connection_closed_by_daemon(daemon):
+    client = DockerAPIClient(daemon.server_address)
+    daemon.close_after_response = True
+    for _ in range(3):  # the pooled connection is closed after every response, so it's replaced by a new one
+        with pytest.raises(DockerAPIError, match="page not found"):
+            client.request("GET", "/version")
+    assert daemon.n_connections == 3
+    client.close()
+
+
+def test_pull_missing_image(daemon):
+    env = DockerAPIEnvironment(image="ubuntu:22.04", socket_path=daemon.server_address)
+    env.cleanup()
+    assert [r[:3] for r in daemon.requests if r[1] == "/images/create"] == [
+        ("POST", "/images/create", {"fromImage": "ubuntu", "tag": "22.04"})
+    ]
+    with pytest.raises(DockerAPIError, match="not found"):
+        DockerAPIEnvironment(image="missing/image", socket_path=daemon.server_address)
+
+
+def test_get_environment(daemon):
+    env = get_environment(
+        {"environment_class": "docker_api", "image": "python:3.11", "socket_path": daemon.server_address}
+    )
+    try:
+        assert isinstance(env, DockerAPIEnvironment)
+    finally:
+        env.cleanup()
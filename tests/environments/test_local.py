@@ -7,6 +7,7 @@ from unittest.mock import patch
 import pytest
 
 from minisweagent.environments.local import LocalEnvironment, LocalEnvironmentConfig
+from minisweagent.environments.utils.output_capture import arun_with_output_limit
 
 
 def test_local_environment_config_defaults():
@@ -199,3 +200,90 @@ def test_local_environment_shell_features():
     result = env.execute("echo $(echo 'nested')")
     assert result["returncode"] == 0
     assert "nested" in result["output"]
+
+
+def test_local_environment_output_limit():
+    """Test that only the head and tail of the output are kept when output_limit is set."""
+    env = LocalEnvironment(output_limit=10)
+
+    assert env.execute("echo -n 0123456789") == {
+        "output": "0123456789",
+        "returncode": 0,
+        "elided_chars": 0,
+        "output_bytes": 10,
+    }
+    assert env.execute("printf 'ab%.0s' $(seq 1000); echo -n END; exit 3") == {
+        "output": "ababaabEND",
+        "returncode": 3,
+        "elided_chars": 1993,
+        "output_bytes": 2003,
+    }
+    assert env.execute("printf 'a\\r\\nb'")["output"] == "a\nb"
+
+
+def test_local_environment_output_limit_timeout():
+    """Test that the captured output is attached to the timeout exception when output_limit is set."""
+    env = LocalEnvironment(timeout=1, output_limit=100)
+
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        env.execute("echo started; sleep 5")
+    assert exc_info.value.output == b"started\n"
+
+
+async def test_arun_with_output_limit():
+    """Test the async output capture (used by `aexecute`) with and without output limit."""
+    cmd = ["bash", "-c", "printf 'ab%.0s' $(seq 1000); echo -n END; exit 3"]
+    assert await arun_with_output_limit(cmd, output_limit=10, timeout=10) == {
+        "output": "ababaabEND",
+        "returncode": 3,
+        "elided_chars": 1993,
+        "output_bytes": 2003,
+    }
+    result = await arun_with_output_limit(cmd, output_limit=0, timeout=10)
+    assert result["output"] == "ab" * 1000 + "END"
+    assert result["elided_chars"] == 0
+
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        await arun_with_output_limit(["bash", "-c", "echo started; sleep 5"], output_limit=0, timeout=1)
+    assert exc_info.value.output == b"started\n"
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "echo 'hello world'",
+        "echo $TEST_VAR; pwd",
+        "echo error >&2; exit 42",
+        "false",
+        "cd /; export TEST_VAR=changed",
+        "printf 'a\\r\\nb'",
+        "for i in 1 2 3; do echo $i; done | tac",
+    ],
+)
+def test_local_environment_session_matches_subprocess(command, tmp_path):
+    """Test that the session mode returns the same results as a new shell per command."""
+    env = LocalEnvironment(cwd=str(tmp_path), env={"TEST_VAR": "value"})
+    session_env = LocalEnvironment(cwd=str(tmp_path), env={"TEST_VAR": "value"}, session=True)
+    try:
+        for _ in range(2):  # the second run checks that nothing leaked from the first
+            assert session_env.execute(command) == env.execute(command)
+    finally:
+        session_env.cleanup()
+
+
+def test_local_environment_session_timeout_and_output_limit(tmp_path):
+    """Test that a timeout only kills the command and that the output limit is applied in session mode."""
+    env = LocalEnvironment(cwd=str(tmp_path), timeout=1, output_limit=10, session=True)
+    try:
+        with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+            env.execute("echo started; sleep 5")
+        assert exc_info.value.output == b"started\n"
+        assert env.execute("printf 'ab%.0s' $(seq 1000); echo -n END; exit 3") == {
+            "output": "ababaabEND",
+            "returncode": 3,
+            "elided_chars": 1993,
+            "output_bytes": 2003,
+        }
+        assert env._session.n_restarts == 0  # type: ignore[union-attr]
+    finally:
+        env.cleanup()
@@ -0,0 +1,54 @@
+import subprocess
+import time
+
+import pytest
+
+from minisweagent.environments.utils.shell_session import ShellSession
+
+
+@pytest.fixture
+def session():
+    session = ShellSession(["bash"])
+    yield session
+    session.close()
+
+
+def test_returncode_and_stderr(session, tmp_path):
+    result = session.run("echo out; echo err >&2; exit 3", cwd=str(tmp_path), timeout=5)
+    assert result == {"output": "out\nerr\n", "returncode": 3, "elided_chars": 0, "output_bytes": 8}
+
+
+def test_every_command_runs_in_a_subshell(session, tmp_path):
+    assert session.run("cd /; export FOO=bar; pwd", cwd=str(tmp_path), timeout=5)["output"] == "/\n"
+    result = session.run("pwd; echo FOO=$FOO", cwd=str(tmp_path), timeout=5)
+    assert result["output"] == f"{tmp_path}\nFOO=\n"
+
+
+def test_output_without_trailing_newline_and_heredoc(session, tmp_path):
+    assert session.run("printf 'no newline'", cwd=str(tmp_path), timeout=5)["output"] == "no newline"
+    command = "cat <<'EOF'\n$HOME '\"\nEOF\nread line; echo stdin=$?"
+    assert session.run(command, cwd=str(tmp_path), timeout=5)["output"] == "$HOME '\"\nstdin=1\n"
+
+
+def test_timeout_only_interrupts_the_command(session, tmp_path):
+    pid = session.run("echo $$", cwd=str(tmp_path), timeout=5)["output"]
+    start_time = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        session.run("echo before; sleep 30; echo after", cwd=str(tmp_path), timeout=1)
+    assert time.monotonic() - start_time < 5
+    assert exc_info.value.output == b"before\n"
+    assert session.run("echo $$", cwd=str(tmp_path), timeout=5)["output"] == pid
+    assert session.n_restarts == 0
+
+
+def test_dead_session_is_restarted(session, tmp_path):
+    assert session.run("kill -9 $$", cwd=str(tmp_path), timeout=5)["returncode"] == -1
+    assert session.run("echo restarted", cwd=str(tmp_path), timeout=5)["output"] == "restarted\n"
+    assert session.n_restarts == 1
+
+
+def test_background_processes_and_output_limit(session, tmp_path):
+    assert session.run("sleep 60 & echo started", cwd=str(tmp_path), timeout=5)["output"] == "started\n"
+    result = session.run("seq 1 100000", cwd=str(tmp_path), timeout=5, output_limit=20)
+    assert result["output"].startswith("1\n2\n") and result["output"].endswith("\n100000\n")
+    assert result["output_bytes"] == len("\n".join(str(i) for i in range(1, 100001))) + 1
@@ -0,0 +1,141 @@
+import fcntl
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+from minisweagent.environments.singularity import SingularityEnvironment
+from minisweagent.environments.utils.sif_cache import SIFCache
+
+# `build <sif> <image>` writes a SIF of 1 MiB (fails for images with "missing" in the name),
+# `exec ... --overlay <dir> <sif> bash -c <command>` runs the command on the host in the overlay directory
+_FAKE_SINGULARITY = """#!/bin/bash
+echo "$@" >> "$(dirname "$0")/calls.log"
+if [ "$1" = build ]; then
+    sleep 0.2
+    [[ "$3" == *missing* ]] && exit 1
+    head -c 1048576 /dev/zero > "$2"
+elif [ "$1" = exec ]; then
+    args=("$@")
+    for i in "${!args[@]}"; do [ "${args[$i]}" = --overlay ] && cd "${args[$((i + 1))]}"; done
+    exec bash -c "${args[-1]}"
+fi
+"""
+
+_MIB_IN_GB = 1 / 1024
+
+
+@pytest.fixture
+def singularity(tmp_path) -> Path:
+    path = tmp_path / "bin" / "singularity"
+    path.parent.mkdir()
+    path.write_text(_FAKE_SINGULARITY)
+    path.chmod(0o755)
+    return path
+
+
+def _builds(singularity: Path) -> list[str]:
+    calls = (singularity.parent / "calls.log").read_text().splitlines()
+    return [call.split()[-1] for call in calls if call.startswith("build ")]
+
+
+def test_concurrent_acquire_builds_once(tmp_path, singularity):
+    cache = SIFCache(tmp_path / "cache", executable=str(singularity))
+    results = []
+
+    def acquire():
+        results.append(cache.acquire("docker://python:3.11"))
+
+    threads = [threading.Thread(target=acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _builds(singularity) == ["docker://python:3.11"]
+    assert {path for path, _ in results} == {cache.path("docker://python:3.11")}
+    assert cache.path("docker://python:3.11").name.startswith("python_3.11-")
+    assert cache.size() == 1024**2
+    for _, lock_fd in results:
+        cache.release(lock_fd)
+    assert [path.name for path in (tmp_path / "cache").iterdir() if path.suffix not in (".sif", ".lock")] == []
+
+
+def test_lru_eviction_skips_images_in_use(tmp_path, singularity):
+    cache = SIFCache(tmp_path / "cache", executable=str(singularity), max_size_gb=2.5 * _MIB_IN_GB)
+    cache.release(cache.acquire("a")[1])
+    _, b_lock = cache.acquire("b")  # in use
+    cache.release(cache.acquire("c")[1])
+    assert [cache.path(image).exists() for image in "abc"] == [False, True, True]
+    cache.release(cache.acquire("c")[1])  # cached, but now the most recently used
+    cache.release(cache.acquire("d")[1])
+    assert [cache.path(image).exists() for image in "bcd"] == [True, False, True]
+    cache.release(b_lock)
+    assert cache.evict() == []  # within the budget
+    assert _builds(singularity) == ["a", "b", "c", "d"]
+
+
+def test_acquire_rebuilds_image_evicted_during_lock_downgrade(tmp_path, singularity, monkeypatch):
+    cache = SIFCache(tmp_path / "cache", executable=str(singularity))
+    flock = fcntl.flock
+    evicted = []
+
+    def flock_with_eviction(fd, operation):
+        # another worker evicts the image right after it was built, before the lock is downgraded
+        if operation == fcntl.LOCK_SH and cache.path("a").exists() and not evicted:
+            evicted.append(cache.path("a"))
+            cache.path("a").unlink()
+        flock(fd, operation)
+
+    monkeypatch.setattr(fcntl, "flock", flock_with_eviction)
+    path, lock_fd = cache.acquire("a")
+    assert evicted == [path] and path.exists()
+    assert _builds(singularity) == ["a", "a"]
+    cache.release(lock_fd)
+
+
+def test_build_failure(tmp_path, singularity):
+    cache = SIFCache(tmp_path / "cache", executable=str(singularity), build_retries=2)
+    with pytest.raises(subprocess.CalledProcessError):
+        cache.acquire("missing")
+    assert _builds(singularity) == ["missing", "missing"]
+    assert not any(path.suffix == ".tmp" for path in (tmp_path / "cache").iterdir())
+    assert not cache.path("missing").exists()
+
+
+def test_singularity_environment_with_sif_cache(tmp_path, singularity):
+    kwargs = {"image": "docker://python:3.11", "executable": str(singularity), "sif_cache_dir": str(tmp_path / "cache")}
+    envs = [SingularityEnvironment(**kwargs), SingularityEnvironment(**kwargs)]
+    try:
+        assert _builds(singularity) == ["docker://python:3.11"]
+        assert envs[0].sandbox_dir is None and envs[0].sif_path == envs[1].sif_path
+        assert envs[0].execute("echo 0 > state.txt; cat state.txt") == {"output": "0\n", "returncode": 0}
+        assert envs[1].execute("cat state.txt")["returncode"] != 0  # every environment has its own overlay
+        exec_call = (singularity.parent / "calls.log").read_text().splitlines()[-1]
+        assert f"--overlay {envs[1].overlay_dir} {envs[1].sif_path} bash -c" in exec_call
+    finally:
+        for env in envs:
+            env.cleanup()
+    assert not envs[0].overlay_dir.exists()  # type: ignore[union-attr]
+    # the image is not in use anymore
+    assert envs[0].sif_cache.evict() == []
+    envs[0].sif_cache.max_size_gb = 0.5 * _MIB_IN_GB
+    assert envs[0].sif_cache.evict() == [envs[0].sif_path]
+
+
+def test_singularity_environment_output_limit(tmp_path, singularity):
+    env = SingularityEnvironment(
+        image="docker://python:3.11",
+        executable=str(singularity),
+        sif_cache_dir=str(tmp_path / "cache"),
+        output_limit=10,
+    )
+    try:
+        assert env.execute("printf 'ab%.0s' $(seq 1000); echo -n END; exit 3") == {
+            "output": "ababaabEND",
+            "returncode": 3,
+            "elided_chars": 1993,
+            "output_bytes": 2003,
+        }
+    finally:
+        env.cleanup()
@@ -197,3 +197,15 @@ class TestGlobalModelStats:
             GlobalModelStats()
             captured = capsys.readouterr()
             assert "Global cost/call limit" not in captured.out
+
+    def test_latency_and_retry_histograms(self):
+        """Test that latencies and retry backoffs are counted in their buckets."""
+        stats = GlobalModelStats()
+        for seconds in (0.05, 1, 1.5, 1000):
+            stats.record_latency(seconds)
+        stats.record_retry(4)
+        assert stats.latency_histogram.cumulative_counts()[:5] == [(0.1, 1), (0.25, 1), (0.5, 1), (1, 2), (2.5, 3)]
+        assert stats.latency_histogram.cumulative_counts()[-1] == (float("inf"), 4)
+        assert stats.latency_histogram.sum == 1002.55
+        assert stats.n_timed_queries == stats.latency_histogram.count == 4
+        assert stats.n_retries == 1
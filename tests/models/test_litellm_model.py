@@ -1,14 +1,16 @@
 import json
 import tempfile
+import time
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 import litellm
 import pytest
 
-from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models import GLOBAL_MODEL_STATS, GLOBAL_RATE_LIMITER
 from minisweagent.models.litellm_model import LitellmModel
 from minisweagent.models.litellm_response_api_model import LitellmResponseAPIModel
+from minisweagent.models.robust_litellm_model import RobustLitellmModel
 from minisweagent.models.utils.openai_utils import coerce_responses_text
 
 
@@ -123,6 +125,106 @@ def test_litellm_model_cost_validation_zero_cost():
             assert "MSWEA_COST_TRACKING='ignore_errors'" in str(exc_info.value)
 
 
+@pytest.mark.parametrize("model_class", [LitellmModel, RobustLitellmModel])
+@pytest.mark.parametrize(
+    ("stream_stop_regex", "expected_content"),
+    [
+        (r"```bash\s*\n(.*?)\n```", "THOUGHT: hi\n```bash\necho hi\n```"),
+        ("", "THOUGHT: hi\n```bash\necho hi\n```\nThis is never needed"),
+    ],
+)
+def test_litellm_model_streaming_stops_after_action(model_class, stream_stop_regex, expected_content):
+    """Test that streaming stops as soon as the action is complete and reports timings."""
+    model = model_class(
+        model_name="gpt-4o",
+        stream=True,
+        stream_stop_regex=stream_stop_regex,
+        cost_tracking="ignore_errors",
+        model_kwargs={"mock_response": "THOUGHT: hi\n```bash\necho hi\n```\nThis is never needed"},
+    )
+    result = model.query([{"role": "user", "content": "test"}])
+    assert result["content"] == expected_content
+    stats = result["extra"]["response"]["streaming"]
+    assert stats["stopped_early"] == bool(stream_stop_regex)
+    assert 0 < stats["time_to_first_token"] <= stats["time_to_action"]
+    assert model.n_calls == 1
+
+
+@pytest.mark.parametrize("model_class", [LitellmModel, RobustLitellmModel])
+async def test_litellm_model_aquery(model_class):
+    """Test that aquery uses litellm.acompletion and updates the same counters as query."""
+    model = model_class(model_name="gpt-4o", model_kwargs={"mock_response": "Async response"})
+    with patch("litellm.completion") as mock_completion:
+        result = await model.aquery([{"role": "user", "content": "test", "timestamp": 0.0}])
+    mock_completion.assert_not_called()
+    assert result["content"] == "Async response"
+    assert model.n_calls == 1
+    assert model.cost > 0
+
+
+def test_litellm_model_retry_wait_time():
+    """Test that the backoff between retries is added up in retry_wait_time."""
+    model = LitellmModel(model_name="gpt-4o")
+    error = litellm.exceptions.InternalServerError("Server error", llm_provider="openai", model="gpt-4o")
+    n_timed_queries = GLOBAL_MODEL_STATS.n_timed_queries
+    n_retries = GLOBAL_MODEL_STATS.n_retries
+    with (
+        patch(
+            "litellm.completion",
+            side_effect=[error, error, litellm.completion(model="gpt-4o", messages=[], mock_response="Hi")],
+        ),
+        patch.object(LitellmModel._query.retry, "sleep", lambda seconds: None),
+    ):
+        assert model.query([{"role": "user", "content": "test"}])["content"] == "Hi"
+    assert model.retry_wait_time == 4 + 4
+    assert GLOBAL_MODEL_STATS.n_timed_queries == n_timed_queries + 3
+    assert GLOBAL_MODEL_STATS.n_retries == n_retries + 2
+
+
+def test_litellm_model_rate_limit_uses_shared_limiter():
+    """Rate limit errors block the model in the shared rate limiter instead of backing off per instance."""
+    model = LitellmModel(model_name="rate-limited-model")
+    error = litellm.exceptions.RateLimitError("Rate limited", llm_provider="openai", model="gpt-4o")
+    n_rate_limited, queue_wait_time = GLOBAL_MODEL_STATS.n_rate_limited, GLOBAL_MODEL_STATS.queue_wait_time
+    tenacity_sleeps = []
+    with (
+        patch(
+            "litellm.completion",
+            side_effect=[error, error, litellm.completion(model="gpt-4o", messages=[], mock_response="Hi")],
+        ),
+        patch.object(LitellmModel._query.retry, "sleep", tenacity_sleeps.append),
+        patch.object(GLOBAL_RATE_LIMITER, "base_backoff", 0.05),
+    ):
+        start = time.perf_counter()
+        assert model.query([{"role": "user", "content": "test"}])["content"] == "Hi"
+    assert tenacity_sleeps == [0.0, 0.0]
+    assert GLOBAL_MODEL_STATS.n_rate_limited == n_rate_limited + 2
+    # 0.05s and 0.1s of backoff (plus jitter)
+    assert time.perf_counter() - start >= 0.15
+    assert 0 < model.retry_wait_time < 0.3
+    assert GLOBAL_MODEL_STATS.queue_wait_time - queue_wait_time == pytest.approx(model.retry_wait_time)
+
+
+@pytest.mark.parametrize("model_class", [LitellmModel, RobustLitellmModel])
+def test_litellm_model_tool_calls(model_class):
+    """Test that tool calls are returned and tool messages are passed on to the provider."""
+    tool_call = {"id": "call_1", "type": "function", "function": {"name": "bash", "arguments": '{"command": "ls"}'}}
+    model = model_class(model_name="gpt-4o", model_kwargs={"mock_response": "", "mock_tool_calls": [tool_call]})
+    result = model.query([{"role": "user", "content": "test"}], tools=[])
+    assert result["content"] == ""
+    assert result["tool_calls"][0] | {"function": tool_call["function"]} == result["tool_calls"][0]
+    assert result["tool_calls"][0]["id"] == "call_1"
+
+    messages = [
+        {"role": "assistant", "content": "", "tool_calls": [tool_call], "timestamp": 0.0},
+        {"role": "tool", "content": "file.txt", "tool_call_id": "call_1", "timestamp": 0.0},
+    ]
+    assert model._prepare_messages(messages) == [
+        {"role": "assistant", "content": "", "tool_calls": [tool_call]},
+        {"role": "tool", "content": "file.txt", "tool_call_id": "call_1"},
+    ]
+
+
 def test_response_api_model_basic_query():
     """Test that Response API model uses litellm.responses and tracks previous_response_id."""
     model = LitellmResponseAPIModel(model_name="gpt-5-mini")
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 from unittest.mock import Mock, patch
 
 import pytest
@@ -209,3 +210,42 @@ def test_openrouter_model_no_api_key():
             with patch("minisweagent.models.openrouter_model.retry", lambda **kwargs: lambda f: f):
                 with pytest.raises(OpenRouterAuthenticationError):
                     model._query(messages)
+
+
+def test_openrouter_model_streaming_stops_after_action(reset_global_stats):
+    """Test that the streaming query stops reading once the action is complete."""
+    chunks = ["THOUGHT: hi\n```ba", "sh\necho hi\n``", "`\nThis is never needed"]
+    lines = [b"data: " + json.dumps({"id": "gen-1", "choices": [{"delta": {"content": c}}]}).encode() for c in chunks]
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "test-key"}):
+        model = OpenRouterModel(model_name="openai/gpt-4o", stream=True)
+        with (
+            patch("requests.post") as mock_post,
+            patch("litellm.completion_cost", return_value=0.5) as mock_cost,
+        ):
+            mock_post.return_value.iter_lines.return_value = iter([b": OPENROUTER PROCESSING", *lines, b"data: [DONE]"])
+            result = model.query([{"role": "user", "content": "test"}])
+
+    assert json.loads(mock_post.call_args.kwargs["data"])["stream"] is True
+    assert mock_post.call_args.kwargs["stream"] is True
+    assert mock_post.return_value.close.called
+    assert mock_cost.call_args.kwargs["model"] == "openrouter/openai/gpt-4o"
+    assert result["content"] == "THOUGHT: hi\n```bash\necho hi\n```"
+    assert result["extra"]["response"]["streaming"]["stopped_early"] is True
+    assert model.cost == GLOBAL_MODEL_STATS.cost == 0.5
+
+
+def test_openrouter_model_honors_retry_after(mock_response):
+    """A 429 pauses the model for Retry-After seconds (in the shared rate limiter) before the next attempt."""
+    rate_limited = Mock(status_code=429, headers=requests.structures.CaseInsensitiveDict({"Retry-After": "0.2"}))
+    rate_limited.raise_for_status.side_effect = requests.exceptions.HTTPError(response=rate_limited)
+    success = Mock(status_code=200)
+    success.json.return_value = mock_response
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "test-key"}):
+        model = OpenRouterModel(model_name="retry-after-test-model")
+        with patch("requests.post", side_effect=[rate_limited, success]) as mock_post:
+            start = time.perf_counter()
+            result = model.query([{"role": "user", "content": "Hello"}])
+    assert result["content"] == "Hello! 2+2 equals 4."
+    assert mock_post.call_count == 2
+    assert time.perf_counter() - start >= 0.2
+    assert 0 < model.retry_wait_time < 0.5
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+from email.utils import formatdate
+from unittest.mock import Mock
+
+import httpx
+import pytest
+import requests
+
+from minisweagent.models import GlobalModelStats
+from minisweagent.models.utils.rate_limit import RateLimiter, get_retry_after, is_rate_limit_error
+
+
+class FakeModel:
+    def __init__(self, limiter: RateLimiter, responses: list):
+        self.rate_limit_key = "fake"
+        self.retry_wait_time = 0.0
+        self._responses = responses
+        self.query = limiter.limit(FakeModel._query).__get__(self)
+        self.aquery = limiter.limit(FakeModel._aquery).__get__(self)
+
+    def _query(self, messages: list[dict]):
+        response = self._responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def _aquery(self, messages: list[dict]):
+        return self._query(messages)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def _http_error(status_code: int, headers: dict) -> Exception:
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "https://example.com"))
+    return httpx.HTTPStatusError("error", request=response.request, response=response)
+
+
+def test_requests_per_minute():
+    limiter = RateLimiter()
+    limiter.configure("model", rpm=120)
+    assert all(limiter.reserve("model") == 0 for _ in range(120))
+    assert limiter.reserve("model") == pytest.approx(0.5, abs=0.01)
+    assert limiter.reserve("model") == pytest.approx(1.0, abs=0.01)
+    assert limiter.reserve("other") == 0
+
+
+def test_configure_keeps_state():
+    limiter = RateLimiter()
+    limiter.configure("model", rpm=60)
+    for _ in range(60):
+        limiter.reserve("model")
+    limiter.configure("model", rpm=60)  # e.g., another worker creates the same model
+    assert limiter.reserve("model") > 0
+    limiter.configure("model", rpm=0)
+    assert limiter.reserve("model") == 0
+
+
+def test_tokens_per_minute_are_corrected_with_usage():
+    limiter = RateLimiter()
+    limiter.configure("fake", tpm=6000)
+    model = FakeModel(limiter, [{"usage": {"total_tokens": 6000}}, {}])
+    model.query([{"role": "user", "content": "x" * 400}])  # estimated 100 tokens, but used 6000
+    assert limiter.reserve("fake", 60) == pytest.approx(0.6, abs=0.05)
+
+
+def test_failed_calls_give_back_tokens():
+    limiter = RateLimiter()
+    limiter.configure("fake", tpm=6000)
+    model = FakeModel(limiter, [ValueError("bad request")])
+    with pytest.raises(ValueError):
+        model.query([{"role": "user", "content": "x" * 24000}])  # estimated 6000 tokens
+    assert limiter.reserve("fake", 6000) == 0
+
+
+def test_rate_limit_blocks_all_callers_with_backoff():
+    stats = GlobalModelStats()
+    limiter = RateLimiter(base_backoff=1.0, max_backoff=3.0, jitter=0.5, stats=stats)
+    assert limiter.on_rate_limit("model") == 1.0
+    assert 0.9 < limiter.reserve("model") <= 1.5
+    assert limiter.on_rate_limit("model") == 2.0
+    assert limiter.on_rate_limit("model") == 3.0
+    assert limiter.reserve("other") == 0
+    limiter.on_success("model")
+    assert limiter.on_rate_limit("model") == 1.0
+    assert limiter.on_rate_limit("model", retry_after=0.5) == 0.5
+    assert stats.n_rate_limited == 5
+
+
+def test_waiters_are_spread_after_block():
+    limiter = RateLimiter(jitter=0.5)
+    limiter.on_rate_limit("model", retry_after=10)
+    waits = [limiter.reserve("model") for _ in range(50)]
+    assert all(9.9 < wait <= 15 for wait in waits)
+    assert max(waits) - min(waits) > 1
+
+
+def test_limit_waits_and_records_queue_wait():
+    stats = GlobalModelStats()
+    limiter = RateLimiter(base_backoff=0.1, stats=stats)
+    model = FakeModel(limiter, [RateLimitError("429"), {"content": "hi"}])
+    with pytest.raises(RateLimitError):
+        model.query([])
+    start = time.perf_counter()
+    assert model.query([]) == {"content": "hi"}
+    assert time.perf_counter() - start >= 0.09
+    assert 0 < model.retry_wait_time < 0.3
+    assert stats.queue_wait_time == pytest.approx(model.retry_wait_time)
+    assert stats.n_rate_limited == 1
+
+
+def test_async_limit():
+    limiter = RateLimiter()
+    model = FakeModel(limiter, [{"content": "hi"}])
+    limiter.on_rate_limit("fake", retry_after=0.1)
+    assert asyncio.run(model.aquery([])) == {"content": "hi"}
+    assert model.retry_wait_time > 0
+
+
+def test_threads_share_limits():
+    limiter = RateLimiter()
+    limiter.configure("fake", rpm=600)  # 10 per second after a burst of 600
+    models = [FakeModel(limiter, [{}] * 100) for _ in range(7)]
+    for _ in range(590):
+        limiter.reserve("fake")
+    start = time.perf_counter()
+    threads = [threading.Thread(target=lambda m=model: [m.query([]) for _ in range(3)]) for model in models]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 21 calls, 10 of them from the remaining burst, 11 more at 10 per second
+    assert 1.0 <= time.perf_counter() - start < 2.0
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({"retry-after": "12"}, 12),
+        ({"Retry-After": "1.5"}, 1.5),
+        ({"retry-after-ms": "250"}, 0.25),
+        ({"retry-after": "in 30s"}, 30),
+        ({"retry-after": "garbage"}, None),
+        ({}, None),
+    ],
+)
+def test_get_retry_after(headers, expected):
+    if headers.get("retry-after") == "in 30s":
+        headers = {"retry-after": formatdate(time.time() + 30, usegmt=True)}  # HTTP date
+    result = get_retry_after(_http_error(429, headers))
+    assert result == (pytest.approx(expected, abs=2) if expected is not None else None)
+
+
+def test_get_retry_after_from_cause():
+    response = Mock(status_code=429, headers=requests.structures.CaseInsensitiveDict({"Retry-After": "3"}))
+    error = RateLimitError("Rate limit exceeded")
+    error.__cause__ = requests.exceptions.HTTPError(response=response)
+    assert get_retry_after(error) == 3
+    assert is_rate_limit_error(error)
+
+
+@pytest.mark.parametrize(
+    ("exception", "expected"),
+    [
+        (RateLimitError("slow down"), True),
+        (_http_error(429, {}), True),
+        (_http_error(529, {}), True),
+        (RuntimeError("Anthropic API is overloaded"), True),
+        (_http_error(500, {}), False),
+        (ValueError("bad request"), False),
+    ],
+)
+def test_is_rate_limit_error(exception, expected):
+    assert is_rate_limit_error(exception) == expected
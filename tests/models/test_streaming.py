@@ -0,0 +1,43 @@
+import pytest
+
+from minisweagent.models.utils.streaming import _closing_literal, consume_stream
+
+_ACTION_REGEX = r"```bash\s*\n(.*?)\n```"
+
+
+@pytest.mark.parametrize(
+    ("regex", "closing"),
+    [
+        (_ACTION_REGEX, "```"),
+        (r"<action>(.*?)</action>", "</action>"),
+        (r"done\.", "done."),
+        (r"a\nxyz", "xyz"),
+        (r"(.*)\n", ""),
+        (r"```+", ""),
+        (r"ab|cd", ""),
+        (r"(?i)done", ""),
+    ],
+)
+def test_closing_literal(regex, closing):
+    assert _closing_literal(regex) == closing
+
+
+@pytest.mark.parametrize("regex", [_ACTION_REGEX, r"```bash\s*\n(.*?)\n`{3}"])
+def test_consume_stream_stops_after_action(regex):
+    text = "THOUGHT: hi\n```bash\necho hi\n```\nThis is never needed"
+    deltas = [text[i : i + 1] for i in range(len(text))]  # the closing fence is split over several deltas
+    consumed = []
+
+    def stream():
+        for delta in deltas:
+            consumed.append(delta)
+            yield delta
+
+    result, stats = consume_stream(stream(), stop_regex=regex, start_time=0.0)
+    assert result == "THOUGHT: hi\n```bash\necho hi\n```"
+    assert stats["stopped_early"] and "".join(consumed) == result
+
+
+def test_consume_stream_without_stop_regex():
+    result, stats = consume_stream(["a", "", "b"], stop_regex="", start_time=0.0)
+    assert (result, stats["stopped_early"]) == ("ab", False)
@@ -0,0 +1,200 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import typer
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import main, process_instance
+from minisweagent.run.extra.utils.preds_journal import PredsJournal
+from minisweagent.run.extra.utils.requeue import RequeuePolicy
+from minisweagent.run.extra.utils.run_manifest import FAILED_INFRA, QUEUED, SAVED, RunManifest
+
+# Every attempt appends to a file of the environment and submits its contents
+_ATTEMPT = "```bash\necho attempt >> log.txt; echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT; cat setup.txt log.txt\n```"
+
+
+def _instances(n: int) -> list[dict]:
+    return [{"instance_id": f"repo__repo-{i}", "problem_statement": f"Task {i}"} for i in range(n)]
+
+
+@pytest.fixture
+def config():
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    config["run"] = {"requeue": {"base_delay": 0.05, "jitter": 0}}
+    return config
+
+
+class ForkableEnvironment(LocalEnvironment):
+    """`LocalEnvironment` in a directory that is copied for snapshots and forks (like the image of a container)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.snapshots: list[str] = []
+        self.forks: list[ForkableEnvironment] = []
+        self.cleaned_up = False
+
+    def snapshot(self) -> str:
+        self.snapshots.append(shutil.copytree(self.config.cwd, f"{self.config.cwd}.snapshot{len(self.snapshots)}"))
+        return self.snapshots[-1]
+
+    def fork(self) -> "ForkableEnvironment":
+        snapshot = self.snapshots[-1] if self.snapshots else self.snapshot()
+        self.forks.append(ForkableEnvironment(cwd=shutil.copytree(snapshot, f"{snapshot}.fork{len(self.forks)}")))
+        return self.forks[-1]
+
+    def cleanup(self):
+        super().cleanup()
+        self.cleaned_up = True
+
+
+class Environments:
+    """`get_sb_environment` that runs the startup command (writing `setup.txt`) once per environment."""
+
+    def __init__(self, tmp_path: Path, *, fail: bool = False):
+        self.tmp_path = tmp_path
+        self.fail = fail
+        self.started: list[ForkableEnvironment] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, config, instance):
+        if self.fail:
+            raise RuntimeError("docker run timed out")
+        with self._lock:
+            path = self.tmp_path / "envs" / f"{instance['instance_id']}-{len(self.started)}"
+            path.mkdir(parents=True)
+            env = ForkableEnvironment(cwd=str(path))
+            self.started.append(env)
+        env.execute(f"echo {instance['instance_id']} > setup.txt")
+        return env
+
+
+@pytest.fixture
+def get_model():
+    with patch(
+        "minisweagent.run.extra.swebench.get_model", side_effect=lambda **kwargs: DeterministicModel(outputs=[_ATTEMPT])
+    ):
+        yield
+
+
+def test_process_instance_with_attempts(tmp_path, config, get_model):
+    output = tmp_path / "output"
+    journal = PredsJournal(output / "preds.jsonl")
+    attempt_journals = [PredsJournal(output / f"attempt_{k}" / "preds.jsonl") for k in (1, 2, 3)]
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    progress_manager = MagicMock()
+    environments = Environments(tmp_path)
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments):
+        kwargs = {"preds_journal": journal, "manifest": manifest, "attempt_journals": attempt_journals}
+        assert process_instance(_instances(1)[0], output, config, progress_manager, **kwargs) is None
+
+    # one environment with one snapshot, every attempt ran in its own fork of it
+    [env] = environments.started
+    assert len(env.snapshots) == 1 and len(env.forks) == 3
+    assert env.cleaned_up and all(fork.cleaned_up for fork in env.forks)
+    for k, attempt_journal in enumerate(attempt_journals, 1):
+        assert attempt_journal.get("repo__repo-0")["model_patch"] == "repo__repo-0\nattempt\n"
+        traj = json.loads((output / f"attempt_{k}" / "repo__repo-0" / "repo__repo-0.traj.json").read_text())
+        assert traj["info"]["exit_status"] == "Submitted" and traj["info"]["attempt"] == k
+    assert journal.get("repo__repo-0")["model_patch"] == "repo__repo-0\nattempt\n"
+    assert not Path(env.snapshots[0], "log.txt").exists()  # attempts don't change the snapshot
+    assert (manifest.get("repo__repo-0")["state"], manifest.get("repo__repo-0")["n_steps"]) == (SAVED, 3)
+    progress_manager.on_env_started.assert_called_once()
+    progress_manager.on_instance_end.assert_called_once_with("repo__repo-0", "Submitted")
+
+
+def test_attempts_requeue_if_environment_fails(tmp_path, config, get_model):
+    output = tmp_path / "output"
+    journal = PredsJournal(output / "preds.jsonl")
+    attempt_journals = [PredsJournal(output / f"attempt_{k}" / "preds.jsonl") for k in (1, 2)]
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.queue(["repo__repo-0"])
+    policy = RequeuePolicy(max_attempts=2, base_delay=30, jitter=0)
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=Environments(tmp_path, fail=True)):
+        kwargs = {"preds_journal": journal, "manifest": manifest, "requeue_policy": policy}
+        kwargs |= {"attempt_journals": attempt_journals}
+        assert process_instance(_instances(1)[0], output, config, MagicMock(), **kwargs) == 30
+        assert manifest.get("repo__repo-0")["state"] == QUEUED
+        assert process_instance(_instances(1)[0], output, config, MagicMock(), **kwargs) is None
+    assert manifest.get("repo__repo-0")["state"] == FAILED_INFRA
+    assert journal.get("repo__repo-0")["model_patch"] == "docker run timed out"
+    assert all(attempt_journal.instance_ids == set() for attempt_journal in attempt_journals)
+
+
+def test_attempts_clean_up_environment_if_snapshot_fails(tmp_path, config, get_model):
+    output = tmp_path / "output"
+    journal = PredsJournal(output / "preds.jsonl")
+    attempt_journals = [PredsJournal(output / f"attempt_{k}" / "preds.jsonl") for k in (1, 2)]
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    environments = Environments(tmp_path)
+    with (
+        patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments),
+        patch.object(ForkableEnvironment, "snapshot", side_effect=RuntimeError("docker commit failed")),
+    ):
+        kwargs = {"preds_journal": journal, "manifest": manifest, "attempt_journals": attempt_journals}
+        assert process_instance(_instances(1)[0], output, config, MagicMock(), **kwargs) is None
+    [env] = environments.started
+    assert env.cleaned_up and env.forks == []
+    assert manifest.get("repo__repo-0")["state"] == FAILED_INFRA
+    assert journal.get("repo__repo-0")["model_patch"] == "docker commit failed"
+
+
+def _main(tmp_path, config, **kwargs):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(config))
+    main(
+        **{
+            "subset": "_test",
+            "split": "test",
+            "slice_spec": "",
+            "filter_spec": "",
+            "shuffle": False,
+            "output": str(tmp_path / "output"),
+            "workers": 2,
+            "min_workers": 0,
+            "async_mode": False,
+            "model": None,
+            "model_class": None,
+            "redo_existing": False,
+            "retry_failed": False,
+            "resume": False,
+            "stream_traj": False,
+            "schedule_from": "",
+            "headless": False,
+            "progress_jsonl": "",
+            "attempts": 2,
+            "metrics_port": 0,
+            "metrics_file": "",
+            "queue": "",
+            "config_spec": config_path,
+            "environment_class": "docker",
+        }
+        | kwargs
+    )
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_main_with_attempts(tmp_path, config, get_model, async_mode):
+    environments = Environments(tmp_path)
+    with (
+        patch("minisweagent.run.extra.swebench.load_dataset", return_value=_instances(3)),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments),
+    ):
+        _main(tmp_path, config, async_mode=async_mode)
+    assert len(environments.started) == 3
+    assert all(len(env.forks) == 2 for env in environments.started)
+    for preds_path in ["preds.json", "attempt_1/preds.json", "attempt_2/preds.json"]:
+        preds = json.loads((tmp_path / "output" / preds_path).read_text())
+        assert {pred["model_patch"] for pred in preds.values()} == {f"repo__repo-{i}\nattempt\n" for i in range(3)}
+
+
+def test_main_attempts_need_forkable_environment(tmp_path, config):
+    with pytest.raises(typer.BadParameter, match="local"):
+        _main(tmp_path, config, environment_class="local")
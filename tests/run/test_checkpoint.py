@@ -0,0 +1,184 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import main, process_instance
+from minisweagent.run.utils.checkpoint import CheckpointWriter, get_replay_actions, load_checkpoint
+from minisweagent.run.utils.save import load_traj
+
+
+@pytest.fixture
+def config():
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    return config
+
+
+class CrashingModel(DeterministicModel):
+    """Raises after the given outputs are used up (like a worker that dies mid-trajectory)."""
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        if self.current_index + 1 >= len(self.config.outputs):
+            raise RuntimeError("Worker died")
+        return super().query(messages, **kwargs)
+
+
+@pytest.mark.parametrize(
+    ("action", "replayed"),
+    [
+        ("cat a.txt", False),
+        ("nl -ba a.py | sed -n '1,10p'", False),
+        ("git diff", False),
+        ("grep -rn foo . | head", False),
+        ("echo a > a.txt", True),
+        ("cat a.txt > b.txt", True),
+        ("sed -i 's/a/b/' a.txt", True),
+        ("ls && rm a.txt", True),
+        ("python test.py", True),
+        ('find . -name "*.py"', False),
+        ('find . -name "*.pyc" -delete', True),
+        ("find . -exec rm {} +", True),
+        ("find . -name '*.tmp' -execdir rm {} \\;", True),
+        ("find . -type f -fprint files.txt", True),
+    ],
+)
+def test_get_replay_actions(config, action, replayed):
+    agent = DefaultAgent(DeterministicModel(outputs=[]), LocalEnvironment(), **config["agent"])
+    messages = [
+        {"role": "assistant", "content": f"```bash\n{action}\n```"},
+        {"role": "user", "content": "output"},
+        {"role": "assistant", "content": "no action"},
+    ]
+    assert get_replay_actions(agent, messages) == ([action] if replayed else [])
+
+
+@pytest.mark.parametrize("stream_traj", [False, True])
+def test_resume_from_checkpoint(config, tmp_path, stream_traj):
+    instance = {"instance_id": "test-1", "problem_statement": "Write a file"}
+    checkpoint_path = tmp_path / "output" / "test-1" / "test-1.checkpoint.jsonl"
+    outputs = ["```bash\necho hello > a.txt\n```", "```bash\ncat a.txt\n```"]
+
+    def run(model, workdir: Path, resume: bool):
+        workdir.mkdir()
+        with (
+            patch("minisweagent.run.extra.swebench.get_model", return_value=model),
+            patch(
+                "minisweagent.run.extra.swebench.get_sb_environment", return_value=LocalEnvironment(cwd=str(workdir))
+            ),
+        ):
+            process_instance(instance, tmp_path / "output", config, MagicMock(), resume=resume, stream_traj=stream_traj)
+
+    run(CrashingModel(outputs=outputs), tmp_path / "first", resume=False)
+    checkpoint = load_checkpoint(checkpoint_path)
+    assert checkpoint is not None
+    assert checkpoint["model_stats"]["api_calls"] == 2
+    assert len(checkpoint["messages"]) == 2 + 2 * 2
+
+    # The new environment starts empty, the state-changing action is replayed
+    model = DeterministicModel(outputs=["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT && cat a.txt\n```"])
+    run(model, tmp_path / "second", resume=True)
+    assert (tmp_path / "second" / "a.txt").read_text() == "hello\n"
+    assert not (tmp_path / "second" / "b.txt").exists()
+    assert model.n_calls == 3
+    assert not checkpoint_path.exists()
+    traj = load_traj(tmp_path / "output" / "test-1" / ("test-1.traj.jsonl" if stream_traj else "test-1.traj.json"))
+    assert (traj["info"]["exit_status"], traj["info"]["submission"]) == ("Submitted", "hello\n")
+    assert traj["messages"][: len(checkpoint["messages"])] == checkpoint["messages"]
+    assert traj["info"]["model_stats"]["api_calls"] == 3
+    assert len(traj["timings"]) == 3
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_main_resume(config, tmp_path, async_mode):
+    instance = {"instance_id": "test-1", "problem_statement": "Write a file"}
+    outputs = ["```bash\necho hello > a.txt\n```", "```bash\ncat a.txt\n```"]
+    model = CrashingModel(outputs=outputs)
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(config))
+
+    def run(workdir: Path, resume: bool):
+        workdir.mkdir()
+        with (
+            patch("minisweagent.run.extra.swebench.load_dataset", return_value=[instance]),
+            patch("minisweagent.run.extra.swebench.get_model", return_value=model),
+            patch(
+                "minisweagent.run.extra.swebench.get_sb_environment", return_value=LocalEnvironment(cwd=str(workdir))
+            ),
+        ):
+            main(
+                subset="_test",
+                split="test",
+                slice_spec="",
+                filter_spec="",
+                shuffle=False,
+                output=str(tmp_path / "output"),
+                workers=1,
+                min_workers=0,
+                async_mode=async_mode,
+                model=None,
+                model_class=None,
+                redo_existing=False,
+                retry_failed=True,
+                resume=resume,
+                stream_traj=False,
+                schedule_from="",
+                headless=False,
+                progress_jsonl="",
+                metrics_port=0,
+                metrics_file="",
+                attempts=1,
+                queue="",
+                config_spec=config_path,
+                environment_class="docker",
+            )
+
+    run(tmp_path / "first", resume=False)
+    assert (tmp_path / "output" / "test-1" / "test-1.checkpoint.jsonl").exists()
+    model = DeterministicModel(outputs=["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT && cat a.txt\n```"])
+    run(tmp_path / "second", resume=True)
+    assert (tmp_path / "second" / "a.txt").read_text() == "hello\n"
+    assert model.n_calls == 3  # continued from the checkpoint
+    preds = json.loads((tmp_path / "output" / "preds.json").read_text())
+    assert preds["test-1"]["model_patch"] == "hello\n"
+
+
+def test_checkpoint_writer_appends(config, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr("minisweagent.run.utils.checkpoint.os.fsync", synced.append)
+    path = tmp_path / "test.checkpoint.jsonl"
+    writer = CheckpointWriter(path)
+    agent = DefaultAgent(DeterministicModel(outputs=[]), LocalEnvironment(), **config["agent"])
+    agent.messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    writer.save(agent)
+    contents = [path.read_text()]
+    for step in range(3):
+        agent.add_message("assistant", f"step {step}")
+        agent.add_message("user", "x" * 100)
+        agent.model.n_calls += 1
+        writer.save(agent)
+        contents.append(path.read_text())
+        # every step only appends its own messages and the counters
+        assert contents[-1].startswith(contents[-2]) and contents[-1].count("\n") == contents[-2].count("\n") + 3
+    assert len(synced) == 1 + 4  # the directory once and every step
+    checkpoint = load_checkpoint(path)
+    assert checkpoint is not None
+    assert checkpoint["messages"] == agent.messages and checkpoint["model_stats"]["api_calls"] == 3
+
+    # a partially written step is ignored
+    with path.open("a") as f:
+        f.write('{"type": "message", "message": {"role": "assistant", "content": "step 3"}}\n{"type": "sta')
+    assert load_checkpoint(path) == checkpoint
+
+    # a new run of the agent starts the checkpoint over
+    agent.messages, agent.model.n_calls = agent.messages[:2], 0
+    writer.save(agent)
+    assert path.read_text() == contents[0]
+    writer.discard()
+    assert not path.exists()
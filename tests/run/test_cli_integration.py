@@ -499,6 +499,7 @@ def test_mini_e_help():
         ("github-issue", ["github-issue", "gh"]),
         ("swebench", ["swebench"]),
         ("swebench-single", ["swebench-single"]),
+        ("swebench-status", ["swebench-status"]),
     ],
 )
 def test_mini_extra_subcommand_help(subcommand: str, aliases: list[str]):
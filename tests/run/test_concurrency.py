@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+
+from minisweagent.models import GlobalModelStats
+from minisweagent.run.extra.utils.concurrency import ConcurrencyController, Signals
+
+
+def _signals(**kwargs) -> Signals:
+    return Signals(
+        **(
+            {"n_calls": 100, "n_rate_limited": 0, "latency": 2.0, "load": 0.5, "free_memory": 0.5, "free_disk_gb": 100}
+            | kwargs
+        )
+    )
+
+
+def _saturate(controller: ConcurrencyController) -> None:
+    """Make all slots busy (and free them again), so that the controller sees demand for more workers."""
+    for _ in range(controller.limit):
+        controller.acquire()
+    for _ in range(controller.limit):
+        controller.release()
+
+
+def test_slots_follow_limit():
+    controller = ConcurrencyController(1, 4, initial_workers=2)
+    assert controller.try_acquire()
+    assert controller.try_acquire()
+    assert not controller.try_acquire()
+    controller.set_limit(3)
+    assert controller.try_acquire()
+    controller.set_limit(1)
+    controller.release()
+    controller.release()
+    assert not controller.try_acquire()  # still one active
+    controller.release()
+    assert controller.try_acquire()
+
+
+def test_acquire_waits_for_limit():
+    controller = ConcurrencyController(1, 2)
+    controller.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    controller.set_limit(2)
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_increase_only_when_saturated():
+    controller = ConcurrencyController(2, 4)
+    assert controller.decide(_signals()) == (2, "only 0 of 2 workers were busy")
+    _saturate(controller)
+    assert controller.decide(_signals()) == (3, "no pressure")
+    controller.set_limit(4)
+    _saturate(controller)
+    assert controller.decide(_signals()) == (4, "at maximum")
+
+
+@pytest.mark.parametrize(
+    ("signals", "reason"),
+    [
+        ({"n_calls": 10, "n_rate_limited": 5}, "33% of model calls rate limited"),
+        ({"load": 3.0}, "load 3.00 per CPU"),
+        ({"free_memory": 0.05}, "5% memory available"),
+        ({"free_disk_gb": 1.0}, "1.0 GB disk free"),
+    ],
+)
+def test_back_off_under_pressure(signals, reason):
+    controller = ConcurrencyController(2, 16, initial_workers=8, cooldown=2)
+    assert controller.decide(_signals(**signals)) == (6, f"backing off: {reason}")
+    controller.set_limit(6)
+    for expected in ["cooling down", "cooling down", "no pressure"]:
+        _saturate(controller)
+        assert controller.decide(_signals())[1] == expected
+
+
+def test_back_off_respects_minimum():
+    controller = ConcurrencyController(2, 4, initial_workers=2)
+    assert controller.decide(_signals(load=3.0))[0] == 2
+
+
+def test_no_increase_while_latency_degraded():
+    controller = ConcurrencyController(1, 4)
+    controller.decide(_signals(latency=2.0))
+    _saturate(controller)
+    assert controller.decide(_signals(latency=4.0)) == (1, "model latency 4.0s (fastest 2.0s)")
+    _saturate(controller)
+    assert controller.decide(_signals(latency=2.5)) == (2, "no pressure")
+
+
+def test_adjust_samples_model_stats(caplog):
+    stats = GlobalModelStats()
+    controller = ConcurrencyController(1, 4, initial_workers=4, model_stats=stats, disk_path="/")
+    for _ in range(9):
+        stats.add(0.0)
+        stats.record_latency(1.0)
+    stats.record_rate_limit()
+    with caplog.at_level(logging.INFO, logger="minisweagent.concurrency"):
+        assert controller.adjust() == 3
+    decision = controller.decisions[-1]
+    assert (decision["old"], decision["new"], decision["n_calls"], decision["n_rate_limited"]) == (4, 3, 9, 1)
+    assert decision["latency"] == 1.0
+    assert "Workers 4 -> 3 (backing off: 10% of model calls rate limited" in caplog.text
+    # only calls since the last decision count
+    assert controller.sample().n_rate_limited == 0
+
+
+def test_aslot():
+    controller = ConcurrencyController(1, 2)
+    running = []
+    max_running = 0
+
+    async def task():
+        nonlocal max_running
+        async with controller.aslot(poll_interval=0.01):
+            running.append(1)
+            max_running = max(max_running, len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+
+    async def run():
+        await asyncio.gather(*(task() for _ in range(5)))
+
+    asyncio.run(run())
+    assert max_running == 1
+    assert controller.active == 0
+
+
+def test_background_adjustment():
+    stats = GlobalModelStats()
+    controller = ConcurrencyController(1, 4, initial_workers=4, interval=0.05, model_stats=stats)
+    stats.record_rate_limit()
+    controller.start()
+    start = time.time()
+    while controller.limit == 4:
+        assert time.time() - start < 5, "timed out"
+        time.sleep(0.01)
+    controller.stop()
+    assert controller.limit == 3
@@ -0,0 +1,143 @@
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from minisweagent.run.extra.utils.batch_progress import RunBatchProgressManager
+from minisweagent.run.extra.utils.image_prefetch import ImagePrefetcher
+
+FAKE_DOCKER = """#!{python}
+# Stand-in for docker and a registry: images are files in the state directory
+import sys, time
+from pathlib import Path
+
+state = Path({state!r})
+cmd, image = sys.argv[1:-1], sys.argv[-1]
+path = state / image.replace("/", "_")
+with (state / "log").open("a") as f:
+    f.write(" ".join(cmd) + " " + image + "\\n")
+if cmd == ["image", "inspect"]:
+    sys.exit(0 if path.exists() else 1)
+if cmd == ["pull"]:
+    time.sleep({pull_time})
+    sys.exit(1 if "missing" in image else path.touch())
+if cmd == ["rmi"]:
+    path.unlink()
+"""
+
+
+@pytest.fixture
+def fake_docker(tmp_path):
+    def make(pull_time: float = 0.0) -> tuple[str, Path]:
+        state = tmp_path / "images"
+        state.mkdir()
+        executable = tmp_path / "docker"
+        executable.write_text(FAKE_DOCKER.format(python=sys.executable, state=str(state), pull_time=pull_time))
+        executable.chmod(0o755)
+        return str(executable), state
+
+    return make
+
+
+def _log(state: Path) -> list[str]:
+    log = state / "log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def _wait_until(condition, timeout: float = 10.0):
+    start = time.time()
+    while not condition():
+        assert time.time() - start < timeout, "timed out"
+        time.sleep(0.01)
+
+
+def test_prefetch_lookahead(fake_docker):
+    executable, state = fake_docker()
+    images = [f"image{i}" for i in range(5)]
+    progress_manager = MagicMock()
+    prefetcher = ImagePrefetcher(images, executable=executable, lookahead=2, progress_manager=progress_manager)
+    _wait_until(lambda: len(list(state.glob("image*"))) == 2)
+    time.sleep(0.2)
+    assert sorted(p.name for p in state.glob("image*")) == ["image0", "image1"]
+
+    prefetcher.wait("image0")
+    _wait_until(lambda: (state / "image2").exists())
+    prefetcher.wait("image1")
+    prefetcher.wait("image2")
+    _wait_until(lambda: progress_manager.update_prefetch_status.call_args.kwargs["pulled"] == 5)
+    prefetcher.stop()
+    assert sorted(line for line in _log(state) if line.startswith("pull")) == [f"pull image{i}" for i in range(5)]
+    progress_manager.update_prefetch_status.assert_called_with(pulled=5, pulling=0, total=5)
+
+
+def test_wait_for_running_pull(fake_docker):
+    executable, state = fake_docker(pull_time=0.5)
+    prefetcher = ImagePrefetcher(["image0"], executable=executable, lookahead=1)
+    _wait_until(lambda: any(line.startswith("pull") for line in _log(state)))
+    prefetcher.wait("image0")
+    assert (state / "image0").exists()
+    prefetcher.stop()
+
+
+def test_started_instances_are_skipped(fake_docker):
+    executable, state = fake_docker()
+    prefetcher = ImagePrefetcher(["image0", "image1"], executable=executable, lookahead=1)
+    # image1 is started before it could be prefetched, so the environment pulls it
+    prefetcher.wait("image1")
+    _wait_until(lambda: (state / "image0").exists())
+    time.sleep(0.2)
+    prefetcher.stop()
+    assert [line for line in _log(state) if line.startswith("pull")] == ["pull image0"]
+
+
+def test_failed_pull(fake_docker):
+    executable, state = fake_docker()
+    prefetcher = ImagePrefetcher(["missing", "image1"], executable=executable, lookahead=2)
+    _wait_until(lambda: (state / "image1").exists())
+    prefetcher.wait("missing")
+    prefetcher.stop()
+
+
+def test_eviction(fake_docker):
+    executable, state = fake_docker()
+    (state / "preexisting").touch()
+    images = ["preexisting", "image1", "image1", "image2", "image3"]
+    prefetcher = ImagePrefetcher(images, executable=executable, lookahead=10, min_free_disk_gb=7)
+    # 10 GB disk, every image takes 1 GB
+    prefetcher._free_disk_gb = lambda: 10 - len([p for p in state.iterdir() if p.name != "log"])
+    _wait_until(lambda: (state / "image3").exists())
+
+    prefetcher.release("preexisting")  # not pulled by us
+    prefetcher.release("image1")  # still needed by another instance
+    assert sorted(p.name for p in state.iterdir() if p.name != "log") == ["image1", "image2", "image3", "preexisting"]
+    prefetcher.release("image1")
+    assert not (state / "image1").exists()
+    prefetcher.release("image3")
+    assert (state / "image3").exists()  # enough space
+    prefetcher.stop()
+    assert [line for line in _log(state) if line.startswith("rmi")] == ["rmi image1"]
+
+
+def test_requeued_instance_keeps_its_image(fake_docker):
+    executable, state = fake_docker()
+    prefetcher = ImagePrefetcher(["image0", "image1"], executable=executable, lookahead=10, min_free_disk_gb=9)
+    prefetcher._free_disk_gb = lambda: 10 - len([p for p in state.iterdir() if p.name != "log"])
+    prefetcher.wait("image0")
+    prefetcher.wait("image1")
+    prefetcher.release("image0", requeued=True)  # e.g., the environment couldn't be started
+    assert (state / "image0").exists()
+    prefetcher.release("image0")
+    assert not (state / "image0").exists()
+    prefetcher.stop()
+
+
+def test_progress_manager_shows_prefetch():
+    progress_manager = RunBatchProgressManager(num_instances=3)
+    assert len(progress_manager.render_group.renderables) == 3
+    progress_manager.update_prefetch_status(pulled=1, pulling=2, total=3)
+    progress_manager.update_prefetch_status(pulled=2, pulling=1, total=3)
+    assert len(progress_manager.render_group.renderables) == 4
+    task = progress_manager.render_group.renderables[3].tasks[0]
+    assert (task.completed, task.total, task.fields["pulling"]) == (2, 3, 1)
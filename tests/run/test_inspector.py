@@ -7,6 +7,7 @@ import pytest
 import typer
 
 from minisweagent.run.extra.inspector import TrajectoryInspector, main
+from minisweagent.run.utils.save import TrajectoryWriter
 
 
 def get_screen_text(app: TrajectoryInspector) -> str:
@@ -254,6 +255,16 @@ def test_trajectory_inspector_load_trajectory_formats(sample_simple_trajectory,
         assert len(app.messages) == 5
         assert len(app.steps) == 3
 
+        # Test streamed format
+        stream_file = temp_path / "stream.traj.jsonl"
+        writer = TrajectoryWriter(stream_file)
+        for message in sample_swebench_trajectory["messages"]:
+            writer.add_message(message)
+
+        app = TrajectoryInspector([stream_file])
+        assert len(app.messages) == 5
+        assert len(app.steps) == 3
+
 
 def test_trajectory_inspector_unrecognized_format():
     """Test inspector behavior with unrecognized trajectory format."""
@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+import pytest
+from datasets import Dataset
+
+from minisweagent.run.extra.swebench import filter_instance_ids
+from minisweagent.run.extra.utils.instance_store import InstanceStore
+
+
+def _instances(n: int) -> list[dict]:
+    return [
+        {"instance_id": f"repo{i % 3}__{i:03d}", "problem_statement": f"Task {i}", "FAIL_TO_PASS": [f"test_{i}"]}
+        for i in range(n)
+    ]
+
+
+def test_lookup():
+    store = InstanceStore.build(_instances(10))
+    assert len(store) == 10
+    assert "repo1__004" in store
+    assert "missing" not in store
+    assert store["repo1__004"] == _instances(10)[4]
+    assert store.get("missing") is None
+    with pytest.raises(KeyError):
+        store["missing"]
+
+
+def test_instance_ids_keep_dataset_order():
+    instances = list(reversed(_instances(5)))
+    store = InstanceStore.build(instances)
+    assert store.instance_ids() == [instance["instance_id"] for instance in instances]
+    assert store.get_many(["repo0__003", "missing", "repo1__001"]) == [instances[1], instances[3]]
+
+
+def test_sorted_instance_id():
+    instances = _instances(10)
+    store = InstanceStore.build(instances)
+    sorted_ids = sorted(instance["instance_id"] for instance in instances)
+    assert [store.sorted_instance_id(i) for i in range(10)] == sorted_ids
+    assert store.sorted_instance_id(-1) == sorted_ids[-1]
+    with pytest.raises(IndexError):
+        store.sorted_instance_id(10)
+
+
+def test_get_many_in_chunks():
+    store = InstanceStore.build(_instances(1200))
+    instance_ids = store.instance_ids()[::-1]
+    assert [instance["instance_id"] for instance in store.get_many(instance_ids)] == instance_ids
+
+
+def test_dataset_is_cached_by_fingerprint(tmp_path):
+    dataset = Dataset.from_list(_instances(20))
+    store = InstanceStore.from_dataset(dataset, cache_dir=tmp_path)
+    assert store.get("repo2__005")["FAIL_TO_PASS"] == ["test_5"]
+    assert [path.name for path in tmp_path.iterdir()] == [f"{dataset._fingerprint}.sqlite"]
+
+    with patch.object(InstanceStore, "build", side_effect=AssertionError("rebuilt")):
+        cached = InstanceStore.from_dataset(dataset, cache_dir=tmp_path)
+    assert cached.instance_ids() == store.instance_ids()
+
+    other = InstanceStore.from_dataset(Dataset.from_list(_instances(3)), cache_dir=tmp_path)
+    assert len(other) == 3
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_filter_instance_ids_on_store():
+    store = InstanceStore.build(_instances(10))
+    instance_ids = filter_instance_ids(store.instance_ids(), filter_spec=r"repo1__", slice_spec="1:")
+    assert instance_ids == ["repo1__004", "repo1__007"]
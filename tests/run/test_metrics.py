@@ -0,0 +1,173 @@
+import asyncio
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import aprocess_instance, main, process_instance
+from minisweagent.run.extra.utils.metrics import MetricsRenderer, format_histogram, format_metric
+from minisweagent.run.extra.utils.progress_events import ProgressEvent
+from minisweagent.run.extra.utils.run_manifest import SAVED, STARTING_ENV, RunManifest
+from minisweagent.utils.histogram import Histogram
+
+_COMMANDS = ["```bash\necho hello\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+
+
+def _parse(text: str) -> dict[str, float]:
+    """Samples by `name{labels}` (comments skipped)."""
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples
+
+
+@pytest.fixture
+def config():
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    return config
+
+
+def test_format_metric_escapes_labels():
+    lines = format_metric("m", "counter", "Help.", [({"exit_status": 'a "b"\\c\nd'}, 1), ({}, 0.5)])
+    assert lines == ["# HELP m Help.", "# TYPE m counter", 'm{exit_status="a \\"b\\"\\\\c\\nd"} 1', "m 0.5"]
+
+
+def test_format_histogram():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert format_histogram("h", "Help.", histogram)[2:] == [
+        'h_bucket{le="1"} 2',
+        'h_bucket{le="5"} 3',
+        'h_bucket{le="+Inf"} 4',
+        "h_sum 14.5",
+        "h_count 4",
+    ]
+
+
+def test_renderer_aggregates_events(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.queue(["a", "b", "c"])
+    manifest.start("a")
+    renderer = MetricsRenderer(3, manifest=manifest)
+    renderer.handle(
+        [
+            ProgressEvent("start", "a"),
+            ProgressEvent("start", "b"),
+            ProgressEvent("env_started", "a", {"seconds": 7.0}),
+            ProgressEvent("executed", "a", {"seconds": 0.2}),
+            ProgressEvent("executed", "a", {"seconds": 0.3}),
+            ProgressEvent("end", "a", {"exit_status": "Submitted"}),
+            ProgressEvent("requeued", "b", {"exit_status": "RuntimeError"}),
+        ]
+    )
+    samples = _parse(renderer.render())
+    assert samples["mswea_instances"] == 3
+    assert samples['mswea_instances_by_state{state="queued"}'] == 2
+    assert samples[f'mswea_instances_by_state{{state="{STARTING_ENV}"}}'] == 1
+    assert samples["mswea_instances_in_flight"] == 0
+    assert samples["mswea_instances_started_total"] == 2
+    assert samples["mswea_instances_requeued_total"] == 1
+    assert samples['mswea_instances_completed_total{exit_status="Submitted"}'] == 1
+    assert samples['mswea_env_start_seconds_bucket{le="5"}'] == 0
+    assert samples['mswea_env_start_seconds_bucket{le="10"}'] == 1
+    assert samples["mswea_env_execute_seconds_count"] == 2
+    assert samples["mswea_env_execute_seconds_sum"] == pytest.approx(0.5)
+    assert "mswea_model_cost_dollars_total" in samples
+    assert 'mswea_model_latency_seconds_bucket{le="+Inf"}' in samples
+
+
+def test_http_endpoint():
+    renderer = MetricsRenderer(1, port=0)
+    renderer.start()
+    try:
+        renderer.handle([ProgressEvent("start", "a")])
+        with urllib.request.urlopen(f"http://127.0.0.1:{renderer.port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert _parse(response.read().decode())["mswea_instances_in_flight"] == 1
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{renderer.port}/other")
+    finally:
+        renderer.close()
+
+
+def test_file_is_rewritten(tmp_path):
+    path = tmp_path / "metrics" / "run.prom"
+    renderer = MetricsRenderer(2, path=path, interval=3600)
+    renderer.handle([ProgressEvent("start", "a")])
+    assert _parse(path.read_text())["mswea_instances_in_flight"] == 1
+    renderer.handle([ProgressEvent("end", "a", {"exit_status": "Submitted"})])
+    assert _parse(path.read_text())["mswea_instances_in_flight"] == 1  # not yet rewritten
+    renderer.close()
+    assert _parse(path.read_text())["mswea_instances_in_flight"] == 0
+    assert list(path.parent.iterdir()) == [path]
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_process_instance_reports_timings(tmp_path, config, async_mode):
+    progress_manager = MagicMock()
+    instance = {"instance_id": "repo__repo-0", "problem_statement": "Task"}
+    with (
+        patch("minisweagent.run.extra.swebench.get_model", return_value=DeterministicModel(outputs=_COMMANDS)),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", return_value=LocalEnvironment(cwd=str(tmp_path))),
+    ):
+        if async_mode:
+            asyncio.run(aprocess_instance(instance, tmp_path / "output", config, progress_manager))
+        else:
+            process_instance(instance, tmp_path / "output", config, progress_manager)
+    progress_manager.on_env_started.assert_called_once()
+    assert progress_manager.on_action_executed.call_count == 2
+    assert all(c.args[0] == "repo__repo-0" and c.args[1] >= 0 for c in progress_manager.on_action_executed.mock_calls)
+
+
+def test_main_writes_metrics_file(tmp_path, config):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(config))
+    instances = [{"instance_id": f"repo__repo-{i}", "problem_statement": f"Task {i}"} for i in range(2)]
+    with (
+        patch("minisweagent.run.extra.swebench.load_dataset", return_value=instances),
+        patch(
+            "minisweagent.run.extra.swebench.get_model",
+            side_effect=lambda **kwargs: DeterministicModel(outputs=_COMMANDS),
+        ),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", return_value=LocalEnvironment(cwd=str(tmp_path))),
+    ):
+        main(
+            subset="_test",
+            split="test",
+            slice_spec="",
+            filter_spec="",
+            shuffle=False,
+            output=str(tmp_path / "output"),
+            workers=2,
+            min_workers=0,
+            async_mode=False,
+            model=None,
+            model_class=None,
+            redo_existing=False,
+            retry_failed=False,
+            resume=False,
+            stream_traj=False,
+            schedule_from="",
+            headless=True,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file=str(tmp_path / "run.prom"),
+            queue="",
+            config_spec=config_path,
+            environment_class=None,
+        )
+    samples = _parse((tmp_path / "run.prom").read_text())
+    assert samples[f'mswea_instances_by_state{{state="{SAVED}"}}'] == 2
+    assert samples['mswea_instances_completed_total{exit_status="Submitted"}'] == 2
+    assert samples["mswea_env_start_seconds_count"] == 2
+    assert samples["mswea_env_execute_seconds_count"] == 4
@@ -0,0 +1,95 @@
+import json
+import threading
+
+from minisweagent.run.extra.utils.preds_journal import PredsJournal, read_journals
+
+
+def _pred(instance_id: str, model: str = "model", patch: str = "patch") -> dict:
+    return {"model_name_or_path": model, "instance_id": instance_id, "model_patch": patch}
+
+
+def test_add_remove_and_compact(tmp_path):
+    journal = PredsJournal(tmp_path / "preds.jsonl")
+    journal.add("instance1", "model", "patch1")
+    journal.add("instance2", "model", "patch2")
+    journal.add("instance1", "new_model", "new_patch")
+    journal.remove("instance2")
+    journal.remove("nonexistent")
+    assert journal.instance_ids == {"instance1"}
+    assert not (tmp_path / "preds.json").exists()
+
+    journal.close()
+    assert json.loads((tmp_path / "preds.json").read_text()) == {
+        "instance1": _pred("instance1", "new_model", "new_patch")
+    }
+    assert len((tmp_path / "preds.jsonl").read_text().splitlines()) == 4
+
+
+def test_reopen_replays_journal(tmp_path):
+    journal = PredsJournal(tmp_path / "preds.jsonl")
+    journal.add("instance1", "model", "patch")
+    journal.add("instance2", "model", "patch")
+    journal.remove("instance1")
+    journal.close()
+    # Process killed while writing the last record
+    with (tmp_path / "preds.jsonl").open("a") as f:
+        f.write('{"model_name_or_path": "model", "instance')
+
+    journal = PredsJournal(tmp_path / "preds.jsonl")
+    assert journal.instance_ids == {"instance2"}
+    journal.add("instance3", "model", "patch")
+    journal.close()
+    assert PredsJournal(tmp_path / "preds.jsonl").instance_ids == {"instance2", "instance3"}
+
+
+def test_imports_legacy_preds_file(tmp_path):
+    existing = {"instance1": _pred("instance1", "old_model", "old_patch")}
+    (tmp_path / "preds.json").write_text(json.dumps(existing))
+    journal = PredsJournal(tmp_path / "preds.jsonl")
+    assert journal.get("instance1") == existing["instance1"]
+    journal.add("instance2", "model", "patch")
+    journal.close()
+    assert json.loads((tmp_path / "preds.json").read_text()) == existing | {"instance2": _pred("instance2")}
+
+
+def test_sync_batching(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr("minisweagent.run.extra.utils.preds_journal.os.fsync", synced.append)
+    journal = PredsJournal(tmp_path / "preds.jsonl", sync_every=3, sync_interval=3600)
+    for i in range(7):
+        journal.add(f"instance{i}", "model", "patch")
+    assert len(synced) == 2
+    # Records are flushed even when they are not synced yet
+    assert len((tmp_path / "preds.jsonl").read_text().splitlines()) == 7
+    journal.close()
+    assert len(synced) == 3
+
+
+def test_concurrent_adds(tmp_path):
+    journal = PredsJournal(tmp_path / "preds.jsonl")
+    threads = [
+        threading.Thread(target=lambda i=i: [journal.add(f"instance{i}_{j}", "model", "patch") for j in range(50)])
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    assert len(json.loads((tmp_path / "preds.json").read_text())) == 400
+    assert PredsJournal(tmp_path / "preds.jsonl").instance_ids == journal.instance_ids
+
+
+def test_read_journals_keeps_newest_record(tmp_path):
+    # a stale journal of an older run sorts after the journal of the newer run
+    old = PredsJournal(tmp_path / "preds.host-b.jsonl", import_legacy=False)
+    old.add("instance1", "model", "old")
+    old.add("instance2", "model", "old")
+    old.close()
+    new = PredsJournal(tmp_path / "preds.host-a.jsonl", import_legacy=False)
+    new.add("instance1", "model", "new")
+    new.add("instance2", "model", "new")
+    new.remove("instance2")
+    new.close(merge=True)
+    assert read_journals(tmp_path) == {"instance1": _pred("instance1", patch="new")}
+    assert json.loads((tmp_path / "preds.json").read_text()) == {"instance1": _pred("instance1", patch="new")}
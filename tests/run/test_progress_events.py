@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+from unittest.mock import MagicMock, call, patch
+
+import pytest
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import main
+from minisweagent.run.extra.utils.progress_events import (
+    JsonlRenderer,
+    LogRenderer,
+    ProgressEvent,
+    ProgressEventBus,
+    ProgressRenderer,
+    RichRenderer,
+)
+
+
+class RecordingRenderer(ProgressRenderer):
+    def __init__(self):
+        self.batches: list[list[ProgressEvent]] = []
+        self.started = self.closed = False
+
+    def start(self):
+        self.started = True
+
+    def handle(self, events):
+        self.batches.append(events)
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def events(self) -> list[ProgressEvent]:
+        return [e for batch in self.batches for e in batch]
+
+
+def test_renderer_without_handle_fails_when_created():
+    class IncompleteRenderer(ProgressRenderer):
+        def close(self):
+            pass
+
+    with pytest.raises(TypeError, match="handle"):
+        IncompleteRenderer()  # type: ignore[abstract]
+
+
+def test_bus_delivers_all_events_in_order():
+    renderer = RecordingRenderer()
+
+    def worker(i: int):
+        bus.on_instance_start(f"instance-{i}")
+        for step in range(50):
+            bus.update_instance_status(f"instance-{i}", f"Step {step}")
+        bus.on_instance_end(f"instance-{i}", "Submitted")
+
+    with ProgressEventBus([renderer], interval=0.01) as bus:
+        assert renderer.started
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bus.on_uncaught_exception("instance-8", ValueError())
+        bus.update_prefetch_status(pulled=1, pulling=2, total=3)
+    assert renderer.closed
+    assert len(renderer.events) == 8 * 52 + 2
+    for i in range(8):
+        events = [e for e in renderer.events if e.instance_id == f"instance-{i}"]
+        assert [e.event for e in events] == ["start", *["status"] * 50, "end"]
+        assert events[-2].data == {"message": "Step 49"}
+    assert renderer.events[-2].data == {"exit_status": "Uncaught ValueError"}
+    assert renderer.events[-1].data == {"pulled": 1, "pulling": 2, "total": 3}
+
+
+def test_failing_renderer_does_not_stop_others():
+    broken = RecordingRenderer()
+    broken.handle = MagicMock(side_effect=RuntimeError("broken"))
+    renderer = RecordingRenderer()
+    with ProgressEventBus([broken, renderer], interval=0.01) as bus:
+        bus.on_instance_start("a")
+    assert [e.event for e in renderer.events] == ["start"]
+
+
+def test_rich_renderer_applies_last_status_only():
+    manager = MagicMock()
+    RichRenderer(manager).handle(
+        [
+            ProgressEvent("start", "a"),
+            ProgressEvent("status", "a", {"message": "Step 1"}),
+            ProgressEvent("status", "a", {"message": "Step 2"}),
+            ProgressEvent("requeued", "b", {"exit_status": "RuntimeError"}),
+            ProgressEvent("end", "a", {"exit_status": "Submitted"}),
+        ]
+    )
+    assert manager.mock_calls == [
+        call.on_instance_start("a"),
+        call.update_instance_status("a", "Step 2"),
+        call.on_instance_requeued("b", "RuntimeError"),
+        call.on_instance_end("a", "Submitted"),
+    ]
+
+
+def test_log_renderer(caplog):
+    renderer = LogRenderer(4, interval=3600)
+    with caplog.at_level(logging.INFO, logger="minisweagent.progress"):
+        renderer.handle([ProgressEvent("start", "a"), ProgressEvent("start", "b"), ProgressEvent("start", "c")])
+        renderer.handle([ProgressEvent("end", "a", {"exit_status": "Submitted"})])
+        renderer.handle([ProgressEvent("requeued", "b", {"exit_status": "RuntimeError"})])
+        assert not caplog.records
+        renderer.close()
+    assert "1/4 instances done, 1 running, 1 requeued" in caplog.text
+    assert "{'Submitted': 1}" in caplog.text
+
+
+def test_jsonl_renderer(tmp_path):
+    renderer = JsonlRenderer(tmp_path / "progress.jsonl")
+    renderer.handle([ProgressEvent("start", "a", time=1.0), ProgressEvent("end", "a", {"exit_status": "Submitted"})])
+    renderer.close()
+    lines = [json.loads(line) for line in (tmp_path / "progress.jsonl").read_text().splitlines()]
+    assert lines[0] == {"event": "start", "instance_id": "a", "data": {}, "time": 1.0}
+    assert lines[1]["data"] == {"exit_status": "Submitted"}
+
+
+def test_main_headless(tmp_path):
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(config))
+    instances = [{"instance_id": f"repo__repo-{i}", "problem_statement": f"Task {i}"} for i in range(3)]
+    outputs = ["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+    with (
+        patch("minisweagent.run.extra.swebench.load_dataset", return_value=instances),
+        patch(
+            "minisweagent.run.extra.swebench.get_model",
+            side_effect=lambda **kwargs: DeterministicModel(outputs=outputs),
+        ),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", return_value=LocalEnvironment(cwd=str(tmp_path))),
+        patch("minisweagent.run.extra.swebench.RichRenderer") as rich_renderer,
+    ):
+        main(
+            subset="_test",
+            split="test",
+            slice_spec="",
+            filter_spec="",
+            shuffle=False,
+            output=str(tmp_path / "output"),
+            workers=2,
+            min_workers=0,
+            async_mode=False,
+            model=None,
+            model_class=None,
+            redo_existing=False,
+            retry_failed=False,
+            resume=False,
+            stream_traj=False,
+            schedule_from="",
+            headless=True,
+            progress_jsonl=str(tmp_path / "progress.jsonl"),
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            queue="",
+            config_spec=config_path,
+            environment_class=None,
+        )
+    rich_renderer.assert_not_called()
+    events = [json.loads(line) for line in (tmp_path / "progress.jsonl").read_text().splitlines()]
+    assert sorted(e["instance_id"] for e in events if e["event"] == "end") == [i["instance_id"] for i in instances]
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+from collections import Counter
+from unittest.mock import ANY, MagicMock, call, patch
+
+import pytest
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import aprocess_instance, aprocess_instances, main, process_instance, process_queue
+from minisweagent.run.extra.utils.preds_journal import PredsJournal, read_journals
+from minisweagent.run.extra.utils.requeue import RequeuePolicy
+from minisweagent.run.extra.utils.run_manifest import FAILED_AGENT, FAILED_INFRA, QUEUED, SAVED, RunManifest
+from minisweagent.run.extra.utils.work_queue import WorkQueue
+
+_SUBMIT = "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"
+
+
+def _instances(n: int) -> list[dict]:
+    return [{"instance_id": f"repo__repo-{i}", "problem_statement": f"Task {i}"} for i in range(n)]
+
+
+@pytest.fixture
+def config():
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    config["run"] = {"requeue": {"base_delay": 0.05, "jitter": 0}}
+    return config
+
+
+class FlakyEnvironments:
+    """`get_sb_environment` that fails the first `n_failures` times for every instance."""
+
+    def __init__(self, tmp_path, n_failures: int):
+        self.tmp_path = tmp_path
+        self.n_failures = n_failures
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, config, instance):
+        with self._lock:
+            self.calls[instance["instance_id"]] += 1
+            n_calls = self.calls[instance["instance_id"]]
+        if n_calls <= self.n_failures:
+            raise RuntimeError(f"docker run timed out (attempt {n_calls})")
+        return LocalEnvironment(cwd=str(self.tmp_path))
+
+
+@pytest.fixture
+def get_model():
+    with patch(
+        "minisweagent.run.extra.swebench.get_model", side_effect=lambda **kwargs: DeterministicModel(outputs=[_SUBMIT])
+    ):
+        yield
+
+
+def test_policy():
+    policy = RequeuePolicy(max_attempts=4, base_delay=10, max_delay=25, jitter=0)
+    assert [policy.delay(n) for n in range(1, 5)] == [10, 20, 25, None]
+    assert RequeuePolicy(max_attempts=1).delay(1) is None
+    assert 9 <= RequeuePolicy(base_delay=10, jitter=0.1).delay(1) <= 10
+
+
+def test_manifest_records_requeues(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.sqlite", worker_id="host")
+    manifest.queue(["a"])
+    manifest.start("a")
+    assert manifest.record_infra_failure("a") == 1
+    manifest.requeue("a", reason="RuntimeError: pull failed", delay=30)
+    manifest.start("a")
+    assert manifest.record_infra_failure("a") == 2
+    manifest.finish("a", FAILED_INFRA, exit_status="RuntimeError")
+    assert [(r["attempt"], r["worker"], r["reason"], r["delay"]) for r in manifest.requeues()] == [
+        (1, "host", "RuntimeError: pull failed", 30)
+    ]
+    assert manifest.summary()["requeues"] == {"a": 1}
+    manifest.queue(["a"])  # a new run starts over
+    manifest.start("a")
+    assert manifest.record_infra_failure("a") == 1
+
+
+def test_process_instance_requeues_infra_failure(tmp_path, config, get_model):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    journal = PredsJournal(tmp_path / "output" / "preds.jsonl")
+    progress_manager = MagicMock()
+    policy = RequeuePolicy(max_attempts=2, base_delay=30, jitter=0)
+    instance = _instances(1)[0]
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=FlakyEnvironments(tmp_path, 2)):
+        kwargs = {"preds_journal": journal, "manifest": manifest, "requeue_policy": policy}
+        kwargs["image_prefetcher"] = image_prefetcher = MagicMock()
+        assert process_instance(instance, tmp_path / "output", config, progress_manager, **kwargs) == 30
+        assert manifest.get("repo__repo-0")["state"] == QUEUED
+        assert journal.instance_ids == set()
+        progress_manager.on_instance_requeued.assert_called_once_with("repo__repo-0", "RuntimeError")
+        progress_manager.on_instance_end.assert_not_called()
+
+        # the second failure reaches the attempt cap
+        assert process_instance(instance, tmp_path / "output", config, progress_manager, **kwargs) is None
+    # the image is only released for good when the instance isn't retried anymore
+    assert image_prefetcher.release.call_args_list == [call(ANY, requeued=True), call(ANY, requeued=False)]
+    row = manifest.get("repo__repo-0")
+    assert (row["state"], row["attempts"]) == (FAILED_INFRA, 2)
+    assert journal.instance_ids == {"repo__repo-0"}
+    progress_manager.on_instance_end.assert_called_once_with("repo__repo-0", "RuntimeError")
+    assert "attempt 1" in manifest.requeues()[0]["reason"]
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_agent_config_error_is_not_requeued(tmp_path, config, get_model, async_mode):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.queue(["repo__repo-0"])
+    policy = RequeuePolicy(max_attempts=3, base_delay=30, jitter=0)
+    del config["agent"]["timeout_template"]  # the agent config is invalid
+    environments = FlakyEnvironments(tmp_path, 0)
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments):
+        kwargs = {"manifest": manifest, "requeue_policy": policy}
+        if async_mode:
+            retry_delay = asyncio.run(
+                aprocess_instance(_instances(1)[0], tmp_path / "output", config, MagicMock(), **kwargs)
+            )
+        else:
+            retry_delay = process_instance(_instances(1)[0], tmp_path / "output", config, MagicMock(), **kwargs)
+    assert retry_delay is None
+    row = manifest.get("repo__repo-0")
+    assert (row["state"], row["exit_status"]) == (FAILED_AGENT, "ValidationError")
+    assert manifest.requeues() == []
+
+
+def test_async_requeue(tmp_path, config, get_model):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    environments = FlakyEnvironments(tmp_path, 1)
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments):
+        asyncio.run(
+            aprocess_instances(
+                _instances(3),
+                tmp_path / "output",
+                config,
+                MagicMock(),
+                workers=2,
+                manifest=manifest,
+                requeue_policy=RequeuePolicy(**config["run"]["requeue"]),
+            )
+        )
+    assert environments.calls == {f"repo__repo-{i}": 2 for i in range(3)}
+    assert manifest.counts() == {SAVED: 3}
+    assert len(manifest.requeues()) == 3
+
+
+def test_queue_requeue(tmp_path, config, get_model):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(_instances(2))
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    environments = FlakyEnvironments(tmp_path, 1)
+    with patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments):
+        process_queue(
+            queue,
+            tmp_path / "output",
+            config,
+            MagicMock(),
+            manifest=manifest,
+            requeue_policy=RequeuePolicy(**config["run"]["requeue"]),
+        )
+    assert environments.calls == {"repo__repo-0": 2, "repo__repo-1": 2}
+    assert queue.counts() == {"done": 2}
+    assert queue.wait_time() is None
+    assert manifest.counts() == {SAVED: 2}
+
+
+def test_work_queue_retry_delay(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(_instances(1))
+    queue.complete(queue.claim()["instance_id"], retry_delay=60)
+    assert queue.claim() is None
+    assert 55 < queue.wait_time() <= 60
+    assert queue.counts() == {"pending": 1}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_main_requeues_in_thread_mode(tmp_path, config, get_model, workers):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump(config))
+    environments = FlakyEnvironments(tmp_path, 1)
+    with (
+        patch("minisweagent.run.extra.swebench.load_dataset", return_value=_instances(3)),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=environments),
+    ):
+        main(
+            subset="_test",
+            split="test",
+            slice_spec="",
+            filter_spec="",
+            shuffle=False,
+            output=str(tmp_path / "output"),
+            workers=workers,
+            min_workers=0,
+            async_mode=False,
+            model=None,
+            model_class=None,
+            redo_existing=False,
+            retry_failed=False,
+            resume=False,
+            stream_traj=False,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            queue="",
+            config_spec=config_path,
+            environment_class=None,
+        )
+    assert environments.calls == {f"repo__repo-{i}": 2 for i in range(3)}
+    assert set(read_journals(tmp_path / "output")) == {f"repo__repo-{i}" for i in range(3)}
+    assert RunManifest(tmp_path / "output" / "manifest.sqlite").counts() == {SAVED: 3}
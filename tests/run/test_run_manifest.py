@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import process_instance
+from minisweagent.run.extra.utils.run_manifest import (
+    FAILED_AGENT,
+    FAILED_INFRA,
+    FAILED_STATES,
+    QUEUED,
+    RUNNING,
+    SAVED,
+    STARTING_ENV,
+    RunManifest,
+)
+
+
+def test_lifecycle(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.sqlite", worker_id="host")
+    manifest.queue(["a", "b"])
+    assert manifest.states() == {"a": QUEUED, "b": QUEUED}
+    manifest.start("a")
+    assert manifest.get("a")["state"] == STARTING_ENV
+    manifest.env_ready("a")
+    assert manifest.get("a")["state"] == RUNNING
+    manifest.finish("a", SAVED, exit_status="Submitted", cost=1.5, n_steps=3)
+    row = manifest.get("a")
+    assert row["state"] == SAVED
+    assert (row["attempts"], row["worker"], row["exit_status"], row["cost"], row["n_steps"]) == (
+        1,
+        "host",
+        "Submitted",
+        1.5,
+        3,
+    )
+    assert row["queued_at"] <= row["started_at"] <= row["env_ready_at"] <= row["finished_at"]
+    assert manifest.get("c") is None
+    with pytest.raises(ValueError, match="Not a finished state"):
+        manifest.finish("b", RUNNING, exit_status=None)
+
+
+def test_retry_counts_attempts(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.start("a")
+    manifest.finish("a", FAILED_INFRA, exit_status="RuntimeError")
+    assert manifest.instance_ids(FAILED_STATES) == {"a"}
+    manifest.queue(["a"])
+    manifest.start("a")
+    row = manifest.get("a")
+    assert (row["state"], row["attempts"], row["exit_status"]) == (STARTING_ENV, 2, None)
+
+
+def test_queue_keeps_running_instances(tmp_path):
+    """Another run (sharing the output directory) processes `a`, queueing it again must not reset it."""
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.start("a")
+    manifest.queue(["a", "b"])
+    assert manifest.states() == {"a": STARTING_ENV, "b": QUEUED}
+
+
+def test_summary(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    manifest.queue(["a", "b", "c", "d"])
+    for instance_id, state, exit_status in [
+        ("a", SAVED, "Submitted"),
+        ("b", SAVED, "Submitted"),
+        ("c", FAILED_AGENT, "ValueError"),
+    ]:
+        manifest.start(instance_id)
+        manifest.env_ready(instance_id)
+        manifest.finish(instance_id, state, exit_status=exit_status, cost=1.0)
+    summary = manifest.summary()
+    assert summary["states"] == {SAVED: 2, FAILED_AGENT: 1, QUEUED: 1}
+    assert summary["exit_statuses"] == {"Submitted": 2, "ValueError": 1}
+    assert (summary["n_finished"], summary["attempts"], summary["cost"]) == (3, 3, 3.0)
+    assert summary["mean_agent_time"] >= 0
+
+
+@pytest.fixture
+def config():
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    return config
+
+
+def _run(tmp_path, config, manifest, *, outputs, env_error=None):
+    def get_sb_environment(config, instance):
+        if env_error is not None:
+            raise env_error
+        return LocalEnvironment(cwd=str(tmp_path))
+
+    with (
+        patch("minisweagent.run.extra.swebench.get_model", return_value=DeterministicModel(outputs=outputs)),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=get_sb_environment),
+    ):
+        instance = {"instance_id": "repo__repo-1", "problem_statement": "Task"}
+        process_instance(instance, tmp_path / "output", config, MagicMock(), manifest=manifest)
+    return manifest.get("repo__repo-1")
+
+
+def test_process_instance_saved(tmp_path, config):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    row = _run(tmp_path, config, manifest, outputs=["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"])
+    assert (row["state"], row["exit_status"], row["n_steps"]) == (SAVED, "Submitted", 1)
+    assert row["env_ready_at"] is not None
+
+
+def test_process_instance_failed_infra(tmp_path, config):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    row = _run(tmp_path, config, manifest, outputs=[], env_error=RuntimeError("Failed to pull image"))
+    assert (row["state"], row["exit_status"], row["env_ready_at"]) == (FAILED_INFRA, "RuntimeError", None)
+
+
+def test_process_instance_failed_agent(tmp_path, config):
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    row = _run(tmp_path, config, manifest, outputs=[])  # the model runs out of outputs
+    assert row["state"] == FAILED_AGENT
+    assert row["env_ready_at"] is not None
@@ -5,7 +5,7 @@ from pathlib import Path
 from minisweagent.agents.default import DefaultAgent
 from minisweagent.environments.local import LocalEnvironment
 from minisweagent.models.test_models import DeterministicModel
-from minisweagent.run.utils.save import save_traj
+from minisweagent.run.utils.save import TrajectoryWriter, load_traj, save_traj
 
 
 def test_save_traj_includes_class_names():
@@ -80,3 +80,52 @@ def test_save_traj_with_none_agent():
 
         # Verify config is not present when agent is None
         assert "config" not in saved_data["info"]
+
+
+def test_streamed_trajectory(tmp_path):
+    """The streamed trajectory consolidates into the same data as the trajectory saved at the end."""
+    import yaml
+
+    config = yaml.safe_load(Path("src/minisweagent/config/default.yaml").read_text())["agent"]
+    agent = DefaultAgent(
+        DeterministicModel(
+            outputs=["```bash\necho hello\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+        ),
+        LocalEnvironment(),
+        **config,
+    )
+    agent.trajectory_writer = TrajectoryWriter(tmp_path / "run.traj.jsonl", instance_id="test-1")
+    exit_status, result = agent.run("Say hello")
+
+    # All messages are on disk before the run is saved
+    streamed = load_traj(tmp_path / "run.traj.jsonl")
+    assert streamed["messages"] == agent.messages
+    assert streamed["info"]["exit_status"] is None
+
+    save_traj(agent, tmp_path / "run.traj.jsonl", exit_status=exit_status, result=result, print_path=False)
+    save_traj(agent, tmp_path / "run.traj.json", exit_status=exit_status, result=result, print_path=False)
+    streamed = load_traj(tmp_path / "run.traj.jsonl")
+    assert streamed == json.loads((tmp_path / "run.traj.json").read_text()) | {"instance_id": "test-1"}
+    assert streamed["info"]["exit_status"] == "Submitted"
+    assert streamed["trajectory_format"] == "mini-swe-agent-1"
+
+
+def test_load_traj_of_killed_run(tmp_path):
+    """A partially written last record (process killed while writing) is ignored."""
+    path = tmp_path / "run.traj.jsonl"
+    writer = TrajectoryWriter(path)
+    writer.add_message({"role": "system", "content": "system"})
+    writer.add_message({"role": "user", "content": "task"})
+    with path.open("a") as f:
+        f.write('{"type": "message", "message": {"role": "assis')
+    traj = load_traj(path)
+    assert [m["role"] for m in traj["messages"]] == ["system", "user"]
+    assert traj["info"]["exit_status"] is None
+
+
+def test_save_traj_streamed_with_none_agent(tmp_path):
+    path = tmp_path / "run.traj.jsonl"
+    save_traj(None, path, exit_status="RuntimeError", result="no agent", print_path=False)
+    traj = load_traj(path)
+    assert traj["messages"] == []
+    assert traj["info"]["exit_status"] == "RuntimeError"
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+import yaml
+
+from minisweagent.run.extra.utils.scheduling import (
+    DurationEstimates,
+    Schedule,
+    get_repo,
+    predict_makespan,
+    read_durations,
+)
+
+
+def _write_traj(output_dir, instance_id, info, *, streamed=False):
+    instance_dir = output_dir / instance_id
+    instance_dir.mkdir(parents=True)
+    if streamed:
+        lines = [{"type": "header"}, {"type": "message", "content": "x" * 100_000}, {"type": "footer", "info": info}]
+        (instance_dir / f"{instance_id}.traj.jsonl").write_text("".join(json.dumps(line) + "\n" for line in lines))
+    else:
+        (instance_dir / f"{instance_id}.traj.json").write_text(json.dumps({"info": info, "messages": []}))
+
+
+def test_get_repo():
+    assert get_repo({"instance_id": "django__django-11099"}) == "django__django"
+    assert get_repo({"instance_id": "django__django-11099", "repo": "django/django"}) == "django__django"
+
+
+def test_read_durations(tmp_path):
+    _write_traj(tmp_path, "a__a-1", {"instance_time": 100.0, "model_stats": {"api_calls": 10, "step_time": 80.0}})
+    _write_traj(tmp_path, "a__a-2", {"model_stats": {"api_calls": 5, "step_time": 40.0}}, streamed=True)
+    _write_traj(tmp_path, "b__b-1", {"model_stats": {"api_calls": 20}})
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "broken.traj.json").write_text("{")
+    assert read_durations(tmp_path) == {
+        "a__a-1": {"time": 100.0, "steps": 10},
+        "a__a-2": {"time": 40.0, "steps": 5},
+        "b__b-1": {"time": None, "steps": 20},
+    }
+
+
+def test_streamed_trajectory_without_footer(tmp_path):
+    instance_dir = tmp_path / "a__a-1"
+    instance_dir.mkdir()
+    (instance_dir / "a__a-1.traj.jsonl").write_text(json.dumps({"type": "header"}) + "\n")
+    assert read_durations(tmp_path) == {}
+
+
+def test_estimates():
+    estimates = DurationEstimates(
+        {
+            "a__a-1": {"time": 100.0, "steps": 10},
+            "a__a-2": {"time": 300.0, "steps": 10},
+            "b__b-1": {"time": None, "steps": 5},  # 5 steps * 20 s/step (average over a__a)
+            "c__c-1": {"time": None, "steps": 0},
+        }
+    )
+    assert estimates.predict({"instance_id": "a__a-2"}) == (300.0, "history")
+    assert estimates.predict({"instance_id": "b__b-1"}) == (100.0, "history")
+    assert estimates.predict({"instance_id": "a__a-3"}) == (200.0, "repo")
+    assert estimates.predict({"instance_id": "c__c-1"}) == (pytest.approx(500 / 3), "global")
+    assert DurationEstimates({}).predict({"instance_id": "a__a-1"}) == (0.0, "global")
+
+
+def test_estimates_for_instances_with_repo_field():
+    estimates = DurationEstimates(
+        {"django__django-1": {"time": 100.0, "steps": 10}, "sympy__sympy-1": {"time": 10.0, "steps": 1}}
+    )
+    instance = {"instance_id": "django__django-2", "repo": "django/django"}  # like the rows of SWE-bench
+    assert estimates.predict(instance) == (100.0, "repo")
+
+
+def test_predict_makespan():
+    assert predict_makespan([], 2) == 0.0
+    assert predict_makespan([5, 1, 1, 1, 1, 1], 2) == 5
+    assert predict_makespan([1, 1, 1, 1, 1, 5], 2) == 7
+
+
+def test_schedule_longest_first(tmp_path):
+    estimates = DurationEstimates({"a__a-1": {"time": 10.0, "steps": 1}, "b__b-1": {"time": 500.0, "steps": 1}})
+    instances = [{"instance_id": i} for i in ["a__a-1", "a__a-2", "c__c-1", "b__b-1", "b__b-2"]]
+    schedule = Schedule(instances, estimates, workers=2)
+    assert [i["instance_id"] for i in schedule.instances] == ["b__b-1", "b__b-2", "c__c-1", "a__a-1", "a__a-2"]
+    assert schedule.predicted_makespan == 755.0
+
+    _write_traj(tmp_path, "b__b-1", {"instance_time": 400.0, "model_stats": {"api_calls": 1}})
+    _write_traj(tmp_path, "other", {"instance_time": 1.0, "model_stats": {"api_calls": 1}})
+    report = schedule.report(tmp_path)
+    assert report["mean_absolute_error"] == 100.0
+    assert report["instances"]["b__b-1"] == {"predicted": 500.0, "actual": 400.0}
+    assert report["instances"]["a__a-2"]["actual"] is None
+    assert "other" not in report["instances"]
+    assert yaml.safe_load((tmp_path / "schedule_report.yaml").read_text()) == report
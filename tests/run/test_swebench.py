@@ -10,8 +10,6 @@ from minisweagent.run.extra.swebench import (
     filter_instances,
     get_swebench_docker_image_name,
     main,
-    remove_from_preds_file,
-    update_preds_file,
 )
 
 _REPO_ROOT = __import__("pathlib").Path(__file__).resolve().parents[2]
@@ -77,6 +75,18 @@ def test_swebench_end_to_end(github_test_data, tmp_path, workers):
             workers=workers,
             filter_spec="swe-agent__test-repo-1",
             config_spec=_CONFIG_PATH,
+            stream_traj=False,
+            resume=False,
+            async_mode=False,
+            min_workers=0,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            retry_failed=False,
+            queue="",
             environment_class="docker",
         )
 
@@ -104,6 +114,66 @@ def test_swebench_end_to_end(github_test_data, tmp_path, workers):
     assert output_trajectory["messages"][-1]["content"] == last_message
 
 
+class DummyEnvironmentConfig(BaseModel):
+    pass
+
+
+class AsyncDummyEnvironment(DummyEnvironment):
+    def __init__(self, outputs: list[str]):
+        super().__init__(outputs)
+        self.config = DummyEnvironmentConfig()
+
+    async def aexecute(self, command: str, cwd: str = "") -> dict[str, object]:
+        return self.execute(command, cwd)
+
+
+@pytest.mark.slow
+def test_swebench_end_to_end_async(github_test_data, tmp_path):
+    """Test the SWEBench flow with --async (agents as coroutines on one event loop)."""
+    model_responses = github_test_data["model_responses"]
+    instances = [{"instance_id": f"swe-agent__test-repo-{i}", "problem_statement": "Test problem"} for i in range(5)]
+
+    with (
+        patch(
+            "minisweagent.run.extra.swebench.get_model",
+            side_effect=lambda **kwargs: DeterministicModel(outputs=model_responses, cost_per_call=0.1),
+        ),
+        patch("minisweagent.run.extra.swebench.load_dataset", return_value=instances),
+        patch(
+            "minisweagent.run.extra.swebench.get_sb_environment",
+            side_effect=lambda *args, **kwargs: AsyncDummyEnvironment(
+                _dummy_env_outputs(model_responses, _expected_submission_from_fixture())
+            ),
+        ),
+    ):
+        main(
+            subset="_test",
+            split="test",
+            slice_spec="",
+            output=str(tmp_path),
+            workers=3,
+            filter_spec="",
+            config_spec=_REPO_ROOT / "src" / "minisweagent" / "config" / "extra" / "swebench.yaml",
+            stream_traj=False,
+            resume=False,
+            min_workers=0,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            retry_failed=False,
+            queue="",
+            environment_class="docker",
+            async_mode=True,
+        )
+
+    preds = json.loads((tmp_path / "preds.json").read_text())
+    assert sorted(preds) == sorted(instance["instance_id"] for instance in instances)
+    assert all(pred["model_patch"] == _expected_submission_from_fixture() for pred in preds.values())
+
+
 def test_get_image_name_with_existing_image_name():
     """Test get_image_name when image_name is already provided"""
     instance = {"image_name": "custom/image:tag", "instance_id": "test__repo__1"}
@@ -214,129 +284,6 @@ def test_filter_instances_no_matches():
     assert result == []
 
 
-def test_update_preds_file_new_file(tmp_path):
-    """Test update_preds_file when output file doesn't exist"""
-    output_path = tmp_path / "preds.json"
-    update_preds_file(output_path, "test__instance__1", "test_model", "test_result")
-
-    assert output_path.exists()
-    result = json.loads(output_path.read_text())
-    expected = {
-        "test__instance__1": {
-            "model_name_or_path": "test_model",
-            "instance_id": "test__instance__1",
-            "model_patch": "test_result",
-        }
-    }
-    assert result == expected
-
-
-def test_update_preds_file_existing_file(tmp_path):
-    """Test update_preds_file when output file already exists"""
-    output_path = tmp_path / "preds.json"
-
-    # Create initial file with one instance
-    initial_data = {
-        "existing__instance": {
-            "model_name_or_path": "old_model",
-            "instance_id": "existing__instance",
-            "model_patch": "old_result",
-        }
-    }
-    output_path.write_text(json.dumps(initial_data))
-
-    # Add new instance
-    update_preds_file(output_path, "new__instance", "new_model", "new_result")
-
-    result = json.loads(output_path.read_text())
-    expected = {
-        "existing__instance": {
-            "model_name_or_path": "old_model",
-            "instance_id": "existing__instance",
-            "model_patch": "old_result",
-        },
-        "new__instance": {
-            "model_name_or_path": "new_model",
-            "instance_id": "new__instance",
-            "model_patch": "new_result",
-        },
-    }
-    assert result == expected
-
-
-def test_update_preds_file_overwrite_existing(tmp_path):
-    """Test update_preds_file overwrites existing instance"""
-    output_path = tmp_path / "preds.json"
-
-    # Create initial file
-    initial_data = {
-        "test__instance": {
-            "model_name_or_path": "old_model",
-            "instance_id": "test__instance",
-            "model_patch": "old_result",
-        }
-    }
-    output_path.write_text(json.dumps(initial_data))
-
-    # Update existing instance
-    update_preds_file(output_path, "test__instance", "new_model", "new_result")
-
-    result = json.loads(output_path.read_text())
-    expected = {
-        "test__instance": {
-            "model_name_or_path": "new_model",
-            "instance_id": "test__instance",
-            "model_patch": "new_result",
-        }
-    }
-    assert result == expected
-
-
-def test_remove_from_preds_file_existing(tmp_path):
-    """Test remove_from_preds_file removes existing instance"""
-    output_path = tmp_path / "preds.json"
-
-    # Create file with multiple instances
-    initial_data = {
-        "instance1": {"model_name_or_path": "model1", "instance_id": "instance1", "model_patch": "result1"},
-        "instance2": {"model_name_or_path": "model2", "instance_id": "instance2", "model_patch": "result2"},
-    }
-    output_path.write_text(json.dumps(initial_data))
-
-    # Remove one instance
-    remove_from_preds_file(output_path, "instance1")
-
-    result = json.loads(output_path.read_text())
-    expected = {"instance2": {"model_name_or_path": "model2", "instance_id": "instance2", "model_patch": "result2"}}
-    assert result == expected
-
-
-def test_remove_from_preds_file_nonexistent_instance(tmp_path):
-    """Test remove_from_preds_file with nonexistent instance"""
-    output_path = tmp_path / "preds.json"
-
-    initial_data = {"instance1": {"model_name_or_path": "model1", "instance_id": "instance1", "model_patch": "result1"}}
-    output_path.write_text(json.dumps(initial_data))
-
-    # Try to remove nonexistent instance
-    remove_from_preds_file(output_path, "nonexistent")
-
-    # File should be unchanged
-    result = json.loads(output_path.read_text())
-    assert result == initial_data
-
-
-def test_remove_from_preds_file_no_file(tmp_path):
-    """Test remove_from_preds_file when file doesn't exist"""
-    output_path = tmp_path / "preds.json"
-
-    # Should not raise an error
-    remove_from_preds_file(output_path, "any_instance")
-
-    # File should still not exist
-    assert not output_path.exists()
-
-
 @pytest.mark.slow
 def test_redo_existing_false_skips_existing(github_test_data, tmp_path):
     """Test that redo_existing=False skips instances that already have results"""
@@ -374,6 +321,18 @@ def test_redo_existing_false_skips_existing(github_test_data, tmp_path):
             filter_spec="swe-agent__test-repo-1",
             redo_existing=False,
             config_spec=_CONFIG_PATH,
+            stream_traj=False,
+            resume=False,
+            async_mode=False,
+            min_workers=0,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            retry_failed=False,
+            queue="",
         )
 
     # Should still have the original result
@@ -418,6 +377,18 @@ def test_redo_existing_true_overwrites_existing(github_test_data, tmp_path):
             filter_spec="swe-agent__test-repo-1",
             redo_existing=True,
             config_spec=_CONFIG_PATH,
+            stream_traj=False,
+            resume=False,
+            async_mode=False,
+            min_workers=0,
+            schedule_from="",
+            headless=False,
+            progress_jsonl="",
+            attempts=1,
+            metrics_port=0,
+            metrics_file="",
+            retry_failed=False,
+            queue="",
             environment_class="docker",
         )
 
@@ -476,6 +447,18 @@ def test_exception_handling_in_agent_run(tmp_path, workers):
                 workers=workers,
                 filter_spec="swe-agent__test-repo-1",
                 config_spec=_CONFIG_PATH,
+                stream_traj=False,
+                resume=False,
+                async_mode=False,
+                min_workers=0,
+                schedule_from="",
+                headless=False,
+                progress_jsonl="",
+                attempts=1,
+                metrics_port=0,
+                metrics_file="",
+                retry_failed=False,
+                queue="",
                 environment_class="docker",
             )
 
@@ -522,6 +505,18 @@ def test_different_exception_types(tmp_path, workers):
                 workers=workers,
                 filter_spec="swe-agent__test-repo-1",
                 config_spec=_CONFIG_PATH,
+                stream_traj=False,
+                resume=False,
+                async_mode=False,
+                min_workers=0,
+                schedule_from="",
+                headless=False,
+                progress_jsonl="",
+                attempts=1,
+                metrics_port=0,
+                metrics_file="",
+                retry_failed=False,
+                queue="",
                 environment_class="docker",
             )
 
@@ -556,6 +551,18 @@ def test_exception_handling_with_progress_manager(tmp_path):
                 workers=2,  # Use multithreaded to test progress manager
                 filter_spec="swe-agent__test-repo-1",
                 config_spec=_CONFIG_PATH,
+                stream_traj=False,
+                resume=False,
+                async_mode=False,
+                min_workers=0,
+                schedule_from="",
+                headless=False,
+                progress_jsonl="",
+                attempts=1,
+                metrics_port=0,
+                metrics_file="",
+                retry_failed=False,
+                queue="",
                 environment_class="docker",
             )
 
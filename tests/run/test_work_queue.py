@@ -0,0 +1,165 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+
+from minisweagent.config import builtin_config_dir
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.extra.swebench import process_queue
+from minisweagent.run.extra.utils.preds_journal import PredsJournal, read_journals
+from minisweagent.run.extra.utils.work_queue import WorkQueue
+
+
+def _instances(n: int) -> list[dict]:
+    return [{"instance_id": f"instance-{i}", "problem_statement": f"Task {i}"} for i in range(n)]
+
+
+def test_claim_in_order(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", worker_id="a")
+    assert queue.add(_instances(3)) == 3
+    assert queue.add(_instances(4)) == 1  # other hosts add the same instances
+    assert [queue.claim()["instance_id"] for _ in range(4)] == [f"instance-{i}" for i in range(4)]
+    assert queue.claim() is None
+    queue.complete("instance-0")
+    assert queue.counts() == {"done": 1, "running": 3}
+    queue.close()
+
+
+def test_completed_instances_are_not_added_again(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(_instances(1))
+    queue.complete(queue.claim()["instance_id"])
+    assert queue.add(_instances(1)) == 0
+    assert queue.claim() is None
+
+
+def test_stale_lease_is_reclaimed(tmp_path):
+    dead = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.2, worker_id="dead")
+    dead.add(_instances(1))
+    assert dead.claim() is not None
+    dead.close()  # no more heartbeats
+
+    alive = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.2, worker_id="alive")
+    assert alive.claim() is None
+    time.sleep(0.3)
+    assert alive.claim()["instance_id"] == "instance-0"
+    alive.close()
+
+
+def test_complete_after_lost_lease(tmp_path):
+    slow = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.2, worker_id="slow")
+    slow.add(_instances(1))
+    assert slow.claim() is not None
+    slow.close()  # e.g., the heartbeat was stalled
+    time.sleep(0.3)
+    other = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=10, worker_id="other")
+    assert other.claim()["instance_id"] == "instance-0"
+    assert slow.complete("instance-0") is False
+    assert slow.complete("instance-0", retry_delay=0) is False
+    assert other.counts() == {"running": 1}
+    assert other.complete("instance-0") is True
+    assert other.counts() == {"done": 1}
+    other.close()
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    busy = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.3, worker_id="busy")
+    busy.add(_instances(1))
+    assert busy.claim() is not None
+    other = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.3, worker_id="other")
+    time.sleep(0.6)
+    assert other.claim() is None
+    busy.close()
+    other.close()
+
+
+def test_stop(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite")
+    queue.add(_instances(2))
+    queue.stop()
+    assert queue.claim() is None
+    assert queue.counts() == {"pending": 2}
+
+
+@pytest.mark.parametrize("n_hosts", [1, 3])
+def test_hosts_share_queue(tmp_path, n_hosts):
+    """Several runs (each with its own queue connection, journal and worker threads) process every instance once."""
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    output_dir = tmp_path / "output"
+    processed = []
+
+    def get_model(**kwargs):
+        return DeterministicModel(outputs=["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT && echo $PWD\n```"])
+
+    def get_sb_environment(config, instance):
+        processed.append(instance["instance_id"])
+        workdir = tmp_path / "workdirs" / instance["instance_id"]
+        workdir.mkdir(parents=True)
+        return LocalEnvironment(cwd=str(workdir))
+
+    def run_host(i: int):
+        queue = WorkQueue(tmp_path / "queue.sqlite", worker_id=f"host{i}")
+        queue.add(_instances(10))
+        journal = PredsJournal(output_dir / f"preds.host{i}.jsonl", import_legacy=False)
+        threads = [
+            threading.Thread(
+                target=process_queue, args=(queue, output_dir, config, MagicMock()), kwargs={"preds_journal": journal}
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.close()
+        journal.close(merge=True)
+
+    with (
+        patch("minisweagent.run.extra.swebench.get_model", side_effect=get_model),
+        patch("minisweagent.run.extra.swebench.get_sb_environment", side_effect=get_sb_environment),
+    ):
+        hosts = [threading.Thread(target=run_host, args=(i,)) for i in range(n_hosts)]
+        for host in hosts:
+            host.start()
+        for host in hosts:
+            host.join()
+
+    assert sorted(processed) == sorted(instance["instance_id"] for instance in _instances(10))
+    preds = read_journals(output_dir)
+    assert len(preds) == 10
+    assert preds["instance-3"]["model_patch"].strip().endswith("instance-3")
+    assert WorkQueue(tmp_path / "queue.sqlite").counts() == {"done": 10}
+
+
+def test_dead_host_instance_is_finished_by_other_host(tmp_path):
+    """The last live run waits for the lease of an instance of a dead run to expire and then processes it."""
+    config = yaml.safe_load((builtin_config_dir / "extra" / "swebench.yaml").read_text())
+    config["agent"] |= {"instance_template": "{{task}}", "cost_limit": 0}
+    dead = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.3, worker_id="dead")
+    dead.add(_instances(2))
+    assert dead.claim()["instance_id"] == "instance-0"
+    dead.close()  # no more heartbeats
+
+    alive = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.3, worker_id="alive")
+    journal = PredsJournal(tmp_path / "output" / "preds.alive.jsonl", import_legacy=False)
+    with (
+        patch(
+            "minisweagent.run.extra.swebench.get_model",
+            side_effect=lambda **kwargs: DeterministicModel(
+                outputs=["```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+            ),
+        ),
+        patch(
+            "minisweagent.run.extra.swebench.get_sb_environment",
+            side_effect=lambda config, instance: LocalEnvironment(cwd=str(tmp_path)),
+        ),
+    ):
+        process_queue(alive, tmp_path / "output", config, MagicMock(), preds_journal=journal)
+    journal.close()
+    assert alive.counts() == {"done": 2}
+    assert journal.instance_ids == {"instance-0", "instance-1"}
+    alive.close()